@@ -1,179 +1,558 @@
-#!/usr/bin/env python3
-# app.py - Flask application for JLBMaritime Captive Portal
-
-from flask import Flask, render_template, request, jsonify, redirect, url_for
-import os
-import logging
-import socket
-from network_manager import NetworkManager
-from access_point import AccessPoint
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("/var/log/captive-portal.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger("captive_portal")
-
-# Create Flask app
-app = Flask(__name__)
-
-# Initialize state
-connection_info = None
-
-@app.route('/', methods=['GET'])
-def index():
-    """
-    Main captive portal page
-    """
-    # For Apple/Google/Windows captive portal detection
-    user_agent = request.headers.get('User-Agent', '').lower()
-    
-    if 'captiveportal' in user_agent or 'captivenetworksupport' in user_agent:
-        logger.info("Captive portal detection request detected")
-        return "Success"
-    
-    # For any external hostname, redirect to captive portal
-    if request.host != "10.42.0.1:5000" and request.host != "localhost:5000":
-        logger.info(f"Redirecting request from {request.host} to captive portal")
-        return redirect("http://10.42.0.1:5000/", code=302)
-    
-    return render_template('index.html')
-
-@app.route('/scan', methods=['GET'])
-def scan_networks():
-    """
-    Scan for available Wi-Fi networks
-    """
-    networks = NetworkManager.scan_networks()
-    return jsonify(networks)
-
-@app.route('/connect', methods=['POST'])
-def connect_to_network():
-    """
-    Connect to a Wi-Fi network
-    """
-    global connection_info
-    
-    data = request.json
-    if not data or 'ssid' not in data:
-        return jsonify({"success": False, "message": "SSID is required"})
-    
-    ssid = data['ssid']
-    password = data.get('password', '')
-    
-    logger.info(f"Attempting to connect to network: {ssid}")
-    
-    success, result = NetworkManager.connect_to_network(ssid, password)
-    
-    if success:
-        # Store connection info for success page
-        connection_info = {
-            'ssid': ssid,
-            'ip_address': result.get('ip_address', 'Unknown'),
-            'signal_strength': result.get('signal_strength', 0)
-        }
-        
-        # Restore normal DNS settings
-        AccessPoint.restore_dnsmasq()
-        
-        return jsonify({"success": True, "message": "Successfully connected", "data": result})
-    else:
-        return jsonify({"success": False, "message": result.get('message', 'Failed to connect')})
-
-@app.route('/success', methods=['GET'])
-def success():
-    """
-    Success page after successful connection
-    """
-    global connection_info
-    
-    if not connection_info:
-        # If connection_info is not available, get current connection
-        active_connection = NetworkManager.get_active_connection()
-        if active_connection:
-            connection_info = {
-                'ssid': active_connection.get('ssid', 'Unknown'),
-                'ip_address': active_connection.get('ip_address', 'Unknown'),
-                'signal_strength': active_connection.get('signal_strength', 0)
-            }
-        else:
-            # Redirect to index if not connected
-            return redirect(url_for('index'))
-    
-    return render_template(
-        'success.html',
-        ssid=connection_info.get('ssid', 'Unknown'),
-        ip_address=connection_info.get('ip_address', 'Unknown'),
-        signal_strength=connection_info.get('signal_strength', 0)
-    )
-
-@app.route('/generate_204', methods=['GET'])
-@app.route('/ncsi.txt', methods=['GET'])
-@app.route('/connecttest.txt', methods=['GET'])
-@app.route('/redirect', methods=['GET'])
-def captive_portal_check():
-    """
-    Endpoints for various captive portal detection mechanisms
-    """
-    logger.info(f"Captive portal check from {request.path}")
-    return redirect(url_for('index'))
-
-@app.route('/hotspot-detect.html', methods=['GET'])
-@app.route('/library/test/success.html', methods=['GET'])
-def apple_captive_portal_check():
-    """
-    Endpoints for Apple captive portal detection
-    """
-    logger.info(f"Apple captive portal check from {request.path}")
-    return render_template('index.html')
-
-@app.errorhandler(404)
-def page_not_found(e):
-    """
-    Handle 404 errors by redirecting to index
-    """
-    logger.info(f"404 error for {request.path}, redirecting to index")
-    return redirect(url_for('index'))
-
-def get_ip_address():
-    """
-    Get the IP address of the wlan0 interface
-    """
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-        s.close()
-        return ip
-    except Exception:
-        return "10.42.0.1"  # Default fallback
-
-def initialize():
-    """
-    Initialize the application
-    """
-    # Set up access point mode if not connected to a Wi-Fi network
-    if not NetworkManager.check_connection_status():
-        logger.info("Not connected to any Wi-Fi network, setting up access point mode")
-        NetworkManager.setup_ap_mode()
-        AccessPoint.setup()
-    else:
-        logger.info("Already connected to a Wi-Fi network, keeping client mode")
-
-if __name__ == "__main__":
-    # Make the script executable
-    if not os.access(__file__, os.X_OK):
-        os.chmod(__file__, 0o755)
-    
-    # Initialize
-    initialize()
-    
-    # Run the Flask app
-    ip = get_ip_address()
-    logger.info(f"Starting Flask application on {ip}:5000")
-    app.run(host=ip, port=5000, debug=False)
+#!/usr/bin/env python3
+# app.py - Flask application for JLBMaritime Captive Portal
+
+from flask import Flask, Response, g, render_template, request, jsonify, redirect, send_from_directory, url_for
+from werkzeug.serving import make_server
+import http.client
+import os
+import logging
+import socket
+import threading
+import time
+import config
+from network_manager import NetworkManager
+from access_point import AccessPoint
+from dhcp_leases import LeaseTracker
+from captive_state import ClientStates, PROBE_PATHS, PORTAL_SHOWN, CONNECTED
+from scan_history import ScanHistory
+from dns_responder import DNSResponder
+from sd_notify import SystemdNotifier
+from tls_abort import TLSAbortListener
+from profiling import Profiler, PROFILE_DIR
+from radio_queue import RadioClient
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("/var/log/captive-portal.log"),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger("captive_portal")
+
+# Keep the watchdog self-checks out of the request log
+logging.getLogger("werkzeug").addFilter(lambda record: "GET /health " not in record.getMessage())
+
+# Create Flask app
+app = Flask(__name__)
+
+# Initialize state
+connection_info = None
+
+# Absolute portal address that captive portal probes are redirected to
+PORTAL_URL = "http://10.42.0.1:5000/"
+
+# Clients holding a DHCP lease on the access point
+lease_tracker = LeaseTracker()
+
+# Captive portal state of each client
+client_states = ClientStates(lease_tracker)
+
+# Versions of the scan results, for incremental /scan responses
+scan_history = ScanHistory()
+
+# On-demand profiler for request handling, used when profiling is enabled
+profiler = Profiler("portal")
+
+# Connection monitor hosted in this process in single-process mode
+monitor = None
+
+# Built-in DNS responder pointing clients at the portal, if enabled
+dns_responder = DNSResponder(port=config.DNS_RESPONDER_PORT) if config.DNS_RESPONDER else None
+
+# Resets HTTPS connections redirected to the portal, with the "abort" HTTPS policy
+https_listener = TLSAbortListener(port=config.HTTPS_ABORT_PORT) if config.HTTPS_POLICY == "abort" else None
+
+def get_client():
+    """
+    Get the DHCP lease of the client making the current request
+    
+    Returns:
+        Lease: The client's lease, or None if unknown
+    """
+    return lease_tracker.get(request.remote_addr)
+
+def describe_client():
+    """
+    Describe the client making the current request for log messages
+    
+    Returns:
+        str: IP address, plus hostname and MAC address when known
+    """
+    lease = get_client()
+    if lease is None:
+        return request.remote_addr
+    return f"{request.remote_addr} ({lease.hostname or 'unknown'}, {lease.mac})"
+
+def show_portal():
+    """
+    Render the portal page and record that the client has seen it
+    """
+    client_states.set(request.remote_addr, PORTAL_SHOWN)
+    return render_template('index.html')
+
+def answer_probe(probe):
+    """
+    Answer a captive portal probe as the client's OS expects in its current state
+    
+    Args:
+        probe (str): Probe kind from PROBE_PATHS
+    """
+    state = client_states.get(request.remote_addr)
+    response = ClientStates.response_for(probe, state)
+    logger.info(f"Captive portal check ({probe}, {state}) from {request.path} by {describe_client()}: {response[0]}")
+    
+    if response[0] == "portal":
+        return show_portal()
+    if response[0] == "redirect":
+        return redirect(PORTAL_URL, code=302)
+    if response[0] == "success":
+        return redirect(PORTAL_URL + "success", code=302)
+    
+    _, status, body, mimetype = response
+    return Response(body, status=status, mimetype=mimetype)
+
+def is_admin_request():
+    """
+    Check whether the current request comes from the device itself
+    
+    Admin endpoints are only reachable locally, e.g. over an SSH tunnel.
+    
+    Returns:
+        bool: True for loopback clients, False otherwise
+    """
+    return request.remote_addr in ("127.0.0.1", "::1")
+
+@app.before_request
+def start_request_timing():
+    """
+    Start timing the request and profile it if a cProfile capture is running
+    """
+    if not config.PROFILING:
+        return
+    
+    g.request_started = time.perf_counter()
+    NetworkManager.reset_command_timing()
+    
+    # The profiling endpoints start and stop captures, so they are never profiled
+    # themselves, and the health check must stay quick for the watchdog
+    if not request.path.startswith("/admin/profile") and request.path != "/health":
+        g.profiled = profiler.begin()
+
+@app.after_request
+def add_server_timing(response):
+    """
+    Report how the request's time split between commands and Python code
+    """
+    if config.PROFILING and "request_started" in g:
+        total = (time.perf_counter() - g.request_started) * 1000
+        command_seconds, command_count = NetworkManager.get_command_timing()
+        commands = command_seconds * 1000
+        response.headers["Server-Timing"] = (
+            f'subprocess;dur={commands:.1f};desc="{command_count} commands", '
+            f"python;dur={max(total - commands, 0):.1f}, total;dur={total:.1f}"
+        )
+    return response
+
+@app.teardown_request
+def finish_request_profile(exc):
+    if g.pop("profiled", False):
+        profiler.end()
+
+@app.route('/', methods=['GET'])
+def index():
+    """
+    Main captive portal page
+    """
+    # For Apple/Google/Windows captive portal detection
+    user_agent = request.headers.get('User-Agent', '').lower()
+    
+    if 'captiveportal' in user_agent or 'captivenetworksupport' in user_agent:
+        return answer_probe("apple")
+    
+    # For any external hostname, redirect to captive portal
+    if request.host != "10.42.0.1:5000" and request.host != "localhost:5000":
+        logger.info(f"Redirecting request from {request.host} to captive portal")
+        return redirect(PORTAL_URL, code=302)
+    
+    return show_portal()
+
+@app.route('/scan', methods=['GET'])
+def scan_networks():
+    """
+    Scan for available Wi-Fi networks
+    
+    Without parameters the full list of networks is returned. A client that
+    passes the version it already has, as ?since=<version> or through
+    If-None-Match, gets 304 if nothing changed, or only the networks added,
+    changed and removed since that version. If the version is too old, or
+    from before the portal restarted, the full list is sent with "full": true.
+    
+    Bodies are serialized once per scan version and reused for every client.
+    """
+    version = scan_history.update(NetworkManager.scan())
+    
+    since = scan_history.parse_tag(request.args.get('since'))
+    if since is None:
+        since = scan_history.parse_etag(request.headers.get('If-None-Match'))
+    
+    if since == version:
+        response = Response(status=304)
+    else:
+        if since is None:
+            body = scan_history.list_body()
+        else:
+            body = scan_history.delta_body(since) or scan_history.full_body()
+        # Another scan may have finished in between
+        version, body = body
+        response = Response(body, mimetype='application/json')
+    
+    response.headers['ETag'] = scan_history.etag(version)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/connect', methods=['POST'])
+def connect_to_network():
+    """
+    Connect to a Wi-Fi network
+    """
+    global connection_info
+    
+    data = request.json
+    if not data or 'ssid' not in data:
+        return jsonify({"success": False, "message": "SSID is required"})
+    
+    ssid = data['ssid']
+    password = data.get('password', '')
+    
+    logger.info(f"Attempting to connect to network: {ssid}")
+    
+    # The monitor's radio queue runs the connect, so the monitor cannot
+    # switch networks or to AP mode while it is in progress
+    if monitor:
+        success, result = monitor.radio_queue.connect(ssid, password or None).result()
+    else:
+        outcome = RadioClient.connect(ssid, password or None)
+        if outcome is None:
+            logger.warning("Connection monitor not running, connecting directly")
+            outcome = NetworkManager.connect_to_network(ssid, password)
+        success, result = outcome
+    
+    if success:
+        # Store connection info for success page
+        connection_info = {
+            'ssid': ssid,
+            'ip_address': result.get('ip_address', 'Unknown'),
+            'signal_strength': result.get('signal_strength', 0)
+        }
+        
+        # Let the client's OS close its captive portal sheet on the next probe
+        client_states.set(request.remote_addr, CONNECTED)
+        
+        # A hosted monitor picks up the new link straight away
+        if monitor:
+            monitor.request_link_check()
+        
+        # Restore normal DNS settings
+        if dns_responder:
+            dns_responder.disable()
+        else:
+            AccessPoint.restore_dnsmasq()
+        
+        return jsonify({"success": True, "message": "Successfully connected", "data": result})
+    else:
+        return jsonify({"success": False, "message": result.get('message', 'Failed to connect')})
+
+@app.route('/success', methods=['GET'])
+def success():
+    """
+    Success page after successful connection
+    """
+    global connection_info
+    
+    if not connection_info:
+        # If connection_info is not available, get current connection
+        active_connection = NetworkManager.get_active_connection()
+        if active_connection:
+            connection_info = {
+                'ssid': active_connection.get('ssid', 'Unknown'),
+                'ip_address': active_connection.get('ip_address', 'Unknown'),
+                'signal_strength': active_connection.get('signal_strength', 0)
+            }
+        else:
+            # Redirect to index if not connected
+            return redirect(url_for('index'))
+    
+    return render_template(
+        'success.html',
+        ssid=connection_info.get('ssid', 'Unknown'),
+        ip_address=connection_info.get('ip_address', 'Unknown'),
+        signal_strength=connection_info.get('signal_strength', 0)
+    )
+
+@app.route('/generate_204', methods=['GET'])
+@app.route('/gen_204', methods=['GET'])
+@app.route('/ncsi.txt', methods=['GET'])
+@app.route('/connecttest.txt', methods=['GET'])
+@app.route('/redirect', methods=['GET'])
+def captive_portal_check():
+    """
+    Endpoints for various captive portal detection mechanisms
+    """
+    return answer_probe(PROBE_PATHS[request.path])
+
+@app.route('/hotspot-detect.html', methods=['GET'])
+@app.route('/library/test/success.html', methods=['GET'])
+def apple_captive_portal_check():
+    """
+    Endpoints for Apple captive portal detection
+    """
+    return answer_probe("apple")
+
+@app.route('/admin/clients', methods=['GET'])
+def admin_clients():
+    """
+    List the clients connected to the access point
+    """
+    if not is_admin_request():
+        return redirect(url_for('index'))
+    
+    clients = []
+    for lease in lease_tracker.clients():
+        client = lease._asdict()
+        client["state"] = client_states.get(lease.ip)
+        clients.append(client)
+    
+    return jsonify({
+        "clients": clients,
+        "stats": lease_tracker.stats(),
+        "states": client_states.stats()
+    })
+
+@app.route('/admin/network-manager', methods=['GET'])
+def admin_network_manager():
+    """
+    Show whether NetworkManager is reachable, as seen by the portal
+    """
+    if not is_admin_request():
+        return redirect(url_for('index'))
+    
+    return jsonify(NetworkManager.health.status())
+
+@app.route('/admin/profile', methods=['GET'])
+def admin_profile_status():
+    """
+    Show the profiling state of both services and the available dumps
+    """
+    if not config.PROFILING or not is_admin_request():
+        return redirect(url_for('index'))
+    
+    monitor_request = None
+    try:
+        with open(Profiler.request_path("monitor")) as f:
+            monitor_request = f.read().strip() or None
+    except OSError:
+        pass
+    
+    return jsonify({
+        "portal": profiler.status(),
+        "monitor": {"requested": monitor_request},
+        "dumps": Profiler.list_dumps()
+    })
+
+@app.route('/admin/profile/start', methods=['POST'])
+def admin_profile_start():
+    """
+    Start profiling the portal or the connection monitor
+    
+    Parameters: target ("portal" or "monitor"), mode ("cprofile" or "sampling")
+    """
+    if not config.PROFILING or not is_admin_request():
+        return redirect(url_for('index'))
+    
+    target = request.values.get('target', 'portal')
+    mode = request.values.get('mode', 'sampling')
+    
+    if target == "monitor":
+        success = Profiler.request_capture("monitor", mode)
+    else:
+        success = profiler.start(mode)
+    
+    return jsonify({"success": success, "target": target, "mode": mode})
+
+@app.route('/admin/profile/stop', methods=['POST'])
+def admin_profile_stop():
+    """
+    Stop profiling and write the dump
+    
+    The monitor notices the request within a few seconds; its dump then
+    appears in the list at /admin/profile.
+    """
+    if not config.PROFILING or not is_admin_request():
+        return redirect(url_for('index'))
+    
+    target = request.values.get('target', 'portal')
+    
+    if target == "monitor":
+        return jsonify({"success": Profiler.request_capture("monitor", None), "target": target})
+    
+    path = profiler.stop()
+    return jsonify({"success": path is not None, "target": target, "dump": os.path.basename(path) if path else None})
+
+@app.route('/admin/profile/dumps/<name>', methods=['GET'])
+def admin_profile_dump(name):
+    """
+    Download a profile dump
+    """
+    if not config.PROFILING or not is_admin_request():
+        return redirect(url_for('index'))
+    
+    return send_from_directory(PROFILE_DIR, name, as_attachment=True)
+
+@app.route('/health', methods=['GET'])
+def health():
+    """
+    Liveness check used by the systemd watchdog
+    """
+    return "OK", 200, {"Content-Type": "text/plain"}
+
+@app.errorhandler(404)
+def page_not_found(e):
+    """
+    Handle 404 errors by redirecting to index
+    """
+    logger.info(f"404 error for {request.path}, redirecting to index")
+    return redirect(url_for('index'))
+
+def get_ip_address():
+    """
+    Get the IP address of the wlan0 interface
+    """
+    # In concurrent mode the default route points at the station interface,
+    # but the portal must be reachable on the AP address
+    if config.CONCURRENT_MODE:
+        return "10.42.0.1"
+    
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("8.8.8.8", 80))
+        ip = s.getsockname()[0]
+        s.close()
+        return ip
+    except Exception:
+        return "10.42.0.1"  # Default fallback
+
+def watchdog_loop(host, port, interval):
+    """
+    Send systemd watchdog keepalives while the portal answers requests
+    
+    Each keepalive follows a real request to the portal, so a server that
+    has stopped accepting or answering connections is restarted.
+    
+    Args:
+        host (str): Address the portal listens on
+        port (int): Port the portal listens on
+        interval (float): Seconds between checks
+    """
+    while True:
+        healthy = False
+        conn = http.client.HTTPConnection(host, port, timeout=interval)
+        try:
+            conn.request("GET", "/health")
+            healthy = conn.getresponse().status == 200
+        except (OSError, http.client.HTTPException) as e:
+            logger.error(f"Portal self-check failed: {e}")
+        finally:
+            conn.close()
+        
+        # In single-process mode the hosted monitor must be healthy too
+        if healthy and monitor:
+            stall = monitor.find_stall()
+            if stall:
+                logger.error(f"Connection monitor stalled: {stall}")
+                healthy = False
+        
+        if healthy:
+            SystemdNotifier.watchdog()
+        else:
+            logger.error("Withholding watchdog keepalive")
+        
+        time.sleep(interval)
+
+def initialize():
+    """
+    Initialize the application
+    """
+    if https_listener:
+        https_listener.start()
+    
+    # The connection monitor brings the access point up through its radio
+    # queue, so it cannot race the monitor's own connects and AP fallback.
+    # Only the portal's firewall and DNS setup for the AP is done here.
+    
+    # In concurrent mode the portal AP runs whether or not we are connected,
+    # if the hardware can run it alongside the station
+    concurrent = config.CONCURRENT_MODE and NetworkManager.select_interface_roles()
+    
+    # Only known once the roles are chosen: in concurrent mode the AP gets
+    # its own interface, and dnsmasq names its lease file after it
+    ap_interface = NetworkManager.get_ap_interface()
+    lease_tracker.interface = ap_interface
+    
+    if concurrent:
+        logger.info("Concurrent mode enabled, preparing access point alongside client mode")
+        AccessPoint.setup(ap_interface)
+        if dns_responder:
+            dns_responder.enable(ap_interface)
+        return
+    
+    # Prepare access point mode if not connected to a Wi-Fi network
+    if not NetworkManager.check_connection_status():
+        logger.info("Not connected to any Wi-Fi network, preparing access point mode")
+        AccessPoint.setup(ap_interface)
+        if dns_responder:
+            dns_responder.enable(ap_interface)
+    else:
+        logger.info("Already connected to a Wi-Fi network, keeping client mode")
+
+if __name__ == "__main__":
+    # Make the script executable
+    if not os.access(__file__, os.X_OK):
+        os.chmod(__file__, 0o755)
+    
+    # Initialize
+    initialize()
+    
+    # Host the connection monitor in this process if configured
+    if config.SINGLE_PROCESS:
+        logger.info("Single-process mode: running the connection monitor inside the portal")
+        # Imported here so the portal does not carry the monitor in two-process mode
+        from connection_monitor import ConnectionMonitor
+        monitor = ConnectionMonitor()
+        monitor.start_in_thread()
+    
+    # Run the Flask app
+    ip = get_ip_address()
+    logger.info(f"Starting Flask application on {ip}:5000")
+    server = make_server(ip, 5000, app, threaded=True)
+    
+    # Admin endpoints only answer loopback clients, so serve those as well
+    if ip != "127.0.0.1":
+        try:
+            loopback_server = make_server("127.0.0.1", 5000, app, threaded=True)
+            threading.Thread(target=loopback_server.serve_forever, name="loopback-server", daemon=True).start()
+        except OSError as e:
+            logger.warning(f"Could not listen on 127.0.0.1:5000, admin endpoints are unavailable: {e}")
+    
+    # The socket is bound, so the portal is now reachable
+    watchdog_interval = SystemdNotifier.watchdog_interval()
+    if watchdog_interval:
+        threading.Thread(target=watchdog_loop, args=(ip, 5000, watchdog_interval), daemon=True).start()
+    SystemdNotifier.ready(f"serving on {ip}:5000")
+    
+    try:
+        server.serve_forever()
+    finally:
+        SystemdNotifier.stopping()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# captive_state.py - Per-client captive portal state for JLBMaritime Captive Portal
+#
+# Each client on the access point moves through three states:
+#
+#   new           -> joined the AP, portal not shown yet
+#   portal_shown  -> the portal page has been served to it
+#   connected     -> it completed setup through the portal
+#
+# Operating systems decide whether to open or close their captive portal
+# sheet from the answer to a probe request. The table below gives the exact
+# answer each OS expects in each state, so a sheet opens on the first probe
+# and closes on the first probe after setup, without extra redirects.
+
+import logging
+import threading
+import time
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("/var/log/captive-portal.log"),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger("captive_state")
+
+# Client states
+NEW = "new"
+PORTAL_SHOWN = "portal_shown"
+CONNECTED = "connected"
+
+# Forget clients that have not been seen for this many seconds
+CLIENT_STATE_TTL = 3600
+
+# Probe path -> kind of client sending it
+PROBE_PATHS = {
+    "/hotspot-detect.html": "apple",
+    "/library/test/success.html": "apple",
+    "/generate_204": "android",
+    "/gen_204": "android",
+    "/connecttest.txt": "windows",
+    "/ncsi.txt": "windows_ncsi",
+    "/redirect": "windows_redirect",
+}
+
+# Exact page Apple's captive network assistant treats as "online"
+APPLE_SUCCESS = "<HTML><HEAD><TITLE>Success</TITLE></HEAD><BODY>Success</BODY></HTML>"
+
+# (probe kind, state) -> response. Responses are:
+#   ("portal",)                       serve the portal page in place
+#   ("redirect",)                     302 straight to the absolute portal URL
+#   ("success",)                      302 straight to the success page
+#   ("body", status, body, mimetype)  the literal answer the OS expects
+PROBE_RESPONSES = {
+    # Apple shows whatever the probe returns in its sheet, so serving the
+    # portal directly saves a redirect; the sheet closes on "Success"
+    "apple": {
+        NEW: ("portal",),
+        PORTAL_SHOWN: ("portal",),
+        CONNECTED: ("body", 200, APPLE_SUCCESS, "text/html"),
+    },
+    # Android opens the sign-in page at the redirect target, and treats 204 as online
+    "android": {
+        NEW: ("redirect",),
+        PORTAL_SHOWN: ("redirect",),
+        CONNECTED: ("body", 204, "", "text/plain"),
+    },
+    # Windows NCSI opens its browser at the redirect target
+    "windows": {
+        NEW: ("redirect",),
+        PORTAL_SHOWN: ("redirect",),
+        CONNECTED: ("body", 200, "Microsoft Connect Test", "text/plain"),
+    },
+    "windows_ncsi": {
+        NEW: ("redirect",),
+        PORTAL_SHOWN: ("redirect",),
+        CONNECTED: ("body", 200, "Microsoft NCSI", "text/plain"),
+    },
+    # The page Windows opens in the browser once it has detected a portal
+    "windows_redirect": {
+        NEW: ("redirect",),
+        PORTAL_SHOWN: ("redirect",),
+        CONNECTED: ("success",),
+    },
+}
+
+class ClientStates:
+    """
+    Tracks the captive portal state of each client, keyed by IP address
+    
+    A client's state is reset when its IP address is leased to a different
+    MAC address, so a new device never inherits another device's state.
+    """
+    
+    def __init__(self, lease_tracker=None):
+        """
+        Args:
+            lease_tracker (LeaseTracker, optional): DHCP leases used to tell devices apart
+        """
+        self.lease_tracker = lease_tracker
+        self.lock = threading.Lock()
+        
+        # IP -> {"state", "mac", "seen"}
+        self.clients = {}
+    
+    def lookup_mac(self, ip):
+        if self.lease_tracker is None:
+            return None
+        lease = self.lease_tracker.get(ip)
+        return lease.mac if lease else None
+    
+    def get(self, ip):
+        """
+        Get the state of a client, registering it as new if unknown
+        
+        Args:
+            ip (str): Client IP address
+        
+        Returns:
+            str: NEW, PORTAL_SHOWN or CONNECTED
+        """
+        mac = self.lookup_mac(ip)
+        now = time.monotonic()
+        
+        with self.lock:
+            client = self.clients.get(ip)
+            if client is None or (mac and client["mac"] and mac != client["mac"]):
+                if client is not None:
+                    logger.info(f"{ip} is now leased to {mac}, resetting its portal state")
+                client = {"state": NEW, "mac": mac, "seen": now}
+                self.clients[ip] = client
+                self.prune(now)
+            else:
+                client["seen"] = now
+                client["mac"] = client["mac"] or mac
+            return client["state"]
+    
+    def set(self, ip, state):
+        """
+        Move a client to a new state
+        
+        Args:
+            ip (str): Client IP address
+            state (str): NEW, PORTAL_SHOWN or CONNECTED
+        """
+        current = self.get(ip)
+        if current == state:
+            return
+        
+        with self.lock:
+            self.clients[ip]["state"] = state
+        logger.info(f"Client {ip}: {current} -> {state}")
+    
+    def prune(self, now):
+        """
+        Drop clients not seen for CLIENT_STATE_TTL; called with the lock held
+        """
+        expired = [ip for ip, client in self.clients.items() if now - client["seen"] > CLIENT_STATE_TTL]
+        for ip in expired:
+            del self.clients[ip]
+    
+    def stats(self):
+        """
+        Count the clients in each state
+        
+        Returns:
+            dict: State -> number of clients
+        """
+        counts = {NEW: 0, PORTAL_SHOWN: 0, CONNECTED: 0}
+        with self.lock:
+            for client in self.clients.values():
+                counts[client["state"]] += 1
+        return counts
+    
+    @staticmethod
+    def response_for(probe, state):
+        """
+        Look up the answer to a captive portal probe
+        
+        Args:
+            probe (str): Probe kind from PROBE_PATHS
+            state (str): Client state
+        
+        Returns:
+            tuple: Response from PROBE_RESPONSES
+        """
+        return PROBE_RESPONSES.get(probe, PROBE_RESPONSES["android"])[state]
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# config.py - Runtime settings for the JLBMaritime Captive Portal
+#
+# Settings are read from the environment. The systemd units load
+# /etc/default/captive-portal, so options can be changed there without
+# editing the code.
+
+import os
+
+
+def _env_bool(name, default):
+    """
+    Read a boolean setting from the environment
+    
+    Args:
+        name (str): Environment variable name
+        default (bool): Value used when the variable is not set
+    
+    Returns:
+        bool: The setting value
+    """
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "yes", "true", "on")
+
+
+def _env_str(name, default):
+    """
+    Read a string setting from the environment
+    
+    Args:
+        name (str): Environment variable name
+        default (str): Value used when the variable is not set
+    
+    Returns:
+        str: The setting value
+    """
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip()
+
+
+def _env_int(name, default):
+    """
+    Read an integer setting from the environment
+    
+    Args:
+        name (str): Environment variable name
+        default (int): Value used when the variable is not set or invalid
+    
+    Returns:
+        int: The setting value
+    """
+    value = os.environ.get(name)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+# Run the JLBMaritime AP and the station connection at the same time
+CONCURRENT_MODE = _env_bool("CAPTIVE_PORTAL_CONCURRENT", False)
+
+# Name of the virtual AP interface created on single-radio hardware
+AP_VIRTUAL_INTERFACE = _env_str("CAPTIVE_PORTAL_AP_INTERFACE", "ap0")
+
+# Use the in-memory fake NetworkManager backend instead of the real system
+FAKE_BACKEND = _env_bool("CAPTIVE_PORTAL_FAKE_BACKEND", False)
+
+# Answer portal DNS with the built-in responder instead of reconfiguring dnsmasq
+DNS_RESPONDER = _env_bool("CAPTIVE_PORTAL_DNS_RESPONDER", False)
+
+# Port the built-in DNS responder listens on; AP DNS traffic is redirected to it
+DNS_RESPONDER_PORT = _env_int("CAPTIVE_PORTAL_DNS_PORT", 5300)
+
+# How HTTPS connections from portal clients are handled:
+#   reject   - refused with a TCP reset by the firewall
+#   abort    - redirected to a listener that resets them once accepted
+#   redirect - redirected to the HTTP portal (the original behaviour)
+HTTPS_POLICY = _env_str("CAPTIVE_PORTAL_HTTPS_POLICY", "reject").lower()
+
+# Port the HTTPS abort listener uses with the "abort" policy
+HTTPS_ABORT_PORT = _env_int("CAPTIVE_PORTAL_HTTPS_ABORT_PORT", 5443)
+
+# Enable the admin profiling endpoints and the Server-Timing response header
+PROFILING = _env_bool("CAPTIVE_PORTAL_PROFILING", False)
+
+# Run the connection monitor inside the portal process instead of its own service
+SINGLE_PROCESS = _env_bool("CAPTIVE_PORTAL_SINGLE_PROCESS", False)
+
+# Switch to a clearly stronger saved network or access point before the current link fails
+ROAMING = _env_bool("CAPTIVE_PORTAL_ROAMING", False)
+
+# Unix socket the portal sends connect requests to the connection monitor on
+RADIO_SOCKET = _env_str("CAPTIVE_PORTAL_RADIO_SOCKET", "/run/captive-portal/radio.sock")
+
+# Group allowed to use the radio socket; the portal service runs with it
+RADIO_GROUP = _env_str("CAPTIVE_PORTAL_RADIO_GROUP", "captive-portal")
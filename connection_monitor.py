@@ -1,150 +1,979 @@
-#!/usr/bin/env python3
-# connection_monitor.py - Monitor connection status and switch between AP and client mode
-
-import time
-import logging
-import os
-import sys
-from network_manager import NetworkManager
-from access_point import AccessPoint
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("/var/log/captive-portal.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger("connection_monitor")
-
-class ConnectionMonitor:
-    """
-    Monitors connection status and handles switching between AP and client mode
-    """
-    
-    @staticmethod
-    def check_internet_connection():
-        """
-        Check if there is an internet connection
-        
-        Returns:
-            bool: True if internet is available, False otherwise
-        """
-        try:
-            # Ping Google's DNS server
-            response = os.system("ping -c 1 -W 2 8.8.8.8 > /dev/null 2>&1")
-            return response == 0
-        except Exception:
-            return False
-    
-    @staticmethod
-    def run():
-        """
-        Main monitoring loop
-        """
-        logger.info("Starting connection monitor")
-        
-        # Wait for system to fully start up
-        time.sleep(30)
-        
-        while True:
-            try:
-                # Check if we're connected to a Wi-Fi network (not our AP)
-                is_connected = NetworkManager.check_connection_status()
-                
-                if is_connected:
-                    logger.info("Connected to a Wi-Fi network")
-                    
-                    # Check internet connectivity
-                    if ConnectionMonitor.check_internet_connection():
-                        logger.info("Internet connection is available")
-                    else:
-                        logger.warning("Connected to Wi-Fi but no internet access")
-                    
-                    # We're connected, so just wait and check again later
-                    time.sleep(60)
-                else:
-                    logger.info("Not connected to a Wi-Fi network")
-                    
-                    # Check if there are any saved connections we can connect to
-                    saved_connections = ConnectionMonitor.get_saved_connections()
-                    
-                    if saved_connections:
-                        logger.info(f"Found {len(saved_connections)} saved connections. Attempting to connect...")
-                        
-                        # Try to connect to each saved connection
-                        connected = False
-                        for connection in saved_connections:
-                            logger.info(f"Trying to connect to {connection}")
-                            
-                            try:
-                                # Attempt to activate the connection
-                                os.system(f"nmcli connection up '{connection}' > /dev/null 2>&1")
-                                
-                                # Wait for connection to establish
-                                time.sleep(10)
-                                
-                                # Check if we're connected
-                                if NetworkManager.check_connection_status():
-                                    logger.info(f"Successfully connected to {connection}")
-                                    connected = True
-                                    break
-                            except Exception as e:
-                                logger.error(f"Error connecting to {connection}: {e}")
-                        
-                        if connected:
-                            # If we connected successfully, continue monitoring
-                            continue
-                        else:
-                            logger.warning("Failed to connect to any saved network")
-                    
-                    # If we get here, we couldn't connect to any saved network
-                    # So we need to start the AP mode
-                    logger.info("Starting Access Point mode")
-                    
-                    # Setup AP mode
-                    NetworkManager.setup_ap_mode()
-                    
-                    # Wait for a while before checking again
-                    time.sleep(300)  # 5 minutes
-            
-            except Exception as e:
-                logger.error(f"Error in connection monitor: {e}")
-                time.sleep(60)
-    
-    @staticmethod
-    def get_saved_connections():
-        """
-        Get a list of saved Wi-Fi connections (excluding our AP)
-        
-        Returns:
-            list: List of connection names
-        """
-        try:
-            import subprocess
-            
-            # Get all saved connections
-            cmd = ["nmcli", "-t", "-f", "NAME,TYPE", "connection", "show"]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            connections = []
-            for line in result.stdout.splitlines():
-                parts = line.split(':')
-                if len(parts) >= 2 and parts[1] == "802-11-wireless" and parts[0] != "JLBMaritime":
-                    connections.append(parts[0])
-            
-            return connections
-            
-        except Exception as e:
-            logger.error(f"Error getting saved connections: {e}")
-            return []
-
-if __name__ == "__main__":
-    # Make the script executable
-    if not os.access(__file__, os.X_OK):
-        os.chmod(__file__, 0o755)
-    
-    # Run the connection monitor
-    ConnectionMonitor.run()
+#!/usr/bin/env python3
+# connection_monitor.py - Monitor connection status and switch between AP and client mode
+
+import asyncio
+import signal
+import subprocess
+import time
+import logging
+import os
+import sys
+import threading
+import config
+from failure_cache import FailureCache
+from network_manager import ACTIVE_CONNECTIONS_CMD, NetworkManager, split_terse
+from nm_health import NetworkManagerHealth, NetworkManagerUnavailable
+from sd_notify import SystemdNotifier
+from profiling import Profiler
+from radio_queue import RadioQueue, RadioServer, OperationSuperseded, USER_GRACE
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("/var/log/captive-portal.log"),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger("connection_monitor")
+
+# Upper bound on how long startup waits for NetworkManager to become ready
+READINESS_TIMEOUT = 30
+# Delay between readiness checks during startup
+READINESS_POLL_INTERVAL = 1
+
+# How often the link state is checked
+LINK_CHECK_INTERVAL = 5
+# How often internet reachability is probed while connected
+PROBE_INTERVAL = 60
+# How often the background scan runs while connected / disconnected
+SCAN_INTERVAL_CONNECTED = 120
+SCAN_INTERVAL_DISCONNECTED = 30
+# How long to stay in AP mode before retrying saved networks
+AP_RETRY_INTERVAL = 300
+# How soon to retry when NetworkManager could not tell which networks are
+# saved, or the AP could not be started
+RETRY_INTERVAL = 10
+
+# Roaming (config.ROAMING): below this signal (%) the monitor looks for a
+# better access point, scanning every ROAM_SCAN_INTERVAL seconds instead of
+# SCAN_INTERVAL_CONNECTED
+ROAM_TRIGGER_SIGNAL = 45
+ROAM_SCAN_INTERVAL = 20
+# A roam target must be at least this many points stronger than the current link
+ROAM_HYSTERESIS = 20
+# No roaming until a link has been up this many seconds, so it cannot flap
+ROAM_DWELL = 120
+
+# Timeout for quick nmcli queries
+COMMAND_TIMEOUT = 15
+# Time NetworkManager is given to activate a saved connection
+CONNECT_TIMEOUT = 30
+
+# Watchdog keepalives stop when the link check has made no progress for
+# this long, so systemd restarts the monitor
+WATCHDOG_STALL_LIMIT = 60
+# Same for a radio operation; a user's connect may include nmcli's own 90 s
+# activation wait, so they are given longer
+RADIO_STALL_LIMIT = 180
+
+# Exit status of the standalone monitor when the portal hosts it instead;
+# the unit treats it as success and does not restart
+EXIT_HOSTED_BY_PORTAL = 78
+
+class ConnectionMonitor:
+    """
+    Monitors connection status and handles switching between AP and client mode
+    
+    The monitor runs as a set of independent asyncio tasks: link-state
+    watching, reachability probing, background scanning and reconnection.
+    A slow step in one task no longer delays the others.
+    """
+    
+    def __init__(self):
+        # Last known link state, None until the first check completes
+        self.connected = None
+        # Name of the active client connection, if any
+        self.active_connection = None
+        # Whether the last reachability probe succeeded
+        self.internet = None
+        # SSID -> strongest signal seen in the latest background scan
+        self.scan_results = {}
+        # (ssid, bssid, signal, in use) of every access point in that scan
+        self.access_points = []
+        # Backoff records for saved networks that failed to connect
+        self.failure_cache = FailureCache()
+        # Seconds until the first backoff ends, when the last pass skipped
+        # every saved network; None otherwise
+        self.backoff_wait = None
+        
+        # Set while connected / while disconnected; created in run_async()
+        self.connected_event = None
+        self.disconnected_event = None
+        
+        self.started = None
+        self.first_decision = True
+        self.tasks = []
+        
+        # Profiles the monitor when the portal's admin endpoints ask for it
+        self.profiler = Profiler("monitor") if config.PROFILING else None
+        
+        # Progress marker checked before each watchdog keepalive
+        self.last_link_check = None
+        
+        # Runs connects and AP changes one at a time, for the monitor and
+        # for the portal, which reaches it through the radio server
+        self.radio_queue = RadioQueue()
+        self.radio_server = None
+        # Queued or running restore of the concurrent AP, if any, and the
+        # number of restores finished, to tell whether a link check is stale
+        self.ap_restore = None
+        self.ap_restores = 0
+        
+        # Set to run a link check straight away; created in run_async()
+        self.link_check_event = None
+        
+        # Link history: when the link came up / went down and total time down
+        self.link_up_since = None
+        self.link_down_since = None
+        self.link_downtime = 0.0
+        self.link_signal = None
+        self.roaming = False
+        
+        # Whether the hardware can run the AP alongside the station in
+        # concurrent mode, None until checked
+        self.concurrent_ap = None
+        
+        # Event loop and thread when hosted inside the portal process
+        self.hosted = False
+        self.loop = None
+        self.thread = None
+    
+    @staticmethod
+    async def check_readiness():
+        """
+        Check whether NetworkManager has started up and the wireless device
+        has finished any autoconnect attempt
+        
+        The probes bypass the circuit breaker: failures while NetworkManager
+        is still starting must not open it and hold off the later probes.
+        
+        Returns:
+            bool: True if the monitor can make its first decision, False otherwise
+        """
+        try:
+            # NetworkManager must be running and report its startup as complete
+            cmd = ["nmcli", "-t", "-f", "RUNNING,STARTUP", "general"]
+            result = await NetworkManager.run_async(cmd, timeout=5, breaker=False)
+            parts = result.stdout.strip().split(':')
+            if result.returncode != 0 or len(parts) < 2 or parts[0] != "running" or parts[1] != "started":
+                return False
+            
+            # Close a circuit opened by commands run before NetworkManager was up
+            NetworkManager.health.record(True)
+            
+            # A wireless device must exist and must not be mid-activation
+            cmd = ["nmcli", "-t", "-f", "DEVICE,TYPE,STATE", "device"]
+            result = await NetworkManager.run_async(cmd, timeout=5, breaker=False)
+            if result.returncode != 0:
+                return False
+            
+            wifi_ready = False
+            for line in result.stdout.splitlines():
+                parts = line.split(':')
+                if len(parts) < 3 or parts[1] != "wifi":
+                    continue
+                state = parts[2]
+                if state.startswith("connecting") or state.startswith("deactivating"):
+                    return False
+                if state not in ("unavailable", "unmanaged"):
+                    wifi_ready = True
+            
+            return wifi_ready
+        
+        except Exception:
+            return False
+    
+    @staticmethod
+    async def wait_for_readiness(timeout=READINESS_TIMEOUT):
+        """
+        Wait until NetworkManager is ready or the timeout expires
+        
+        Args:
+            timeout (float): Maximum number of seconds to wait
+        
+        Returns:
+            bool: True if NetworkManager became ready, False if the deadline passed
+        """
+        deadline = time.monotonic() + timeout
+        
+        while True:
+            if await ConnectionMonitor.check_readiness():
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(READINESS_POLL_INTERVAL)
+    
+    @staticmethod
+    def log_boot_metric(started, decision):
+        """
+        Log how long it took to make the first connect/AP decision
+        
+        Args:
+            started (float): Monotonic time at which the monitor started
+            decision (str): Description of the first decision taken
+        """
+        elapsed = time.monotonic() - started
+        
+        uptime = None
+        try:
+            with open("/proc/uptime") as f:
+                uptime = float(f.read().split()[0])
+        except (OSError, ValueError, IndexError):
+            pass
+        
+        if uptime is not None:
+            logger.info(f"Boot metric: first decision ({decision}) after {elapsed:.1f}s, system uptime {uptime:.1f}s")
+        else:
+            logger.info(f"Boot metric: first decision ({decision}) after {elapsed:.1f}s")
+    
+    def record_decision(self, decision):
+        """
+        Log the boot metric the first time a connect/AP decision is made
+        
+        Args:
+            decision (str): Description of the decision
+        """
+        if self.first_decision:
+            ConnectionMonitor.log_boot_metric(self.started, decision)
+            self.first_decision = False
+            SystemdNotifier.status(decision)
+    
+    def set_link_state(self, connected):
+        """
+        Update the shared link state and wake tasks waiting on it
+        
+        Args:
+            connected (bool): Whether we are connected to a Wi-Fi network
+        """
+        now = time.monotonic()
+        if connected != self.connected:
+            if connected:
+                if self.link_down_since is not None:
+                    downtime = now - self.link_down_since
+                    self.link_downtime += downtime
+                    logger.info(f"Connected to a Wi-Fi network after {downtime:.1f}s without a link "
+                                f"({self.link_downtime:.0f}s in total)")
+                else:
+                    logger.info("Connected to a Wi-Fi network")
+                self.link_up_since = now
+                self.link_down_since = None
+            elif self.connected is not None:
+                logger.info("Not connected to a Wi-Fi network")
+                self.link_up_since = None
+                self.link_signal = None
+                if self.connected:
+                    self.link_down_since = now
+        
+        self.connected = connected
+        if connected:
+            self.disconnected_event.clear()
+            self.connected_event.set()
+        else:
+            self.connected_event.clear()
+            self.disconnected_event.set()
+    
+    @staticmethod
+    async def get_saved_connections():
+        """
+        Get the saved Wi-Fi client profiles (excluding our AP)
+        
+        The profile index only runs nmcli when the saved profiles have
+        changed, so repeated reconnect attempts are cheap.
+        
+        Returns:
+            list: Profile dicts with uuid, name and ssid
+        
+        Raises:
+            NetworkManagerUnavailable: If NetworkManager is down and the
+                saved profiles are unknown
+        """
+        try:
+            return await asyncio.to_thread(NetworkManager.profiles.client_profiles)
+        
+        except NetworkManagerUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"Error getting saved connections: {e}")
+            return []
+    
+    async def check_link(self):
+        """
+        Query NetworkManager for the active connections
+        
+        Returns:
+            tuple: (connected to a Wi-Fi network, JLBMaritime AP active), or
+            None if NetworkManager is unavailable and the state is unknown
+        """
+        result = await NetworkManager.run_async(ACTIVE_CONNECTIONS_CMD, timeout=COMMAND_TIMEOUT)
+        if NetworkManagerHealth.is_outage(result.returncode):
+            return None
+        if result.returncode != 0:
+            return False, False
+        
+        try:
+            # The profile index may have to reload, which runs nmcli
+            active = await asyncio.to_thread(NetworkManager.parse_active_wifi, result.stdout)
+        except NetworkManagerUnavailable:
+            return None
+        
+        connected = False
+        ap_active = False
+        active_connection = None
+        for profile, _ in active:
+            if profile["mode"] == "ap":
+                ap_active = True
+            else:
+                connected = True
+                active_connection = profile["name"]
+        
+        self.active_connection = active_connection
+        return connected, ap_active
+    
+    async def watch_link(self):
+        """
+        Task: keep the shared link state up to date
+        """
+        while True:
+            if self.profiler:
+                self.profiler.poll_request()
+            
+            try:
+                generation = self.ap_restores
+                link = await self.check_link()
+                self.last_link_check = time.monotonic()
+                
+                # While NetworkManager is down the link state is unknown; keep
+                # the last known state rather than acting on a false "disconnected".
+                # A roam reports its own outcome.
+                if link is not None and not self.roaming:
+                    connected, ap_active = link
+                    self.set_link_state(connected)
+                    
+                    if connected:
+                        self.record_decision("client mode")
+                        
+                        # A working profile no longer needs to back off, however it connected
+                        self.failure_cache.record_success(self.active_connection)
+                    
+                    # In concurrent mode the portal AP stays up whether or not the
+                    # station is connected, from boot on
+                    if config.CONCURRENT_MODE and not ap_active and await self.concurrent_ap_possible():
+                        self.restore_ap(generation)
+            
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error checking link state: {e}")
+            
+            # Sleep until the next check, unless one is requested sooner
+            try:
+                await asyncio.wait_for(self.link_check_event.wait(), LINK_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.link_check_event.clear()
+    
+    def restore_ap(self, generation):
+        """
+        Queue a restore of the concurrent AP without waiting for it
+        
+        The restore may wait behind a user's connect and then take a while
+        itself; awaiting it here would hold up the link checks long enough
+        for the watchdog to report a stall.
+        
+        Nothing is queued while a restore is pending, or if one finished
+        after the link check that found the AP down; that check is stale.
+        
+        Args:
+            generation (int): self.ap_restores as it was before that check
+        """
+        if self.ap_restore is not None and (not self.ap_restore.done() or self.ap_restores != generation):
+            return
+        
+        logger.info("Restoring concurrent Access Point")
+        future = self.radio_queue.submit(
+            "concurrent AP setup", self.setup_concurrent_ap, key=("setup_concurrent_mode",)
+        )
+        
+        def finished(future):
+            if future.cancelled():
+                return
+            error = future.exception()
+            if isinstance(error, OperationSuperseded):
+                logger.info(f"Not restoring the Access Point: {error}")
+            elif error is not None:
+                logger.error(f"Error restoring the Access Point: {error}")
+        
+        future.add_done_callback(finished)
+        self.ap_restore = future
+    
+    def setup_concurrent_ap(self):
+        """
+        Set up the concurrent AP; run as a radio operation
+        
+        Returns:
+            bool: True if the AP is up
+        """
+        try:
+            return NetworkManager.setup_concurrent_mode()
+        finally:
+            self.ap_restores += 1
+    
+    async def concurrent_ap_possible(self):
+        """
+        Check whether the AP can run alongside the station connection
+        
+        Without separate AP and station interfaces, restoring the AP while
+        connected would drop the link, and the monitor would then reconnect
+        and restore the AP again forever. The hardware does not change, so
+        the answer is worked out once.
+        
+        Returns:
+            bool: True if concurrent interface roles are available
+        """
+        if self.concurrent_ap is None:
+            roles = await asyncio.to_thread(NetworkManager.select_interface_roles)
+            self.concurrent_ap = roles is not None
+            if not self.concurrent_ap:
+                logger.warning("Concurrent mode enabled, but the AP only runs while disconnected on this hardware")
+        return self.concurrent_ap
+    
+    async def probe_reachability(self):
+        """
+        Task: probe internet reachability while connected
+        """
+        while True:
+            await self.connected_event.wait()
+            
+            try:
+                cmd = ["ping", "-c", "1", "-W", "2", "8.8.8.8"]
+                result = await NetworkManager.run_async(cmd, timeout=COMMAND_TIMEOUT)
+                internet = result.returncode == 0
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                internet = False
+            
+            if internet != self.internet:
+                if internet:
+                    logger.info("Internet connection is available")
+                else:
+                    logger.warning("Connected to Wi-Fi but no internet access")
+            self.internet = internet
+            
+            await asyncio.sleep(PROBE_INTERVAL)
+    
+    async def background_scan(self):
+        """
+        Task: keep a recent view of the networks in range
+        """
+        while True:
+            try:
+                # Use NetworkManager's cached results unless they are stale
+                cmd = ["nmcli", "-t", "-f", "IN-USE,BSSID,SIGNAL,SSID", "device", "wifi", "list", "--rescan", "auto"]
+                result = await NetworkManager.run_async(cmd, timeout=COMMAND_TIMEOUT)
+                
+                if result.returncode == 0:
+                    scan_results = {}
+                    access_points = []
+                    for line in result.stdout.splitlines():
+                        parts = split_terse(line)
+                        if len(parts) < 4:
+                            continue
+                        in_use, bssid, signal_str, ssid = parts[:4]
+                        if not ssid or ssid == "JLBMaritime":
+                            continue
+                        try:
+                            signal_strength = int(signal_str)
+                        except ValueError:
+                            continue
+                        scan_results[ssid] = max(signal_strength, scan_results.get(ssid, 0))
+                        access_points.append((ssid, bssid, signal_strength, in_use == "*"))
+                    self.scan_results = scan_results
+                    self.access_points = access_points
+                    
+                    if config.ROAMING and self.connected:
+                        await self.consider_roaming()
+            
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error during background scan: {e}")
+            
+            # Scan again at once when the link changes, so a reconnect has
+            # current results rather than ones from before the link dropped
+            if self.connected:
+                # Look more often while the link is weak
+                weak = self.link_signal is not None and self.link_signal < ROAM_TRIGGER_SIGNAL
+                interval = ROAM_SCAN_INTERVAL if config.ROAMING and weak else SCAN_INTERVAL_CONNECTED
+                change = self.disconnected_event
+            else:
+                interval = SCAN_INTERVAL_DISCONNECTED
+                change = self.connected_event
+            try:
+                await asyncio.wait_for(change.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+    
+    @staticmethod
+    def choose_roam_target(current, access_points, profiles, failure_cache):
+        """
+        Pick the access point to roam to, if any is clearly better
+        
+        Args:
+            current (tuple): (ssid, bssid, signal, in use) of the current link
+            access_points (list): Access points from the latest scan
+            profiles (dict): SSID -> saved profile
+            failure_cache (FailureCache): Backoff records of the profiles
+        
+        Returns:
+            tuple: The target access point, or None to stay
+        """
+        best = None
+        for ap in access_points:
+            ssid, bssid, signal_strength, _ = ap
+            if bssid == current[1] or ssid not in profiles:
+                continue
+            if signal_strength < current[2] + ROAM_HYSTERESIS:
+                continue
+            if best is not None and signal_strength <= best[2]:
+                continue
+            if failure_cache.should_skip(profiles[ssid]["name"], signal_strength)[0]:
+                continue
+            best = ap
+        return best
+    
+    async def consider_roaming(self):
+        """
+        Roam to a clearly stronger saved network or access point while the
+        current link is weak, using the latest background scan
+        """
+        current = next((ap for ap in self.access_points if ap[3]), None)
+        if current is None:
+            return
+        
+        self.link_signal = current[2]
+        if current[2] >= ROAM_TRIGGER_SIGNAL:
+            return
+        if self.link_up_since is None or time.monotonic() - self.link_up_since < ROAM_DWELL:
+            return
+        
+        profiles = {profile["ssid"]: profile for profile in await ConnectionMonitor.get_saved_connections()}
+        target = ConnectionMonitor.choose_roam_target(current, self.access_points, profiles, self.failure_cache)
+        if target is None:
+            return
+        
+        await self.roam(current, target, profiles[target[0]])
+    
+    async def roam(self, current, target, profile):
+        """
+        Move the link to another access point and log the outcome
+        
+        Args:
+            current (tuple): Access point of the current link
+            target (tuple): Access point to move to
+            profile (dict): Saved profile of the target's SSID
+        """
+        logger.info(f"Roaming from {current[0]} ({current[1]}, {current[2]}%) "
+                    f"to {target[0]} ({target[1]}, {target[2]}%)")
+        
+        success = False
+        started = time.monotonic()
+        self.roaming = True
+        try:
+            result = await self.radio(
+                f"roam to {target[0]} ({target[1]})", ConnectionMonitor.activate, profile["uuid"], target[1]
+            )
+            link = await self.check_link()
+            success = result.returncode == 0 and bool(link and link[0])
+            if NetworkManagerHealth.is_outage(result.returncode):
+                # Not the network's fault; leave its backoff alone
+                logger.warning(f"NetworkManager unavailable while roaming to {target[0]}")
+            elif result.returncode != 0:
+                self.failure_cache.record_failure(profile["name"], FailureCache.classify_failure(result.stderr))
+        except OperationSuperseded as e:
+            logger.info(f"Not roaming: {e}")
+            return
+        except subprocess.TimeoutExpired:
+            self.failure_cache.record_failure(profile["name"], FailureCache.classify_failure(""))
+        finally:
+            self.roaming = False
+            # Let watch_link report whatever state the roam left
+            self.link_check_event.set()
+        
+        downtime = round(time.monotonic() - started, 1)
+        
+        if success:
+            logger.info(f"Roamed to {target[0]} ({target[1]}), {downtime}s without a link")
+            self.link_up_since = time.monotonic()
+            self.link_signal = target[2]
+        else:
+            logger.warning(f"Roam to {target[0]} ({target[1]}) failed after {downtime}s")
+    
+    @staticmethod
+    def activate(uuid, bssid=None):
+        """
+        Activate a saved connection; run as a radio operation
+        
+        Args:
+            uuid (str): UUID of the profile
+            bssid (str, optional): Access point to use; NetworkManager picks one otherwise
+        
+        Returns:
+            subprocess.CompletedProcess: The result of nmcli
+        """
+        cmd = ["nmcli", "-w", str(CONNECT_TIMEOUT), "connection", "up", "uuid", uuid]
+        sta_iface = NetworkManager.get_station_interface()
+        if sta_iface:
+            cmd += ["ifname", sta_iface]
+        if bssid:
+            cmd += ["ap", bssid]
+        
+        return NetworkManager.run(cmd, capture_output=True, text=True, timeout=CONNECT_TIMEOUT + 10)
+    
+    async def try_saved_connections(self):
+        """
+        Try to activate each saved connection, strongest visible network first
+        
+        Returns:
+            bool: True if a connection was established, False otherwise
+        
+        Raises:
+            OperationSuperseded: If a user connected through the portal meanwhile
+            NetworkManagerUnavailable: If the saved profiles are unknown or
+                NetworkManager stopped answering
+        """
+        self.backoff_wait = None
+        saved_connections = await ConnectionMonitor.get_saved_connections()
+        if not saved_connections:
+            return False
+        
+        scan_results = self.scan_results
+        saved_connections.sort(key=lambda profile: -scan_results.get(profile["ssid"], -1))
+        
+        # Leave out networks that failed recently and are still backing off
+        candidates = []
+        for profile in saved_connections:
+            skip, reason = self.failure_cache.should_skip(profile["name"], scan_results.get(profile["ssid"]))
+            if skip:
+                logger.info(f"Skipping {profile['name']}: {reason}")
+            else:
+                candidates.append(profile)
+        
+        if not candidates:
+            self.backoff_wait = self.failure_cache.next_retry([profile["name"] for profile in saved_connections])
+            return False
+        
+        logger.info(f"Found {len(candidates)} saved connections. Attempting to connect...")
+        
+        for profile in candidates:
+            connection = profile["name"]
+            if self.connected:
+                # The link came back on its own (e.g. NetworkManager autoconnect)
+                return True
+            
+            logger.info(f"Trying to connect to {connection}")
+            
+            try:
+                result = await self.radio(f"activation of {connection}", ConnectionMonitor.activate, profile["uuid"])
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Timed out connecting to {connection}")
+                self.failure_cache.record_failure(connection, FailureCache.classify_failure(""))
+                continue
+            except (asyncio.CancelledError, OperationSuperseded):
+                raise
+            except Exception as e:
+                logger.error(f"Error connecting to {connection}: {e}")
+                continue
+            
+            if NetworkManagerHealth.is_outage(result.returncode):
+                # Not the network's fault; leave its backoff alone and retry later
+                raise NetworkManagerUnavailable(result.returncode, result.args, output=result.stdout,
+                                                stderr=result.stderr)
+            
+            if result.returncode == 0:
+                link = await self.check_link()
+                if link and link[0]:
+                    logger.info(f"Successfully connected to {connection}")
+                    self.failure_cache.record_success(connection)
+                    self.set_link_state(True)
+                    return True
+            else:
+                logger.info(f"Could not connect to {connection}: {result.stderr.strip()}")
+                self.failure_cache.record_failure(connection, FailureCache.classify_failure(result.stderr))
+        
+        return False
+    
+    async def reconnect(self):
+        """
+        Task: restore a connection whenever the link is down, falling back to AP mode
+        """
+        while True:
+            await self.disconnected_event.wait()
+            
+            try:
+                if await self.try_saved_connections():
+                    self.record_decision("reconnected to saved network")
+                    continue
+                
+                if self.connected:
+                    continue
+                
+                logger.warning("Failed to connect to any saved network")
+                
+                # If we get here, we couldn't connect to any saved network
+                # So we need the AP mode. Setting it up again while it runs
+                # would drop the phones on it, e.g. when every saved network
+                # was skipped for backoff and nothing touched the radio.
+                generation = self.ap_restores
+                link = await self.check_link()
+                if link and link[1]:
+                    logger.info("Access Point mode already active")
+                else:
+                    logger.info("Starting Access Point mode")
+                    
+                    if config.CONCURRENT_MODE:
+                        # Joins a restore watch_link may have queued meanwhile
+                        self.restore_ap(generation)
+                        started = await asyncio.wrap_future(self.ap_restore)
+                    else:
+                        started = await self.radio("AP setup", NetworkManager.setup_ap_mode)
+                    
+                    if not started:
+                        # Nothing is up for the user to reach; try again soon
+                        logger.warning(f"Access Point mode did not start, retrying in {RETRY_INTERVAL}s")
+                        await asyncio.sleep(RETRY_INTERVAL)
+                        continue
+                
+                self.record_decision("access point mode")
+            
+            except asyncio.CancelledError:
+                raise
+            except OperationSuperseded as e:
+                # A user is connecting through the portal; see where that leaves the link
+                logger.info(f"Backing off: {e}")
+                try:
+                    await asyncio.wait_for(self.connected_event.wait(), USER_GRACE)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            except NetworkManagerUnavailable:
+                # Unknown is not the same as nothing saved; ask again soon
+                logger.warning(f"NetworkManager unavailable, retrying in {RETRY_INTERVAL}s")
+                await asyncio.sleep(RETRY_INTERVAL)
+                continue
+            except Exception as e:
+                logger.error(f"Error in connection monitor: {e}")
+            
+            await self.wait_in_ap_mode()
+    
+    async def wait_in_ap_mode(self):
+        """
+        Stay in AP mode for a while, unless a client connection comes up first
+        
+        The wait is AP_RETRY_INTERVAL, or shorter if every saved network was
+        skipped for backoff and the first of those backoffs ends sooner.
+        """
+        timeout = AP_RETRY_INTERVAL
+        if self.backoff_wait is not None:
+            timeout = min(timeout, self.backoff_wait)
+        
+        try:
+            await asyncio.wait_for(self.connected_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def radio(self, name, func, *args):
+        """
+        Run a blocking radio-changing call as a background radio operation
+        
+        The call waits behind any operation requested through the portal,
+        and is joined with an identical one already queued.
+        
+        Args:
+            name (str): Description for log messages
+            func (callable): Function to run
+            *args: Arguments for func
+        
+        Returns:
+            The function's return value
+        
+        Raises:
+            OperationSuperseded: If a user operation took precedence
+        """
+        future = self.radio_queue.submit(name, func, *args, key=(func.__name__,) + args)
+        return await asyncio.wrap_future(future)
+    
+    def find_stall(self):
+        """
+        Check whether any part of the monitor has stopped making progress
+        
+        Returns:
+            str: Description of the stall, or None if everything is progressing
+        """
+        now = time.monotonic()
+        
+        if self.hosted and not self.thread.is_alive():
+            return "monitor thread has exited"
+        
+        if self.last_link_check is not None and now - self.last_link_check > WATCHDOG_STALL_LIMIT:
+            return f"no link check for {now - self.last_link_check:.0f}s"
+        
+        running = self.radio_queue.running()
+        if running is not None and running[1] > RADIO_STALL_LIMIT:
+            return f"{running[0]} running for {running[1]:.0f}s"
+        
+        return None
+    
+    async def keepalive(self, interval):
+        """
+        Task: send systemd watchdog keepalives while the monitor is healthy
+        
+        Args:
+            interval (float): Seconds between keepalives
+        """
+        while True:
+            stall = self.find_stall()
+            if stall is None:
+                SystemdNotifier.watchdog()
+            else:
+                logger.error(f"Withholding watchdog keepalive: {stall}")
+            
+            await asyncio.sleep(interval)
+    
+    def stop(self):
+        """
+        Cancel all monitor tasks
+        """
+        if not self.hosted:
+            SystemdNotifier.stopping()
+        for task in self.tasks:
+            task.cancel()
+    
+    def start_in_thread(self):
+        """
+        Run the monitor on a background thread of the calling process
+        
+        Used in single-process mode, where the portal hosts the monitor. The
+        portal then owns readiness and watchdog reporting and includes
+        find_stall() in its own health check.
+        """
+        self.hosted = True
+        
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(self.run_async())
+            except Exception as e:
+                logger.error(f"Connection monitor thread failed: {e}")
+            finally:
+                self.loop.close()
+        
+        self.thread = threading.Thread(target=run, name="connection-monitor", daemon=True)
+        self.thread.start()
+    
+    def stop_in_thread(self, timeout=10):
+        """
+        Stop a monitor started with start_in_thread()
+        
+        Args:
+            timeout (float): Seconds to wait for the thread to finish
+        """
+        if self.thread is None or not self.thread.is_alive():
+            return
+        self.loop.call_soon_threadsafe(self.stop)
+        self.thread.join(timeout)
+    
+    def request_link_check(self):
+        """
+        Ask for a link check now rather than at the next interval
+        
+        Safe to call from any thread, e.g. after the portal changed connection.
+        """
+        if self.loop is None or self.link_check_event is None:
+            return
+        self.loop.call_soon_threadsafe(self.link_check_event.set)
+    
+    async def run_async(self):
+        """
+        Start the monitor tasks and wait for them to finish
+        """
+        logger.info("Starting connection monitor")
+        self.started = time.monotonic()
+        self.connected_event = asyncio.Event()
+        self.disconnected_event = asyncio.Event()
+        self.link_check_event = asyncio.Event()
+        
+        # Wait for NetworkManager to be ready rather than a fixed delay
+        if await ConnectionMonitor.wait_for_readiness():
+            logger.info(f"NetworkManager ready after {time.monotonic() - self.started:.1f}s")
+        else:
+            logger.warning(f"NetworkManager not ready after {READINESS_TIMEOUT}s, continuing anyway")
+        
+        # Establish the link state before the other tasks start acting on it
+        try:
+            link = await self.check_link()
+            connected = bool(link and link[0])
+        except Exception as e:
+            logger.error(f"Error checking link state: {e}")
+            connected = False
+        self.set_link_state(connected)
+        
+        self.radio_queue.start()
+        
+        # When hosted, the portal submits to the queue directly
+        if not self.hosted:
+            self.radio_server = RadioServer(self.radio_queue, on_user_done=self.link_check_event.set)
+            await self.radio_server.start()
+        
+        self.tasks = [
+            asyncio.create_task(self.watch_link(), name="watch_link"),
+            asyncio.create_task(self.probe_reachability(), name="probe_reachability"),
+            asyncio.create_task(self.background_scan(), name="background_scan"),
+            asyncio.create_task(self.reconnect(), name="reconnect"),
+        ]
+        
+        # When hosted, the portal process reports to systemd for both
+        if not self.hosted:
+            watchdog_interval = SystemdNotifier.watchdog_interval()
+            if watchdog_interval:
+                self.tasks.append(asyncio.create_task(self.keepalive(watchdog_interval), name="keepalive"))
+            
+            SystemdNotifier.ready("monitoring")
+        
+        try:
+            await asyncio.gather(*self.tasks)
+        except asyncio.CancelledError:
+            logger.info("Connection monitor stopped")
+        finally:
+            if self.radio_server:
+                self.radio_server.stop()
+            self.radio_queue.stop()
+    
+    def run(self):
+        """
+        Main monitoring loop
+        """
+        async def main():
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.add_signal_handler(sig, self.stop)
+            await self.run_async()
+        
+        asyncio.run(main())
+
+if __name__ == "__main__":
+    # Make the script executable
+    if not os.access(__file__, os.X_OK):
+        os.chmod(__file__, 0o755)
+    
+    # In single-process mode the portal runs the monitor itself
+    if config.SINGLE_PROCESS:
+        logger.info("Single-process mode: the connection monitor runs inside captive-portal.service")
+        SystemdNotifier.ready("hosted by captive-portal.service")
+        sys.exit(EXIT_HOSTED_BY_PORTAL)
+    
+    # Run the connection monitor
+    ConnectionMonitor().run()
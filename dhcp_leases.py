@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# dhcp_leases.py - Track the clients connected to the JLBMaritime access point
+
+import collections
+import logging
+import os
+import threading
+import time
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("/var/log/captive-portal.log"),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger("dhcp_leases")
+
+# Lease files written by dnsmasq: NetworkManager's shared-mode instance keeps
+# one per interface, a standalone dnsmasq uses the Debian default location
+LEASE_FILE_CANDIDATES = [
+    "/var/lib/NetworkManager/dnsmasq-{interface}.leases",
+    "/var/lib/misc/dnsmasq.leases",
+]
+
+# Minimum time between checks of the lease file for changes
+REFRESH_INTERVAL = 1.0
+
+Lease = collections.namedtuple("Lease", ["ip", "mac", "hostname", "expires"])
+
+class LeaseTracker:
+    """
+    Incrementally reads the dnsmasq lease file and indexes clients by IP
+    
+    The file is only re-read when its inode, size or modification time
+    changes, and only lines that changed since the previous read are parsed.
+    Lookups are dictionary hits.
+    """
+    
+    def __init__(self, path=None, interface="wlan0"):
+        """
+        Args:
+            path (str, optional): Lease file to read; found automatically if omitted
+            interface (str): AP interface, used to locate NetworkManager's lease file
+        """
+        self.path = path
+        self.interface = interface
+        self.lock = threading.Lock()
+        
+        # IP -> Lease
+        self.by_ip = {}
+        # Raw lease line -> IP it was parsed into
+        self.lines = {}
+        
+        self.signature = None
+        self.next_check = 0.0
+        
+        # Counters for metrics
+        self.reloads = 0
+        self.lines_parsed = 0
+    
+    def find_lease_file(self):
+        """
+        Find the lease file in use
+        
+        Returns:
+            str: Path of the first lease file that exists, or None
+        """
+        for candidate in LEASE_FILE_CANDIDATES:
+            path = candidate.format(interface=self.interface)
+            if os.path.exists(path):
+                return path
+        return None
+    
+    @staticmethod
+    def parse_line(line):
+        """
+        Parse one dnsmasq lease line
+        
+        The format is "<expiry> <mac> <ip> <hostname> <client-id>", with "*"
+        for an unknown hostname.
+        
+        Args:
+            line (str): Lease line
+        
+        Returns:
+            Lease: The parsed lease, or None for lines that are not IPv4 leases
+        """
+        parts = line.split()
+        if len(parts) < 4 or parts[0] == "duid":
+            return None
+        
+        try:
+            expires = int(parts[0])
+        except ValueError:
+            return None
+        
+        hostname = parts[3] if parts[3] != "*" else None
+        return Lease(ip=parts[2], mac=parts[1].lower(), hostname=hostname, expires=expires)
+    
+    def refresh(self, force=False):
+        """
+        Re-read the lease file if it has changed
+        
+        Args:
+            force (bool): Check the file even if it was checked recently
+        """
+        now = time.monotonic()
+        if not force and now < self.next_check:
+            return
+        
+        with self.lock:
+            if not force and now < self.next_check:
+                return
+            self.next_check = now + REFRESH_INTERVAL
+            
+            path = self.path or self.find_lease_file()
+            if not path:
+                return
+            
+            try:
+                st = os.stat(path)
+            except OSError:
+                self.by_ip = {}
+                self.lines = {}
+                self.signature = None
+                return
+            
+            signature = (path, st.st_ino, st.st_size, st.st_mtime_ns)
+            if signature == self.signature:
+                return
+            
+            try:
+                with open(path) as f:
+                    current = set(f.read().splitlines())
+            except OSError as e:
+                logger.warning(f"Could not read lease file {path}: {e}")
+                return
+            
+            self.signature = signature
+            self.reloads += 1
+            
+            # Drop leases whose lines disappeared, unless a newer line took over the IP
+            for line in set(self.lines) - current:
+                ip = self.lines.pop(line)
+                if ip is not None and ip in self.by_ip and ip not in self.lines.values():
+                    del self.by_ip[ip]
+            
+            # Parse only the lines that are new since the last read
+            for line in current - set(self.lines):
+                lease = LeaseTracker.parse_line(line)
+                self.lines_parsed += 1
+                if lease is None:
+                    # Remember unparseable lines too so they are not parsed again
+                    self.lines[line] = None
+                    continue
+                self.lines[line] = lease.ip
+                self.by_ip[lease.ip] = lease
+    
+    def get(self, ip):
+        """
+        Look up the client holding an IP address
+        
+        Args:
+            ip (str): Client IP address
+        
+        Returns:
+            Lease: The client's lease, or None if unknown
+        """
+        self.refresh()
+        return self.by_ip.get(ip)
+    
+    def clients(self):
+        """
+        Get all current leases
+        
+        Returns:
+            list: Lease tuples, ordered by IP
+        """
+        self.refresh()
+        return sorted(self.by_ip.values(), key=lambda lease: tuple(int(p) for p in lease.ip.split(".") if p.isdigit()))
+    
+    def stats(self):
+        """
+        Get tracker metrics
+        
+        Returns:
+            dict: Client count and parsing counters
+        """
+        self.refresh()
+        return {
+            "clients": len(self.by_ip),
+            "reloads": self.reloads,
+            "lines_parsed": self.lines_parsed,
+        }
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# dns_responder.py - Built-in DNS responder for the JLBMaritime Captive Portal
+#
+# Answers every A query with the portal address so that clients on the access
+# point land on the portal, without rewriting and restarting dnsmasq. dnsmasq
+# keeps serving DHCP; while the responder is enabled, DNS traffic from the AP
+# is redirected to it with an iptables rule, and disabling it removes the rule.
+#
+# Usage:
+#   python3 dns_responder.py                  # serve on the configured port
+#   python3 dns_responder.py --benchmark      # measure queries per second on loopback
+
+import argparse
+import asyncio
+import logging
+import socket
+import struct
+import subprocess
+import threading
+import time
+
+import config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("/var/log/captive-portal.log"),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger("dns_responder")
+
+# TTL of the answers; kept short so clients re-resolve once they are online
+ANSWER_TTL = 1
+
+# DNS constants
+QTYPE_A = 1
+QTYPE_AAAA = 28
+CLASS_IN = 1
+OPCODE_QUERY = 0
+RCODE_NOERROR = 0
+RCODE_FORMERR = 1
+RCODE_NOTIMP = 4
+
+# Response flags: QR, AA and RA set; RD and the opcode are copied from the query
+RESPONSE_FLAGS = 0x8480
+
+class DNSResponder:
+    """
+    Minimal asyncio DNS server that points every name at the portal
+    
+    Answers are built from templates prepared when the responder is created:
+    a reply is the query ID, the precomputed flags and counts for the query
+    type, the question copied from the query and the precomputed answer.
+    """
+    
+    def __init__(self, address="10.42.0.1", host="0.0.0.0", port=5300):
+        """
+        Args:
+            address (str): IPv4 address returned for every A query
+            host (str): Address to listen on
+            port (int): UDP and TCP port to listen on
+        """
+        self.address = address
+        self.host = host
+        self.port = port
+        
+        self.templates = DNSResponder.build_templates(address)
+        
+        self.loop = None
+        self.thread = None
+        self.transport = None
+        self.tcp_server = None
+        self.ready = threading.Event()
+        
+        # Interface whose DNS traffic is currently redirected to us
+        self.interface = None
+        
+        # Counters for metrics
+        self.queries = 0
+        self.errors = 0
+    
+    @staticmethod
+    def build_templates(address):
+        """
+        Precompute the reply pieces for each query type
+        
+        Args:
+            address (str): IPv4 address returned for A queries
+        
+        Returns:
+            dict: qtype -> (counts bytes, answer bytes); key None is used for
+            every other type and answers with no records
+        """
+        # The answer name is a compression pointer to the question at offset 12
+        a_record = struct.pack(">HHHIH", 0xC00C, QTYPE_A, CLASS_IN, ANSWER_TTL, 4) + socket.inet_aton(address)
+        empty = (struct.pack(">HHHH", 1, 0, 0, 0), b"")
+        
+        return {
+            QTYPE_A: (struct.pack(">HHHH", 1, 1, 0, 0), a_record),
+            # No IPv6 address for the portal: an empty NOERROR makes clients fall back to A
+            QTYPE_AAAA: empty,
+            None: empty,
+        }
+    
+    def respond(self, query):
+        """
+        Build the reply to one DNS query
+        
+        Args:
+            query (bytes): DNS message
+        
+        Returns:
+            bytes: The reply, or None if the message should be dropped
+        """
+        self.queries += 1
+        
+        if len(query) < 12:
+            self.errors += 1
+            return None
+        
+        query_id, flags, qdcount = struct.unpack_from(">HHH", query)
+        if flags & 0x8000:
+            # A response, not a query
+            return None
+        
+        reply_flags = RESPONSE_FLAGS | (flags & 0x7900)
+        opcode = (flags >> 11) & 0xF
+        
+        if opcode != OPCODE_QUERY or qdcount != 1:
+            rcode = RCODE_NOTIMP if opcode != OPCODE_QUERY else RCODE_FORMERR
+            return struct.pack(">HHHHHH", query_id, reply_flags | rcode, 0, 0, 0, 0)
+        
+        # Find the end of the question name; compression is not valid here
+        offset = 12
+        while offset < len(query):
+            length = query[offset]
+            if length == 0 or length & 0xC0:
+                break
+            offset += length + 1
+        
+        if offset >= len(query) or query[offset] != 0 or offset + 5 > len(query):
+            self.errors += 1
+            return struct.pack(">HHHHHH", query_id, reply_flags | RCODE_FORMERR, 0, 0, 0, 0)
+        
+        question_end = offset + 5
+        qtype, qclass = struct.unpack_from(">HH", query, offset + 1)
+        
+        key = qtype if qclass == CLASS_IN and qtype in self.templates else None
+        counts, answer = self.templates[key]
+        
+        return struct.pack(">HH", query_id, reply_flags | RCODE_NOERROR) + counts + query[12:question_end] + answer
+    
+    # ------------------------------------------------------------------
+    # Serving
+    # ------------------------------------------------------------------
+    
+    class UDPProtocol(asyncio.DatagramProtocol):
+        def __init__(self, responder):
+            self.responder = responder
+            self.transport = None
+        
+        def connection_made(self, transport):
+            self.transport = transport
+        
+        def datagram_received(self, data, addr):
+            reply = self.responder.respond(data)
+            if reply is not None:
+                self.transport.sendto(reply, addr)
+    
+    async def handle_tcp(self, reader, writer):
+        """
+        Serve length-prefixed DNS queries on one TCP connection
+        """
+        try:
+            while True:
+                header = await reader.readexactly(2)
+                query = await reader.readexactly(struct.unpack(">H", header)[0])
+                reply = self.respond(query)
+                if reply is None:
+                    break
+                writer.write(struct.pack(">H", len(reply)) + reply)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    
+    async def serve(self):
+        """
+        Open the UDP and TCP listeners on the running loop
+        """
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: DNSResponder.UDPProtocol(self), local_addr=(self.host, self.port)
+        )
+        # With port 0 the system picks one; TCP uses the same number
+        self.port = self.transport.get_extra_info("sockname")[1]
+        self.tcp_server = await asyncio.start_server(self.handle_tcp, self.host, self.port, reuse_address=True)
+        logger.info(f"DNS responder listening on {self.host}:{self.port}, answering {self.address}")
+    
+    def start(self):
+        """
+        Start serving on a background thread
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if self.thread is not None:
+            return True
+        
+        error = []
+        
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(self.serve())
+            except OSError as e:
+                error.append(e)
+                self.ready.set()
+                return
+            self.ready.set()
+            self.loop.run_forever()
+            
+            self.transport.close()
+            self.tcp_server.close()
+            self.loop.run_until_complete(self.tcp_server.wait_closed())
+            self.loop.close()
+        
+        self.ready.clear()
+        self.thread = threading.Thread(target=run, name="dns-responder", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        
+        if error:
+            logger.error(f"Could not start DNS responder on {self.host}:{self.port}: {error[0]}")
+            self.thread = None
+            return False
+        return True
+    
+    def stop(self):
+        """
+        Stop serving and remove the DNS redirect
+        """
+        self.disable()
+        if self.thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.thread = None
+        logger.info("DNS responder stopped")
+    
+    # ------------------------------------------------------------------
+    # Redirecting DNS traffic from the access point
+    # ------------------------------------------------------------------
+    
+    def redirect_rule(self, interface, protocol):
+        return [
+            "PREROUTING", "-i", interface, "-p", protocol, "--dport", "53",
+            "-j", "REDIRECT", "--to-ports", str(self.port)
+        ]
+    
+    def enable(self, interface):
+        """
+        Send DNS queries from the access point to the responder
+        
+        Args:
+            interface (str): Interface the access point runs on
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if self.interface == interface:
+            return True
+        self.disable()
+        
+        if not self.start():
+            return False
+        
+        try:
+            for protocol in ("udp", "tcp"):
+                cmd = ["iptables", "-t", "nat", "-I"] + self.redirect_rule(interface, protocol)
+                subprocess.run(cmd, capture_output=True, text=True, check=True)
+            self.interface = interface
+            logger.info(f"Redirecting DNS on {interface} to the built-in responder")
+            return True
+        
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Error redirecting DNS: {e.stderr.strip() if e.stderr else e}")
+            return False
+        except Exception as e:
+            logger.error(f"Unexpected error redirecting DNS: {e}")
+            return False
+    
+    def disable(self):
+        """
+        Stop redirecting DNS queries so dnsmasq answers them normally again
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if self.interface is None:
+            return True
+        
+        success = True
+        for protocol in ("udp", "tcp"):
+            cmd = ["iptables", "-t", "nat", "-D"] + self.redirect_rule(self.interface, protocol)
+            try:
+                subprocess.run(cmd, capture_output=True, text=True, check=True)
+            except Exception as e:
+                logger.warning(f"Error removing DNS redirect for {protocol}: {e}")
+                success = False
+        
+        logger.info(f"Stopped redirecting DNS on {self.interface}")
+        self.interface = None
+        return success
+
+def build_query(name, qtype=QTYPE_A, query_id=0):
+    """
+    Build a DNS query message
+    
+    Args:
+        name (str): Domain name
+        qtype (int): Query type
+        query_id (int): Message ID
+    
+    Returns:
+        bytes: The query
+    """
+    question = b"".join(bytes([len(label)]) + label.encode() for label in name.split(".") if label)
+    return struct.pack(">HHHHHH", query_id, 0x0100, 1, 0, 0, 0) + question + b"\x00" + struct.pack(">HH", qtype, CLASS_IN)
+
+def benchmark(duration, clients):
+    """
+    Measure how many queries per second the responder answers on loopback
+    
+    Args:
+        duration (float): Length of the run in seconds
+        clients (int): Number of concurrent client sockets
+    
+    Returns:
+        dict: Queries answered, elapsed time and queries per second
+    """
+    responder = DNSResponder(host="127.0.0.1", port=0)
+    if not responder.start():
+        raise SystemExit(1)
+    
+    names = ["captive.apple.com", "connectivitycheck.gstatic.com", "www.msftconnecttest.com", "example.com"]
+    answered = [0] * clients
+    deadline = time.perf_counter() + duration
+    
+    def client(index):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(1)
+        sock.connect(("127.0.0.1", responder.port))
+        queries = [build_query(name, qtype, index) for name in names for qtype in (QTYPE_A, QTYPE_AAAA)]
+        i = 0
+        while time.perf_counter() < deadline:
+            sock.send(queries[i % len(queries)])
+            i += 1
+            try:
+                sock.recv(512)
+                answered[index] += 1
+            except socket.timeout:
+                pass
+        sock.close()
+    
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    
+    responder.stop()
+    
+    total = sum(answered)
+    return {"queries": total, "elapsed_s": round(elapsed, 3), "qps": round(total / elapsed, 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Captive portal DNS responder")
+    parser.add_argument("--address", default="10.42.0.1", help="address returned for A queries")
+    parser.add_argument("--port", type=int, default=config.DNS_RESPONDER_PORT, help="port to listen on")
+    parser.add_argument("--benchmark", action="store_true", help="measure queries per second on loopback")
+    parser.add_argument("--duration", type=float, default=5.0, help="benchmark length in seconds (default 5)")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent benchmark clients (default 4)")
+    args = parser.parse_args()
+    
+    if args.benchmark:
+        result = benchmark(args.duration, args.clients)
+        print(f"{result['queries']} queries in {result['elapsed_s']} s: {result['qps']} queries/s")
+        return
+    
+    responder = DNSResponder(address=args.address, port=args.port)
+    if not responder.start():
+        raise SystemExit(1)
+    try:
+        responder.thread.join()
+    except KeyboardInterrupt:
+        responder.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# failure_cache.py - Remember failing saved networks and back off from retrying them
+
+import json
+import logging
+import os
+import random
+import time
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("/var/log/captive-portal.log"),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger("failure_cache")
+
+# Where failure records are kept so they survive restarts
+FAILURE_CACHE_PATH = "/var/lib/captive-portal/failures.json"
+
+# Failure kinds
+AUTH_FAILURE = "auth"
+OUT_OF_RANGE = "out_of_range"
+OTHER_FAILURE = "other"
+
+# Backoff (seconds) after the first failure and the cap, per failure kind.
+# Bad credentials will not fix themselves, so they back off much longer.
+BACKOFF = {
+    AUTH_FAILURE: (300, 6 * 3600),
+    OUT_OF_RANGE: (30, 1800),
+    OTHER_FAILURE: (60, 3600),
+}
+
+# Random spread applied to each backoff, as a fraction of its length
+BACKOFF_JITTER = 0.2
+
+# Scan signal (%) at which an out-of-range network is retried despite its backoff
+STRONG_SIGNAL = 60
+
+# Fragments of nmcli error output, lower-cased, that identify each failure kind
+AUTH_ERRORS = ("secrets were required", "no secrets", "802-1x", "authentication", "4-way handshake")
+OUT_OF_RANGE_ERRORS = ("could not be found", "no network with ssid", "not found")
+
+class FailureCache:
+    """
+    Persistent per-profile record of failed connection attempts
+    """
+    
+    def __init__(self, path=FAILURE_CACHE_PATH):
+        """
+        Args:
+            path (str): File the records are stored in
+        """
+        self.path = path
+        self.records = {}
+        self.load()
+    
+    def load(self):
+        """
+        Load the failure records from disk, starting empty if they are unreadable
+        """
+        try:
+            with open(self.path) as f:
+                records = json.load(f)
+            if isinstance(records, dict):
+                self.records = records
+        except FileNotFoundError:
+            self.records = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read failure cache {self.path}: {e}")
+            self.records = {}
+    
+    def save(self):
+        """
+        Write the failure records to disk atomically
+        """
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.records, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write failure cache {self.path}: {e}")
+    
+    @staticmethod
+    def classify_failure(error_output):
+        """
+        Work out why a connection attempt failed from nmcli's error output
+        
+        Args:
+            error_output (str): stderr of the failed nmcli command
+        
+        Returns:
+            str: AUTH_FAILURE, OUT_OF_RANGE or OTHER_FAILURE
+        """
+        error_output = (error_output or "").lower()
+        
+        if any(fragment in error_output for fragment in AUTH_ERRORS):
+            return AUTH_FAILURE
+        if any(fragment in error_output for fragment in OUT_OF_RANGE_ERRORS):
+            return OUT_OF_RANGE
+        return OTHER_FAILURE
+    
+    def record_failure(self, profile, kind):
+        """
+        Record a failed attempt and schedule the next allowed retry
+        
+        Args:
+            profile (str): Connection profile name
+            kind (str): Failure kind from classify_failure()
+        
+        Returns:
+            float: Seconds until the profile will be retried
+        """
+        record = self.records.get(profile, {})
+        
+        # A different kind of failure starts a fresh backoff sequence
+        failures = record.get("failures", 0) + 1 if record.get("kind") == kind else 1
+        
+        base, cap = BACKOFF.get(kind, BACKOFF[OTHER_FAILURE])
+        delay = min(base * (2 ** (failures - 1)), cap)
+        delay *= random.uniform(1 - BACKOFF_JITTER, 1 + BACKOFF_JITTER)
+        
+        self.records[profile] = {
+            "kind": kind,
+            "failures": failures,
+            "last_failure": time.time(),
+            "retry_after": time.time() + delay,
+        }
+        self.save()
+        
+        logger.info(f"Backing off from {profile} for {delay:.0f}s ({kind}, failure {failures})")
+        return delay
+    
+    def record_success(self, profile):
+        """
+        Clear the failure record of a profile that connected successfully
+        
+        Args:
+            profile (str): Connection profile name
+        """
+        if self.records.pop(profile, None) is not None:
+            logger.info(f"Cleared failure record for {profile}")
+            self.save()
+    
+    def next_retry(self, profiles):
+        """
+        Get the time until the first of some profiles is due for a retry
+        
+        Args:
+            profiles (list): Connection profile names
+        
+        Returns:
+            float: Seconds until the earliest backoff among them ends, or
+            None if none of them is backing off
+        """
+        now = time.time()
+        remaining = [
+            self.records[profile].get("retry_after", 0) - now
+            for profile in profiles if profile in self.records
+        ]
+        remaining = [seconds for seconds in remaining if seconds > 0]
+        return min(remaining) if remaining else None
+    
+    def should_skip(self, profile, signal=None):
+        """
+        Decide whether a profile should be skipped because it is backing off
+        
+        Args:
+            profile (str): Connection profile name
+            signal (int, optional): Signal strength from the latest scan
+        
+        Returns:
+            tuple: (skip, reason) where reason describes why it is skipped
+        """
+        record = self.records.get(profile)
+        if not record:
+            return False, None
+        
+        remaining = record.get("retry_after", 0) - time.time()
+        if remaining <= 0:
+            return False, None
+        
+        # A network that was out of range is worth retrying once it shows up strongly
+        if record.get("kind") != AUTH_FAILURE and signal is not None and signal >= STRONG_SIGNAL:
+            return False, None
+        
+        return True, f"{record.get('kind')} failure, retry in {remaining:.0f}s"
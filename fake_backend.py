@@ -0,0 +1,564 @@
+#!/usr/bin/env python3
+# fake_backend.py - In-memory stand-in for NetworkManager and the wireless hardware
+#
+# The fake backend answers the nmcli, ip, iw and ping commands issued by the
+# captive portal from a simulated radio environment, so the portal and the
+# connection monitor can be exercised on a machine without Wi-Fi hardware.
+# Enable it with CAPTIVE_PORTAL_FAKE_BACKEND=1.
+
+import asyncio
+import subprocess
+import threading
+import time
+import uuid
+
+# Networks visible to the simulated radios
+DEFAULT_NETWORKS = [
+    {"ssid": "Marina-Guest", "bssid": "02:00:00:00:01:01", "signal": 78, "security": "", "psk": None, "chan": 6},
+    {"ssid": "HarbourMaster", "bssid": "02:00:00:00:02:01", "signal": 64, "security": "WPA2", "psk": "harbour123", "chan": 1},
+    {"ssid": "HarbourMaster", "bssid": "02:00:00:00:02:02", "signal": 31, "security": "WPA2", "psk": "harbour123", "chan": 11},
+    {"ssid": "Yacht-Club", "bssid": "02:00:00:00:03:01", "signal": 41, "security": "WPA1 WPA2", "psk": "regatta2024", "chan": 6},
+    {"ssid": "OldBoathouse", "bssid": "02:00:00:00:04:01", "signal": 22, "security": "WEP", "psk": "12345", "chan": 3},
+    {"ssid": "", "bssid": "02:00:00:00:05:01", "signal": 15, "security": "WPA2", "psk": None, "chan": 9},
+]
+
+# Exit code nmcli uses when NetworkManager is not running
+NMCLI_NOT_RUNNING = 8
+
+
+def _escape(value):
+    """
+    Escape a value the way nmcli does in terse mode
+    """
+    return str(value).replace("\\", "\\\\").replace(":", "\\:")
+
+
+class FakeBackend:
+    """
+    Simulated NetworkManager, wireless interfaces and radio environment
+    """
+    
+    def __init__(self, radios=("wlan0",), concurrent=True, networks=None, latency=0.0):
+        """
+        Args:
+            radios (tuple): Names of the physical wireless interfaces
+            concurrent (bool): Whether each radio supports a simultaneous AP and station
+            networks (list, optional): Networks visible to the radios
+            latency (float): Seconds each command takes, to mimic the cost of forking nmcli
+        """
+        self.lock = threading.RLock()
+        self.latency = latency
+        self.concurrent = concurrent
+        self.nm_running = True
+        self.networks = [dict(n) for n in (networks if networks is not None else DEFAULT_NETWORKS)]
+        self.commands = []
+        
+        self.devices = {}
+        for index, name in enumerate(radios):
+            self.devices[name] = {"type": "wifi", "phy": index, "virtual": False, "active": None, "bssid": None}
+        
+        self.connections = {}
+        self._add_connection(
+            name="JLBMaritime", ssid="JLBMaritime", mode="ap",
+            ifname=radios[0] if radios else None, psk="Admin", key_mgmt="wpa-psk"
+        )
+    
+    # ------------------------------------------------------------------
+    # Command dispatch
+    # ------------------------------------------------------------------
+    
+    def run(self, cmd, capture_output=False, text=False, check=False, **kwargs):
+        """
+        Execute a command against the simulated system
+        
+        Accepts the same arguments as subprocess.run.
+        
+        Returns:
+            subprocess.CompletedProcess: The result of the command
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        
+        cmd = list(cmd)
+        with self.lock:
+            self.commands.append(cmd)
+            program = cmd[0] if cmd else ""
+            handler = {
+                "nmcli": self._nmcli,
+                "ip": self._ip,
+                "iw": self._iw,
+                "ping": self._ping,
+                "systemctl": self._systemctl,
+            }.get(program)
+            
+            if handler is None:
+                returncode, stdout, stderr = 0, "", ""
+            else:
+                returncode, stdout, stderr = handler(cmd[1:])
+        
+        if not capture_output and kwargs.get("stdout") is None:
+            stdout, stderr = None, None
+        elif not text:
+            stdout, stderr = stdout.encode(), stderr.encode()
+        
+        if check and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, output=stdout, stderr=stderr)
+        
+        return subprocess.CompletedProcess(cmd, returncode, stdout, stderr)
+    
+    async def run_async(self, cmd, timeout=None):
+        """
+        Execute a command against the simulated system from a coroutine
+        
+        Returns:
+            subprocess.CompletedProcess: The result, with text output
+        """
+        return await asyncio.to_thread(self.run, cmd, capture_output=True, text=True)
+    
+    # ------------------------------------------------------------------
+    # Simulated state helpers
+    # ------------------------------------------------------------------
+    
+    def _add_connection(self, name, ssid, mode="infrastructure", ifname=None, psk=None, key_mgmt=None):
+        connection = {
+            "uuid": str(uuid.uuid4()),
+            "name": name,
+            "type": "802-11-wireless",
+            "ssid": ssid,
+            "mode": mode,
+            "ifname": ifname,
+            "psk": psk,
+            "key_mgmt": key_mgmt,
+            "autoconnect": "yes",
+            "timestamp": 0,
+        }
+        self.connections[connection["uuid"]] = connection
+        return connection
+    
+    def _find_connection(self, args):
+        """
+        Resolve a connection identifier given as NAME, UUID, 'id NAME' or 'uuid UUID'
+        
+        Returns:
+            tuple: (connection or None, remaining args)
+        """
+        if not args:
+            return None, args
+        if args[0] in ("id", "uuid") and len(args) > 1:
+            key, value, rest = args[0], args[1], args[2:]
+        else:
+            key, value, rest = None, args[0], args[1:]
+        
+        for connection in self.connections.values():
+            if key in (None, "uuid") and connection["uuid"] == value:
+                return connection, rest
+            if key in (None, "id") and connection["name"] == value:
+                return connection, rest
+        return None, rest
+    
+    def _device_of(self, connection):
+        for name, device in self.devices.items():
+            if device["active"] == connection["uuid"]:
+                return name
+        return None
+    
+    def _wifi_devices(self, physical_only=False):
+        return [
+            name for name, device in self.devices.items()
+            if device["type"] == "wifi" and not (physical_only and device["virtual"])
+        ]
+    
+    def _visible(self, ssid, bssid=None):
+        return [
+            n for n in self.networks
+            if n["ssid"] == ssid and (bssid is None or n["bssid"].lower() == bssid.lower())
+        ]
+    
+    def _ip_for(self, device_name, connection):
+        if connection["mode"] == "ap":
+            return "10.42.0.1/24"
+        return f"192.168.1.{50 + sorted(self.devices).index(device_name)}/24"
+    
+    def _activate(self, connection, ifname=None, bssid=None):
+        """
+        Activate a connection on a device
+        
+        Returns:
+            tuple: (returncode, stdout, stderr)
+        """
+        device_name = ifname or connection["ifname"]
+        if device_name is None:
+            device_name = next(iter(self._wifi_devices(physical_only=True)), None)
+        if device_name not in self.devices:
+            return 10, "", f"Error: Connection activation failed: No suitable device found for this connection (device {device_name} not available).\n"
+        
+        if connection["mode"] != "ap":
+            visible = self._visible(connection["ssid"], bssid)
+            if not visible:
+                return 4, "", "Error: Connection activation failed: (53) The Wi-Fi network could not be found.\n"
+            if visible[0]["psk"] is not None and connection["psk"] != visible[0]["psk"]:
+                return 4, "", "Error: Connection activation failed: Secrets were required, but not provided.\n"
+            # Without a BSSID, NetworkManager picks the strongest access point
+            bssid = max(visible, key=lambda n: n["signal"])["bssid"]
+        
+        # A connection can only be active on one device at a time
+        for device in self.devices.values():
+            if device["active"] == connection["uuid"]:
+                device["active"] = None
+        
+        self.devices[device_name]["active"] = connection["uuid"]
+        self.devices[device_name]["bssid"] = bssid if connection["mode"] != "ap" else None
+        connection["timestamp"] = int(time.time())
+        path = len(self.commands)
+        return 0, f"Connection successfully activated (D-Bus active path: /org/freedesktop/NetworkManager/ActiveConnection/{path})\n", ""
+    
+    # ------------------------------------------------------------------
+    # nmcli
+    # ------------------------------------------------------------------
+    
+    def _nmcli(self, args):
+        terse = False
+        fields = None
+        values_only = False
+        
+        while args and args[0].startswith("-"):
+            option = args[0]
+            if option in ("-t", "--terse"):
+                terse = True
+                args = args[1:]
+            elif option in ("-f", "--fields") and len(args) > 1:
+                fields = args[1].split(",")
+                args = args[2:]
+            elif option in ("-w", "--wait") and len(args) > 1:
+                args = args[2:]
+            elif option in ("-g", "--get-values") and len(args) > 1:
+                fields = args[1].split(",")
+                terse = True
+                values_only = True
+                args = args[2:]
+            else:
+                args = args[1:]
+        
+        if not self.nm_running:
+            return NMCLI_NOT_RUNNING, "", "Error: NetworkManager is not running.\n"
+        
+        if not args:
+            return 0, "", ""
+        
+        if args[0] in ("general", "g"):
+            rows = [{"RUNNING": "running", "STARTUP": "started", "STATE": self._general_state()}]
+            return 0, self._table(rows, fields or ["RUNNING", "STATE"], terse), ""
+        
+        if args[0] in ("device", "dev", "d"):
+            return self._nmcli_device(args[1:], fields, terse)
+        
+        if args[0] in ("connection", "con", "c"):
+            return self._nmcli_connection(args[1:], fields, terse, values_only)
+        
+        return 2, "", f"Error: argument '{args[0]}' not understood.\n"
+    
+    def _general_state(self):
+        for device in self.devices.values():
+            connection = self.connections.get(device["active"])
+            if connection and connection["mode"] != "ap":
+                return "connected (site only)"
+        return "disconnected"
+    
+    def _table(self, rows, fields, terse):
+        lines = []
+        for row in rows:
+            if terse:
+                lines.append(":".join(_escape(row.get(field, "")) for field in fields))
+            else:
+                lines.append("  ".join(str(row.get(field, "")) for field in fields))
+        return "\n".join(lines) + ("\n" if lines else "")
+    
+    def _device_rows(self):
+        rows = [{"DEVICE": "lo", "TYPE": "loopback", "STATE": "unmanaged", "CONNECTION": "--"}]
+        for name in sorted(self.devices):
+            connection = self.connections.get(self.devices[name]["active"])
+            rows.append({
+                "DEVICE": name,
+                "TYPE": "wifi",
+                "STATE": "connected" if connection else "disconnected",
+                "CONNECTION": connection["name"] if connection else "--",
+            })
+        return rows
+    
+    def _scan_rows(self, ifname=None, ssid=None, bssid=None):
+        rows = []
+        active_bssids = set()
+        for name, device in self.devices.items():
+            if ifname is not None and name != ifname:
+                continue
+            connection = self.connections.get(device["active"])
+            if connection and connection["mode"] != "ap":
+                active_bssids.add(device["bssid"])
+        
+        # Our own AP is visible to any other radio in range
+        networks = list(self.networks)
+        for connection in self.connections.values():
+            if connection["mode"] == "ap" and self._device_of(connection):
+                networks.append({
+                    "ssid": connection["ssid"], "bssid": "02:00:00:00:00:01", "signal": 100,
+                    "security": "WPA2", "psk": connection["psk"], "chan": 6,
+                })
+        
+        for network in sorted(networks, key=lambda n: -n["signal"]):
+            if ssid is not None and network["ssid"] != ssid:
+                continue
+            if bssid is not None and network["bssid"].lower() != bssid.lower():
+                continue
+            rows.append({
+                "IN-USE": "*" if network["bssid"] in active_bssids else "",
+                "SSID": network["ssid"],
+                "BSSID": network["bssid"],
+                "SIGNAL": network["signal"],
+                "SECURITY": network["security"],
+                "CHAN": network["chan"],
+                "FREQ": f"{2407 + 5 * network['chan']} MHz",
+            })
+        return rows
+    
+    def _nmcli_device(self, args, fields, terse):
+        if not args or args[0] in ("status", "s"):
+            return 0, self._table(self._device_rows(), fields or ["DEVICE", "TYPE", "STATE", "CONNECTION"], terse), ""
+        
+        if args[0] != "wifi" or len(args) < 2:
+            return 2, "", "Error: argument not understood.\n"
+        
+        action, options = args[1], args[2:]
+        
+        if action in ("list", "l"):
+            opts = self._pairs(options)
+            rows = self._scan_rows(opts.get("ifname"), opts.get("ssid"), opts.get("bssid"))
+            return 0, self._table(rows, fields or ["IN-USE", "SSID", "SIGNAL", "SECURITY"], terse), ""
+        
+        if action == "rescan":
+            return 0, "", ""
+        
+        if action in ("connect", "c") and options:
+            ssid = options[0]
+            opts = self._pairs(options[1:])
+            visible = self._visible(ssid, opts.get("bssid"))
+            if not visible:
+                return 10, "", f"Error: No network with SSID '{ssid}' found.\n"
+            
+            connection = self._add_connection(
+                name=opts.get("name", ssid), ssid=ssid,
+                psk=opts.get("password"),
+                key_mgmt="wpa-psk" if visible[0]["security"] else None,
+            )
+            returncode, stdout, stderr = self._activate(connection, opts.get("ifname"), opts.get("bssid"))
+            if returncode != 0:
+                # NetworkManager removes the profile of a failed 'device wifi connect'
+                del self.connections[connection["uuid"]]
+                return returncode, stdout, stderr
+            device = self._device_of(connection)
+            return 0, f"Device '{device}' successfully activated with '{connection['uuid']}'.\n", ""
+        
+        return 2, "", "Error: argument not understood.\n"
+    
+    def _pairs(self, options):
+        return {options[i]: options[i + 1] for i in range(0, len(options) - 1, 2)}
+    
+    def _connection_row(self, connection):
+        device = self._device_of(connection)
+        return {
+            "NAME": connection["name"],
+            "UUID": connection["uuid"],
+            "TYPE": connection["type"],
+            "DEVICE": device or "--",
+            "STATE": "activated" if device else "",
+            "ACTIVE": "yes" if device else "no",
+            "TIMESTAMP": connection["timestamp"],
+            "AUTOCONNECT": connection["autoconnect"],
+        }
+    
+    def _connection_details(self, connection):
+        device = self._device_of(connection)
+        details = {
+            "connection.id": connection["name"],
+            "connection.uuid": connection["uuid"],
+            "connection.type": connection["type"],
+            "connection.interface-name": connection["ifname"] or "",
+            "connection.autoconnect": connection["autoconnect"],
+            "connection.timestamp": connection["timestamp"],
+            "802-11-wireless.ssid": connection["ssid"],
+            "802-11-wireless.mode": connection["mode"],
+            "802-11-wireless-security.key-mgmt": connection["key_mgmt"] or "",
+            "GENERAL.STATE": "activated" if device else "",
+            "GENERAL.DEVICES": device or "",
+        }
+        if device:
+            details["IP4.ADDRESS[1]"] = self._ip_for(device, connection)
+        return details
+    
+    def _nmcli_connection(self, args, fields, terse, values_only):
+        if not args or args[0] in ("show", "s"):
+            args = args[1:]
+            active_only = False
+            if args and args[0] == "--active":
+                active_only = True
+                args = args[1:]
+            
+            if args:
+                # Several profiles are printed one after another, separated by a blank line
+                records = []
+                while args:
+                    connection, args = self._find_connection(args)
+                    if connection is None:
+                        return 10, "", "Error: no such connection profile.\n"
+                    details = self._connection_details(connection)
+                    lines = []
+                    for field in fields or list(details):
+                        for key, value in details.items():
+                            if key == field or key.startswith(field + "["):
+                                if values_only:
+                                    lines.append(_escape(value) if len(fields) > 1 else str(value))
+                                else:
+                                    lines.append(f"{key}:{value}")
+                    records.append("".join(line + "\n" for line in lines))
+                return 0, "\n".join(records), ""
+            
+            rows = [
+                self._connection_row(c) for c in self.connections.values()
+                if not active_only or self._device_of(c)
+            ]
+            return 0, self._table(rows, fields or ["NAME", "UUID", "TYPE", "DEVICE"], terse), ""
+        
+        action, rest = args[0], args[1:]
+        
+        if action == "up":
+            connection, rest = self._find_connection(rest)
+            if connection is None:
+                return 10, "", "Error: unknown connection.\n"
+            opts = self._pairs(rest)
+            return self._activate(connection, opts.get("ifname"), opts.get("ap"))
+        
+        if action == "down":
+            connection, _ = self._find_connection(rest)
+            if connection is None or not self._device_of(connection):
+                return 10, "", "Error: no active connection provided.\n"
+            self.devices[self._device_of(connection)]["active"] = None
+            return 0, f"Connection '{connection['name']}' successfully deactivated.\n", ""
+        
+        if action == "delete":
+            connection, _ = self._find_connection(rest)
+            if connection is None:
+                return 10, "", "Error: unknown connection.\n"
+            device = self._device_of(connection)
+            if device:
+                self.devices[device]["active"] = None
+            del self.connections[connection["uuid"]]
+            return 0, f"Connection '{connection['name']}' ({connection['uuid']}) successfully deleted.\n", ""
+        
+        if action == "modify":
+            connection, rest = self._find_connection(rest)
+            if connection is None:
+                return 10, "", "Error: unknown connection.\n"
+            keys = {
+                "wifi-sec.psk": "psk",
+                "802-11-wireless-security.psk": "psk",
+                "connection.interface-name": "ifname",
+                "ifname": "ifname",
+                "connection.id": "name",
+                "connection.autoconnect": "autoconnect",
+            }
+            for key, value in self._pairs(rest).items():
+                if key in keys:
+                    connection[keys[key]] = value or None
+            return 0, "", ""
+        
+        if action == "add":
+            opts = self._pairs(rest)
+            connection = self._add_connection(
+                name=opts.get("con-name", opts.get("ssid", "Wi-Fi")),
+                ssid=opts.get("ssid", ""),
+                mode=opts.get("mode", "infrastructure"),
+                ifname=opts.get("ifname"),
+                psk=opts.get("wifi-sec.psk"),
+                key_mgmt=opts.get("wifi-sec.key-mgmt"),
+            )
+            return 0, f"Connection '{connection['name']}' ({connection['uuid']}) successfully added.\n", ""
+        
+        return 2, "", f"Error: argument '{action}' not understood.\n"
+    
+    # ------------------------------------------------------------------
+    # ip, iw, ping, systemctl
+    # ------------------------------------------------------------------
+    
+    def _ip(self, args):
+        # ip -o link show <iface>
+        if len(args) >= 4 and args[-2] == "show" and args[-1] not in ("lo", "eth0"):
+            if args[-1] not in self.devices:
+                return 1, "", f'Device "{args[-1]}" does not exist.\n'
+            args = args[:-1]
+        
+        lines = [
+            "1: lo: <LOOPBACK,UP,LOWER_UP> mtu 65536 qdisc noqueue state UNKNOWN mode DEFAULT group default qlen 1000\\    link/loopback 00:00:00:00:00:00 brd 00:00:00:00:00:00",
+            "2: eth0: <NO-CARRIER,BROADCAST,MULTICAST,UP> mtu 1500 qdisc mq state DOWN mode DEFAULT group default qlen 1000\\    link/ether 02:00:00:00:ee:01 brd ff:ff:ff:ff:ff:ff",
+        ]
+        for index, name in enumerate(sorted(self.devices), start=3):
+            lines.append(
+                f"{index}: {name}: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500 qdisc pfifo_fast state UP mode DORMANT group default qlen 1000"
+                f"\\    link/ether 02:00:00:00:aa:{index:02x} brd ff:ff:ff:ff:ff:ff"
+            )
+        return 0, "\n".join(lines) + "\n", ""
+    
+    def _iw(self, args):
+        if args == ["dev"]:
+            lines = []
+            for phy in sorted({d["phy"] for d in self.devices.values()}):
+                lines.append(f"phy#{phy}")
+                for name, device in sorted(self.devices.items()):
+                    if device["phy"] == phy:
+                        kind = "AP" if device["virtual"] else "managed"
+                        lines.append(f"\tInterface {name}")
+                        lines.append(f"\t\ttype {kind}")
+            return 0, "\n".join(lines) + "\n", ""
+        
+        if len(args) >= 3 and args[0] == "phy" and args[2] == "info":
+            combination = (
+                "\t\t * #{ managed } <= 1, #{ AP } <= 1, #{ P2P-device } <= 1,\n\t\t   total <= 3, #channels <= 1"
+                if self.concurrent else
+                "\t\t * #{ managed, AP } <= 1, #{ P2P-device } <= 1,\n\t\t   total <= 2, #channels <= 1"
+            )
+            return 0, (
+                f"Wiphy {args[1]}\n"
+                "\tSupported interface modes:\n\t\t * IBSS\n\t\t * managed\n\t\t * AP\n"
+                "\tvalid interface combinations:\n"
+                f"{combination}\n"
+            ), ""
+        
+        # iw dev <iface> interface add <name> type __ap
+        if len(args) >= 6 and args[0] == "dev" and args[2] == "interface" and args[3] == "add":
+            parent, name = args[1], args[4]
+            if parent not in self.devices:
+                return 237, "", "command failed: No such device (-19)\n"
+            if not self.concurrent:
+                return 161, "", "command failed: Operation not supported (-95)\n"
+            if name in self.devices:
+                return 233, "", "command failed: Too many open files in system (-23)\n"
+            self.devices[name] = {"type": "wifi", "phy": self.devices[parent]["phy"], "virtual": True, "active": None, "bssid": None}
+            return 0, "", ""
+        
+        # iw dev <iface> del
+        if len(args) == 3 and args[0] == "dev" and args[2] == "del":
+            if args[1] not in self.devices:
+                return 237, "", "command failed: No such device (-19)\n"
+            del self.devices[args[1]]
+            return 0, "", ""
+        
+        return 0, "", ""
+    
+    def _ping(self, args):
+        if self._general_state().startswith("connected"):
+            return 0, "1 packets transmitted, 1 received, 0% packet loss\n", ""
+        return 1, "1 packets transmitted, 0 received, 100% packet loss\n", ""
+    
+    def _systemctl(self, args):
+        if args[:2] == ["status", "NetworkManager"]:
+            state = "active (running)" if self.nm_running else "inactive (dead)"
+            return 0, f"* NetworkManager.service - Network Manager\n     Active: {state}\n", ""
+        return 0, "", ""
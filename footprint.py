@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# footprint.py - Compare the memory and startup cost of the two service layouts
+#
+# Starts the portal and the connection monitor on the fake NetworkManager
+# backend, first as two processes (captive-portal.service plus
+# connection-monitor.service) and then as one process with the monitor hosted
+# by the portal (CAPTIVE_PORTAL_SINGLE_PROCESS=1). Startup time is measured
+# up to the systemd READY=1 notification and memory is read from /proc once
+# the services have settled.
+#
+# Usage:
+#   python3 footprint.py            # print the comparison
+#   python3 footprint.py --json     # print it as JSON
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Time allowed for a service to report READY=1
+READY_TIMEOUT = 30
+
+# Time the services run after READY=1 before memory is measured
+SETTLE_TIME = 2.0
+
+def child_portal(single_process):
+    """
+    Run the portal the way app.py does, without touching the system network setup
+    """
+    from werkzeug.serving import make_server
+    import app
+    from sd_notify import SystemdNotifier
+    
+    if single_process:
+        from connection_monitor import ConnectionMonitor
+        app.monitor = ConnectionMonitor()
+        app.monitor.start_in_thread()
+        # Hosted, the monitor is up once its tasks are running
+        while not app.monitor.tasks:
+            time.sleep(0.01)
+    
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    SystemdNotifier.ready("serving")
+    server.serve_forever()
+
+def memory_of(pid):
+    """
+    Read the memory use of a process
+    
+    Returns:
+        dict: rss_kb and pss_kb (proportional set size, which splits shared
+        pages between processes; None if the kernel does not provide it)
+    """
+    memory = {"rss_kb": None, "pss_kb": None}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                memory["rss_kb"] = int(line.split()[1])
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    memory["pss_kb"] = int(line.split()[1])
+    except OSError:
+        pass
+    return memory
+
+def start_service(cmd, env, notify_dir):
+    """
+    Start a service and wait for its READY=1 notification
+    
+    Returns:
+        tuple: (process, seconds until ready)
+    """
+    path = os.path.join(notify_dir, f"notify-{len(os.listdir(notify_dir))}")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(path)
+    sock.settimeout(READY_TIMEOUT)
+    
+    env = dict(env, NOTIFY_SOCKET=path)
+    began = time.perf_counter()
+    proc = subprocess.Popen(cmd, env=env, cwd=SCRIPT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    
+    try:
+        while b"READY=1" not in sock.recv(4096):
+            pass
+    except socket.timeout:
+        proc.kill()
+        raise SystemExit(f"{' '.join(cmd)} did not become ready within {READY_TIMEOUT}s")
+    finally:
+        sock.close()
+    
+    return proc, time.perf_counter() - began
+
+def measure(layout):
+    """
+    Start one layout and measure it
+    
+    Args:
+        layout (str): "two-process" or "single-process"
+    
+    Returns:
+        dict: Per-process startup time and memory, and totals
+    """
+    env = dict(os.environ, CAPTIVE_PORTAL_FAKE_BACKEND="1")
+    
+    if layout == "single-process":
+        env["CAPTIVE_PORTAL_SINGLE_PROCESS"] = "1"
+        services = {"portal+monitor": [sys.executable, __file__, "--child", "single"]}
+    else:
+        services = {
+            "portal": [sys.executable, __file__, "--child", "portal"],
+            "monitor": [sys.executable, os.path.join(SCRIPT_DIR, "connection_monitor.py")],
+        }
+    
+    processes = {}
+    result = {"layout": layout, "processes": {}}
+    with tempfile.TemporaryDirectory() as notify_dir:
+        try:
+            for name, cmd in services.items():
+                proc, startup = start_service(cmd, env, notify_dir)
+                processes[name] = proc
+                result["processes"][name] = {"startup_s": round(startup, 3)}
+            
+            time.sleep(SETTLE_TIME)
+            for name, proc in processes.items():
+                result["processes"][name].update(memory_of(proc.pid))
+        finally:
+            for proc in processes.values():
+                proc.terminate()
+                proc.wait()
+    
+    stats = result["processes"].values()
+    result["startup_s"] = round(sum(p["startup_s"] for p in stats), 3)
+    result["rss_kb"] = sum(p["rss_kb"] for p in stats)
+    result["pss_kb"] = sum(p["pss_kb"] for p in stats) if all(p["pss_kb"] is not None for p in stats) else None
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the two-process and single-process service layouts")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--child", choices=("portal", "single"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        child_portal(args.child == "single")
+        return
+    
+    results = [measure("two-process"), measure("single-process")]
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    
+    print(f"{'layout':<18}{'process':<17}{'startup s':>10}{'RSS MiB':>10}{'PSS MiB':>10}")
+    for result in results:
+        for name, stats in result["processes"].items():
+            pss = f"{stats['pss_kb'] / 1024:.1f}" if stats["pss_kb"] is not None else "-"
+            print(f"{result['layout']:<18}{name:<17}{stats['startup_s']:>10}{stats['rss_kb'] / 1024:>10.1f}{pss:>10}")
+        pss = f"{result['pss_kb'] / 1024:.1f}" if result["pss_kb"] is not None else "-"
+        print(f"{result['layout']:<18}{'total':<17}{result['startup_s']:>10}{result['rss_kb'] / 1024:>10.1f}{pss:>10}")
+
+if __name__ == "__main__":
+    main()
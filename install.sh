@@ -43,8 +43,14 @@ create_directories() {
     # Create log directory if it doesn't exist
     mkdir -p /var/log
     
+    # Create the state directory shared by the portal and the monitor: the
+    # monitor's failure cache and the portal's profiles. In single-process
+    # mode the monitor runs as JLBMaritime, so the whole directory is theirs.
+    mkdir -p /var/lib/captive-portal/profiles
+    
     # Set permissions
     chown -R JLBMaritime:JLBMaritime /opt/captive-portal
+    chown -R JLBMaritime:JLBMaritime /var/lib/captive-portal
 }
 
 # Function to copy files
@@ -59,6 +65,18 @@ copy_files() {
     cp "$SCRIPT_DIR/network_manager.py" /opt/captive-portal/
     cp "$SCRIPT_DIR/access_point.py" /opt/captive-portal/
     cp "$SCRIPT_DIR/connection_monitor.py" /opt/captive-portal/
+    cp "$SCRIPT_DIR/config.py" /opt/captive-portal/
+    cp "$SCRIPT_DIR/fake_backend.py" /opt/captive-portal/
+    cp "$SCRIPT_DIR/failure_cache.py" /opt/captive-portal/
+    cp "$SCRIPT_DIR/dhcp_leases.py" /opt/captive-portal/
+    cp "$SCRIPT_DIR/dns_responder.py" /opt/captive-portal/
+    cp "$SCRIPT_DIR/sd_notify.py" /opt/captive-portal/
+    cp "$SCRIPT_DIR/tls_abort.py" /opt/captive-portal/
+    cp "$SCRIPT_DIR/captive_state.py" /opt/captive-portal/
+    cp "$SCRIPT_DIR/profiling.py" /opt/captive-portal/
+    cp "$SCRIPT_DIR/scan_history.py" /opt/captive-portal/
+    cp "$SCRIPT_DIR/nm_health.py" /opt/captive-portal/
+    cp "$SCRIPT_DIR/radio_queue.py" /opt/captive-portal/
     
     # Copy static files
     cp "$SCRIPT_DIR/static/css/style.css" /opt/captive-portal/static/css/
@@ -87,6 +105,9 @@ copy_files() {
 setup_services() {
     print_message "Setting up systemd services..."
     
+    # Group allowed to send connect requests to the connection monitor
+    groupadd --system -f captive-portal
+    
     # Create captive portal service
     cat > /etc/systemd/system/captive-portal.service << EOF
 [Unit]
@@ -94,8 +115,13 @@ Description=JLBMaritime Captive Portal
 After=network.target
 
 [Service]
+Type=notify
+NotifyAccess=main
+WatchdogSec=30
 User=JLBMaritime
+SupplementaryGroups=captive-portal
 WorkingDirectory=/opt/captive-portal
+EnvironmentFile=-/etc/default/captive-portal
 ExecStart=/usr/bin/python3 /opt/captive-portal/app.py
 Restart=always
 RestartSec=5
@@ -111,7 +137,15 @@ Description=JLBMaritime Connection Monitor
 After=network.target
 
 [Service]
-Type=simple
+Type=notify
+NotifyAccess=main
+WatchdogSec=30
+TimeoutStartSec=90
+SuccessExitStatus=78
+RestartPreventExitStatus=78
+RuntimeDirectory=captive-portal
+RuntimeDirectoryMode=0755
+EnvironmentFile=-/etc/default/captive-portal
 ExecStart=/usr/bin/python3 /opt/captive-portal/connection_monitor.py
 Restart=always
 RestartSec=10
@@ -120,6 +154,27 @@ RestartSec=10
 WantedBy=multi-user.target
 EOF
 
+    # Create the settings file read by both services
+    if [ ! -f /etc/default/captive-portal ]; then
+        cat > /etc/default/captive-portal << EOF
+# JLBMaritime Captive Portal settings
+# Run the portal AP and the Wi-Fi client connection at the same time
+#CAPTIVE_PORTAL_CONCURRENT=1
+#CAPTIVE_PORTAL_AP_INTERFACE=ap0
+# Answer portal DNS in-process instead of reconfiguring dnsmasq
+#CAPTIVE_PORTAL_DNS_RESPONDER=1
+#CAPTIVE_PORTAL_DNS_PORT=5300
+# How HTTPS from portal clients is handled: reject, abort or redirect
+#CAPTIVE_PORTAL_HTTPS_POLICY=reject
+# Enable the admin profiling endpoints and Server-Timing headers
+#CAPTIVE_PORTAL_PROFILING=1
+# Run the connection monitor inside the portal process (saves memory)
+#CAPTIVE_PORTAL_SINGLE_PROCESS=1
+# Move to a clearly stronger saved network or access point before the link fails
+#CAPTIVE_PORTAL_ROAMING=1
+EOF
+    fi
+
     # Reload systemd
     systemctl daemon-reload
     
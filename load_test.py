@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# load_test.py - Load test for the captive portal HTTP endpoints
+#
+# Starts the Flask app on the fake NetworkManager backend and simulates a
+# crowd of phones and laptops joining the access point at once. Each client
+# sends the captive portal probes of its operating system, loads the portal
+# and scans for networks. Throughput and per-route latency percentiles are
+# reported and can be compared against a stored baseline.
+#
+# Optionally, extra clients attempt HTTPS at the same time, as browsers do
+# in the background, handled according to one of the HTTPS policies. The
+# report then shows how long each attempt held a connection and the peak
+# number of portal worker threads in use.
+#
+# Usage:
+#   python3 load_test.py                      # run and print the report
+#   python3 load_test.py --save-baseline      # store the results as the baseline
+#   python3 load_test.py --check-baseline     # exit 1 if the baseline regressed
+#   python3 load_test.py --https-clients 20 --https-policy redirect
+
+import argparse
+import http.client
+import json
+import logging
+import math
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+# The load test never touches the real network configuration
+os.environ["CAPTIVE_PORTAL_FAKE_BACKEND"] = "1"
+
+from werkzeug.serving import make_server
+
+import config
+from app import app
+from network_manager import NetworkManager
+from tls_abort import TLSAbortListener
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "load_test_baseline.json")
+
+# Address the portal is served on, as seen by clients
+PORTAL_HOST = "10.42.0.1:5000"
+
+# Request sequences sent by each kind of client when it joins the AP:
+# (route label, path, Host header, User-Agent)
+CLIENT_PROFILES = {
+    "ios": [
+        ("/hotspot-detect.html", "/hotspot-detect.html", "captive.apple.com", "CaptiveNetworkSupport-443.0.1 wispr"),
+        ("/", "/", PORTAL_HOST, "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148"),
+        ("/static", "/static/css/style.css", PORTAL_HOST, "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X)"),
+        ("/static", "/static/js/main.js", PORTAL_HOST, "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X)"),
+        ("/scan", "/scan", PORTAL_HOST, "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X)"),
+    ],
+    "android": [
+        ("/generate_204", "/generate_204", "connectivitycheck.gstatic.com", "Dalvik/2.1.0 (Linux; U; Android 14; Pixel 8)"),
+        ("/generate_204", "/generate_204", "www.google.com", "Dalvik/2.1.0 (Linux; U; Android 14; Pixel 8)"),
+        ("/", "/", PORTAL_HOST, "Mozilla/5.0 (Linux; Android 14; Pixel 8) Chrome/120.0 Mobile Safari/537.36"),
+        ("/static", "/static/css/style.css", PORTAL_HOST, "Mozilla/5.0 (Linux; Android 14; Pixel 8) Chrome/120.0"),
+        ("/static", "/static/js/main.js", PORTAL_HOST, "Mozilla/5.0 (Linux; Android 14; Pixel 8) Chrome/120.0"),
+        ("/scan", "/scan", PORTAL_HOST, "Mozilla/5.0 (Linux; Android 14; Pixel 8) Chrome/120.0"),
+    ],
+    "windows": [
+        ("/connecttest.txt", "/connecttest.txt", "www.msftconnecttest.com", "Microsoft NCSI"),
+        ("/ncsi.txt", "/ncsi.txt", "www.msftncsi.com", "Microsoft NCSI"),
+        ("/", "/", PORTAL_HOST, "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Edge/120.0"),
+        ("/static", "/static/css/style.css", PORTAL_HOST, "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Edge/120.0"),
+        ("/static", "/static/js/main.js", PORTAL_HOST, "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Edge/120.0"),
+        ("/scan", "/scan", PORTAL_HOST, "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Edge/120.0"),
+    ],
+}
+
+# A minimal TLS 1.2 ClientHello, as sent first by a browser opening an HTTPS page
+_HELLO_BODY = (
+    b"\x03\x03" + bytes(32) + b"\x00"          # version, random, empty session ID
+    + b"\x00\x04\x13\x01\xc0\x2f"             # two cipher suites
+    + b"\x01\x00"                             # null compression
+)
+_HELLO_HANDSHAKE = b"\x01" + len(_HELLO_BODY).to_bytes(3, "big") + _HELLO_BODY
+CLIENT_HELLO = b"\x16\x03\x01" + struct.pack(">H", len(_HELLO_HANDSHAKE)) + _HELLO_HANDSHAKE
+
+def percentile(samples, fraction):
+    """
+    Nearest-rank percentile of a list of samples
+    
+    Args:
+        samples (list): Sorted samples
+        fraction (float): Percentile as a fraction, e.g. 0.95
+    
+    Returns:
+        float: The percentile value, or 0 for no samples
+    """
+    if not samples:
+        return 0.0
+    index = max(0, min(len(samples) - 1, math.ceil(fraction * len(samples)) - 1))
+    return samples[index]
+
+class LoadTest:
+    """
+    Runs simulated clients against an in-process portal server
+    """
+    
+    def __init__(self, clients, rounds, nmcli_latency, https_clients=0, https_policy="reject", https_timeout=5.0):
+        """
+        Args:
+            clients (int): Number of simultaneous clients
+            rounds (int): How many times each client repeats its request sequence
+            nmcli_latency (float): Simulated cost of each nmcli call in seconds
+            https_clients (int): Number of additional clients attempting HTTPS
+            https_policy (str): How HTTPS is handled: reject, abort or redirect
+            https_timeout (float): How long an HTTPS client waits for the handshake
+        """
+        self.clients = clients
+        self.rounds = rounds
+        self.nmcli_latency = nmcli_latency
+        self.https_clients = https_clients
+        self.https_policy = https_policy
+        self.https_timeout = https_timeout
+        
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        
+        # How long each HTTPS attempt held its connection, and how it ended
+        self.https_holds = []
+        self.https_outcomes = {}
+        self.peak_workers = 0
+    
+    def record(self, route, elapsed, error):
+        with self.lock:
+            self.latencies.setdefault(route, []).append(elapsed)
+            if error:
+                self.errors[route] = self.errors.get(route, 0) + 1
+    
+    def client(self, port, profile, start):
+        """
+        Send one client's request sequence
+        """
+        start.wait()
+        for _ in range(self.rounds):
+            for route, path, host, user_agent in CLIENT_PROFILES[profile]:
+                # Phones open a fresh connection for each probe
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                began = time.perf_counter()
+                error = False
+                try:
+                    conn.request("GET", path, headers={"Host": host, "User-Agent": user_agent})
+                    response = conn.getresponse()
+                    response.read()
+                    error = response.status >= 500
+                except (OSError, http.client.HTTPException):
+                    error = True
+                finally:
+                    conn.close()
+                self.record(route, time.perf_counter() - began, error)
+    
+    def https_client(self, port, start):
+        """
+        Repeatedly start a TLS handshake and wait for it to fail
+        """
+        start.wait()
+        for _ in range(self.rounds):
+            began = time.perf_counter()
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(self.https_timeout)
+            try:
+                sock.connect(("127.0.0.1", port))
+                sock.sendall(CLIENT_HELLO)
+                outcome = "closed" if not sock.recv(4096) else "answered"
+            except ConnectionRefusedError:
+                outcome = "refused"
+            except ConnectionResetError:
+                outcome = "reset"
+            except socket.timeout:
+                outcome = "timeout"
+            except OSError:
+                outcome = "error"
+            finally:
+                sock.close()
+            
+            with self.lock:
+                self.https_holds.append(time.perf_counter() - began)
+                self.https_outcomes[outcome] = self.https_outcomes.get(outcome, 0) + 1
+    
+    def sample_workers(self, done):
+        """
+        Record the peak number of portal worker threads until done is set
+        """
+        while not done.is_set():
+            workers = sum(1 for thread in threading.enumerate() if "process_request_thread" in thread.name)
+            self.peak_workers = max(self.peak_workers, workers)
+            time.sleep(0.005)
+    
+    def https_target(self, server):
+        """
+        Set up what an HTTPS connection reaches under the chosen policy
+        
+        Returns:
+            tuple: (port, cleanup function)
+        """
+        if self.https_policy == "redirect":
+            # The original behaviour: HTTPS lands on the HTTP portal
+            return server.server_port, lambda: None
+        
+        if self.https_policy == "abort":
+            listener = TLSAbortListener("127.0.0.1", 0)
+            listener.start()
+            return listener.port, listener.stop
+        
+        # A firewall reset is what the kernel sends for a port nobody listens on
+        placeholder = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        placeholder.bind(("127.0.0.1", 0))
+        return placeholder.getsockname()[1], placeholder.close
+    
+    def run(self):
+        """
+        Run the load test
+        
+        Returns:
+            dict: Report with overall throughput and per-route statistics
+        """
+        NetworkManager.backend.latency = self.nmcli_latency
+        
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        
+        profiles = list(CLIENT_PROFILES)
+        start = threading.Event()
+        threads = [
+            threading.Thread(target=self.client, args=(server.server_port, profiles[i % len(profiles)], start))
+            for i in range(self.clients)
+        ]
+        
+        https_port, https_cleanup = self.https_target(server)
+        https_threads = [
+            threading.Thread(target=self.https_client, args=(https_port, start))
+            for _ in range(self.https_clients)
+        ]
+        
+        for thread in threads + https_threads:
+            thread.start()
+        
+        done = threading.Event()
+        sampler = threading.Thread(target=self.sample_workers, args=(done,), daemon=True)
+        sampler.start()
+        
+        began = time.perf_counter()
+        start.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+        for thread in https_threads:
+            thread.join()
+        
+        done.set()
+        sampler.join()
+        https_cleanup()
+        server.shutdown()
+        
+        total = sum(len(samples) for samples in self.latencies.values())
+        routes = {}
+        for route, samples in sorted(self.latencies.items()):
+            samples.sort()
+            routes[route] = {
+                "requests": len(samples),
+                "errors": self.errors.get(route, 0),
+                "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+            }
+        
+        report = {
+            "clients": self.clients,
+            "rounds": self.rounds,
+            "nmcli_latency_ms": round(self.nmcli_latency * 1000, 2),
+            "requests": total,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+            "routes": routes,
+        }
+        
+        if self.https_clients:
+            holds = sorted(self.https_holds)
+            report["https"] = {
+                "policy": self.https_policy,
+                "clients": self.https_clients,
+                "attempts": len(holds),
+                "outcomes": dict(sorted(self.https_outcomes.items())),
+                "hold_p50_ms": round(percentile(holds, 0.50) * 1000, 2),
+                "hold_p95_ms": round(percentile(holds, 0.95) * 1000, 2),
+                "hold_max_ms": round(holds[-1] * 1000, 2) if holds else 0.0,
+                "peak_workers": self.peak_workers,
+            }
+        
+        return report
+
+def print_report(report):
+    print(f"{report['clients']} clients x {report['rounds']} rounds, nmcli latency {report['nmcli_latency_ms']} ms")
+    print(f"{report['requests']} requests in {report['elapsed_s']} s: {report['throughput_rps']} req/s")
+    print()
+    print(f"{'route':<22}{'requests':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route, stats in report["routes"].items():
+        print(
+            f"{route:<22}{stats['requests']:>9}{stats['errors']:>8}"
+            f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+        )
+    
+    https = report.get("https")
+    if https:
+        outcomes = ", ".join(f"{count} {outcome}" for outcome, count in https["outcomes"].items())
+        print()
+        print(f"HTTPS ({https['policy']}): {https['clients']} clients, {https['attempts']} attempts ({outcomes})")
+        print(
+            f"connection held p50 {https['hold_p50_ms']} ms, p95 {https['hold_p95_ms']} ms, "
+            f"max {https['hold_max_ms']} ms; peak portal workers {https['peak_workers']}"
+        )
+
+def check_baseline(report, baseline, tolerance):
+    """
+    Compare a report with the stored baseline
+    
+    Args:
+        report (dict): Results of this run
+        baseline (dict): Stored results
+        tolerance (float): Allowed slowdown as a fraction, e.g. 0.5 for 50%
+    
+    Returns:
+        list: Descriptions of every regression found
+    """
+    regressions = []
+    
+    if report["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        regressions.append(
+            f"throughput {report['throughput_rps']} req/s is below baseline {baseline['throughput_rps']} req/s"
+        )
+    
+    for route, expected in baseline["routes"].items():
+        actual = report["routes"].get(route)
+        if actual is None:
+            regressions.append(f"{route}: no requests recorded")
+            continue
+        if actual["errors"] > expected["errors"]:
+            regressions.append(f"{route}: {actual['errors']} errors, baseline {expected['errors']}")
+        for key in ("p95_ms", "p99_ms"):
+            # Ignore sub-millisecond noise on fast routes
+            limit = max(expected[key] * (1 + tolerance), expected[key] + 1.0)
+            if actual[key] > limit:
+                regressions.append(f"{route}: {key} {actual[key]} exceeds baseline {expected[key]}")
+    
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the captive portal on the fake backend")
+    parser.add_argument("--clients", type=int, default=20, help="simultaneous clients (default 20)")
+    parser.add_argument("--rounds", type=int, default=20, help="request sequences per client (default 20)")
+    parser.add_argument("--nmcli-latency", type=float, default=0.02, help="simulated seconds per nmcli call (default 0.02)")
+    parser.add_argument("--https-clients", type=int, default=0, help="additional clients attempting HTTPS (default 0)")
+    parser.add_argument(
+        "--https-policy", choices=("reject", "abort", "redirect"), default=config.HTTPS_POLICY,
+        help=f"how HTTPS attempts are handled (default {config.HTTPS_POLICY})"
+    )
+    parser.add_argument("--https-timeout", type=float, default=5.0, help="seconds an HTTPS client waits for the handshake (default 5)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--check-baseline", action="store_true", help="exit 1 if this run regressed against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown against the baseline (default 0.5)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep the portal's request logging")
+    args = parser.parse_args()
+    
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    
+    report = LoadTest(
+        args.clients, args.rounds, args.nmcli_latency,
+        https_clients=args.https_clients, https_policy=args.https_policy, https_timeout=args.https_timeout
+    ).run()
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline saved to {args.baseline}")
+    
+    if args.check_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = check_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+if __name__ == "__main__":
+    main()
@@ -1,401 +1,1185 @@
-#!/usr/bin/env python3
-# network_manager.py - Interface to NetworkManager for the JLBMaritime Captive Portal
-
-import subprocess
-import json
-import re
-import time
-import logging
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("/var/log/captive-portal.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger("network_manager")
-
-class NetworkManager:
-    """
-    Interface to NetworkManager for scanning networks and managing connections
-    """
-    
-    @staticmethod
-    def scan_networks():
-        """
-        Scan for available Wi-Fi networks
-        
-        Returns:
-            list: List of dictionaries containing network information
-        """
-        try:
-            logger.info("Scanning for Wi-Fi networks...")
-            # Run nmcli to scan for networks
-            cmd = ["nmcli", "-t", "-f", "SSID,SIGNAL,SECURITY", "device", "wifi", "list", "--rescan", "yes"]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            networks = []
-            for line in result.stdout.splitlines():
-                if not line.strip():
-                    continue
-                    
-                # Parse the output
-                parts = line.split(':')
-                if len(parts) >= 3:
-                    ssid = parts[0]
-                    
-                    # Skip empty SSIDs or the JLBMaritime AP itself
-                    if not ssid or ssid == "JLBMaritime":
-                        continue
-                        
-                    try:
-                        signal = int(parts[1])
-                    except ValueError:
-                        signal = 0
-                        
-                    # Parse security
-                    security_str = ':'.join(parts[2:])
-                    security = []
-                    
-                    if "WPA2" in security_str:
-                        security.append("WPA2")
-                    if "WPA1" in security_str:
-                        security.append("WPA")
-                    if "WEP" in security_str:
-                        security.append("WEP")
-                    
-                    networks.append({
-                        "ssid": ssid,
-                        "signal": signal,
-                        "security": security
-                    })
-            
-            # Remove duplicates (by SSID)
-            unique_networks = []
-            seen_ssids = set()
-            
-            for network in networks:
-                if network["ssid"] not in seen_ssids:
-                    seen_ssids.add(network["ssid"])
-                    unique_networks.append(network)
-            
-            logger.info(f"Found {len(unique_networks)} unique networks")
-            return unique_networks
-            
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error scanning networks: {e}")
-            logger.error(f"Error output: {e.stderr}")
-            return []
-        except Exception as e:
-            logger.error(f"Unexpected error scanning networks: {e}")
-            return []
-    
-    @staticmethod
-    def connect_to_network(ssid, password=None):
-        """
-        Connect to a Wi-Fi network
-        
-        Args:
-            ssid (str): The network SSID
-            password (str, optional): The network password
-            
-        Returns:
-            bool: True if connection was successful, False otherwise
-            str: Status message
-        """
-        try:
-            logger.info(f"Attempting to connect to network: {ssid}")
-            
-            # Check if connection already exists
-            cmd = ["nmcli", "-t", "-f", "NAME", "connection", "show"]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            connection_exists = False
-            for line in result.stdout.splitlines():
-                if line.strip() == ssid:
-                    connection_exists = True
-                    break
-            
-            if connection_exists:
-                # Modify existing connection
-                logger.info(f"Connection for {ssid} already exists, updating...")
-                if password:
-                    # Update the password for the existing connection
-                    cmd = ["nmcli", "connection", "modify", ssid, "wifi-sec.psk", password]
-                    subprocess.run(cmd, check=True)
-                
-                # Activate the connection
-                cmd = ["nmcli", "connection", "up", ssid]
-                subprocess.run(cmd, check=True)
-            else:
-                # Create a new connection
-                logger.info(f"Creating new connection for {ssid}")
-                if password:
-                    cmd = ["nmcli", "device", "wifi", "connect", ssid, "password", password]
-                else:
-                    cmd = ["nmcli", "device", "wifi", "connect", ssid]
-                
-                subprocess.run(cmd, check=True)
-            
-            # Verify connection
-            time.sleep(5)  # Give some time for connection to establish
-            
-            # Check if we're connected to the expected network
-            cmd = ["nmcli", "-t", "-f", "NAME,DEVICE,STATE", "connection", "show", "--active"]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            for line in result.stdout.splitlines():
-                parts = line.split(':')
-                if len(parts) >= 3 and parts[0] == ssid and parts[2] == "activated":
-                    logger.info(f"Successfully connected to {ssid}")
-                    
-                    # Get IP address
-                    cmd = ["nmcli", "-t", "-f", "IP4.ADDRESS", "connection", "show", ssid]
-                    ip_result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-                    
-                    ip_address = "Unknown"
-                    for ip_line in ip_result.stdout.splitlines():
-                        if ip_line.startswith("IP4.ADDRESS"):
-                            ip_match = re.search(r'\d+\.\d+\.\d+\.\d+', ip_line)
-                            if ip_match:
-                                ip_address = ip_match.group(0)
-                    
-                    # Get signal strength
-                    cmd = ["nmcli", "-t", "-f", "SIGNAL", "device", "wifi", "list", "ifname", parts[1], "ssid", ssid]
-                    signal_result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-                    
-                    signal_strength = 0
-                    for signal_line in signal_result.stdout.splitlines():
-                        try:
-                            signal_strength = int(signal_line.strip())
-                            break
-                        except ValueError:
-                            pass
-                    
-                    return True, {
-                        "message": f"Successfully connected to {ssid}",
-                        "ip_address": ip_address,
-                        "signal_strength": signal_strength
-                    }
-            
-            logger.error(f"Failed to verify connection to {ssid}")
-            return False, {"message": f"Failed to connect to {ssid}. Please try again."}
-            
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error connecting to network: {e}")
-            logger.error(f"Error output: {e.stderr}")
-            
-            error_message = "Failed to connect to network"
-            if "Secrets were required" in e.stderr:
-                error_message = "Invalid password. Please try again."
-            
-            return False, {"message": error_message}
-        except Exception as e:
-            logger.error(f"Unexpected error connecting to network: {e}")
-            return False, {"message": f"Unexpected error: {str(e)}"}
-    
-    @staticmethod
-    def get_active_connection():
-        """
-        Get information about the currently active Wi-Fi connection
-        
-        Returns:
-            dict: Connection information or None if not connected
-        """
-        try:
-            # Get active connections
-            cmd = ["nmcli", "-t", "-f", "NAME,TYPE,DEVICE,STATE", "connection", "show", "--active"]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            for line in result.stdout.splitlines():
-                parts = line.split(':')
-                if len(parts) >= 4 and parts[1] == "802-11-wireless" and parts[3] == "activated":
-                    ssid = parts[0]
-                    device = parts[2]
-                    
-                    # Get IP address
-                    cmd = ["nmcli", "-t", "-f", "IP4.ADDRESS", "connection", "show", ssid]
-                    ip_result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-                    
-                    ip_address = "Unknown"
-                    for ip_line in ip_result.stdout.splitlines():
-                        if ip_line.startswith("IP4.ADDRESS"):
-                            ip_match = re.search(r'\d+\.\d+\.\d+\.\d+', ip_line)
-                            if ip_match:
-                                ip_address = ip_match.group(0)
-                    
-                    # Get signal strength
-                    cmd = ["nmcli", "-t", "-f", "SIGNAL", "device", "wifi", "list", "ifname", device, "ssid", ssid]
-                    signal_result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-                    
-                    signal_strength = 0
-                    for signal_line in signal_result.stdout.splitlines():
-                        try:
-                            signal_strength = int(signal_line.strip())
-                            break
-                        except ValueError:
-                            pass
-                    
-                    return {
-                        "ssid": ssid,
-                        "ip_address": ip_address,
-                        "signal_strength": signal_strength,
-                        "device": device
-                    }
-            
-            return None
-            
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error getting active connection: {e}")
-            return None
-        except Exception as e:
-            logger.error(f"Unexpected error getting active connection: {e}")
-            return None
-    
-    @staticmethod
-    def setup_ap_mode():
-        """
-        Set up the device as an access point
-        
-        Returns:
-            bool: True if successful, False otherwise
-        """
-        try:
-            logger.info("Setting up Access Point mode")
-            
-            # Get the wireless interface name
-            cmd = ["ip", "-o", "link", "show"]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            wireless_iface = None
-            
-            for line in result.stdout.splitlines():
-                if "wlan" in line or "wlp" in line or "wls" in line:
-                    wireless_iface = line.split(":")[1].strip().split(" ")[0]
-                    logger.info(f"Found wireless interface: {wireless_iface}")
-                    break
-                    
-            if not wireless_iface:
-                logger.error("No wireless interface found")
-                return False
-                
-            # Check if JLBMaritime connection already exists
-            cmd = ["nmcli", "-t", "-f", "NAME", "connection", "show"]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            ap_exists = False
-            for line in result.stdout.splitlines():
-                if line.strip() == "JLBMaritime":
-                    ap_exists = True
-                    break
-            
-            # If connection exists but activation fails, delete and recreate it
-            if ap_exists:
-                logger.info("JLBMaritime AP connection already exists, activating it")
-                try:
-                    cmd = ["nmcli", "connection", "up", "JLBMaritime"]
-                    subprocess.run(cmd, capture_output=True, text=True, check=True)
-                    logger.info("Successfully activated JLBMaritime AP")
-                except subprocess.CalledProcessError as e:
-                    logger.warning(f"Failed to activate existing AP connection: {e}")
-                    logger.warning("Deleting and recreating the connection")
-                    
-                    # Delete the existing connection
-                    cmd = ["nmcli", "connection", "delete", "JLBMaritime"]
-                    subprocess.run(cmd, check=True)
-                    ap_exists = False
-            
-            if not ap_exists:
-                logger.info("Creating JLBMaritime AP connection")
-                
-                # Create a new AP connection with the detected interface
-                cmd = [
-                    "nmcli", "connection", "add",
-                    "type", "wifi",
-                    "ifname", wireless_iface,
-                    "con-name", "JLBMaritime",
-                    "autoconnect", "yes",
-                    "ssid", "JLBMaritime",
-                    "mode", "ap",
-                    "ipv4.method", "shared",
-                    "ipv4.addresses", "10.42.0.1/24",
-                    "wifi-sec.key-mgmt", "wpa-psk",
-                    "wifi-sec.psk", "Admin"
-                ]
-                subprocess.run(cmd, check=True)
-                
-                # Activate the connection
-                cmd = ["nmcli", "connection", "up", "JLBMaritime"]
-                subprocess.run(cmd, check=True)
-            
-            logger.info("Access Point mode setup completed")
-            return True
-            
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error setting up AP mode: {e}")
-            if e.stderr:
-                logger.error(f"Error output: {e.stderr}")
-            else:
-                logger.error(f"No error output available")
-                
-            # Additional diagnostics
-            try:
-                logger.info("Checking NetworkManager status...")
-                cmd = ["systemctl", "status", "NetworkManager"]
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                logger.info(f"NetworkManager status: {result.stdout}")
-                
-                logger.info("Checking available connections...")
-                cmd = ["nmcli", "connection", "show"]
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                logger.info(f"Available connections: {result.stdout}")
-            except Exception as diag_e:
-                logger.error(f"Error during diagnostics: {diag_e}")
-                
-            return False
-        except Exception as e:
-            logger.error(f"Unexpected error setting up AP mode: {e}")
-            return False
-    
-    @staticmethod
-    def check_connection_status():
-        """
-        Check if there's an active Wi-Fi connection to a network (not AP mode)
-        
-        Returns:
-            bool: True if connected to a Wi-Fi network, False otherwise
-        """
-        try:
-            # Get active connections
-            cmd = ["nmcli", "-t", "-f", "NAME,TYPE,DEVICE,STATE", "connection", "show", "--active"]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            for line in result.stdout.splitlines():
-                parts = line.split(':')
-                if len(parts) >= 4 and parts[1] == "802-11-wireless" and parts[3] == "activated":
-                    # If we're connected to something other than our AP
-                    if parts[0] != "JLBMaritime":
-                        return True
-            
-            return False
-            
-        except subprocess.CalledProcessError:
-            return False
-        except Exception as e:
-            logger.error(f"Unexpected error checking connection status: {e}")
-            return False
-
-# For testing
-if __name__ == "__main__":
-    networks = NetworkManager.scan_networks()
-    print(json.dumps(networks, indent=2))
-    
-    active = NetworkManager.get_active_connection()
-    if active:
-        print(f"Connected to: {active['ssid']}")
-        print(f"IP Address: {active['ip_address']}")
-        print(f"Signal Strength: {active['signal_strength']}%")
-    else:
-        print("Not connected to any network")
+#!/usr/bin/env python3
+# network_manager.py - Interface to NetworkManager for the JLBMaritime Captive Portal
+
+import asyncio
+import subprocess
+import json
+import os
+import re
+import threading
+import time
+import logging
+import config
+from nm_health import NetworkManagerHealth, NetworkManagerUnavailable
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("/var/log/captive-portal.log"),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger("network_manager")
+
+class CommandBackend:
+    """
+    Runs NetworkManager and interface commands on the host system
+    """
+    
+    def run(self, cmd, **kwargs):
+        """
+        Run a command
+        
+        Accepts the same arguments as subprocess.run.
+        
+        Returns:
+            subprocess.CompletedProcess: The result of the command
+        """
+        return subprocess.run(cmd, **kwargs)
+    
+    async def run_async(self, cmd, timeout=None):
+        """
+        Run a command without blocking the event loop
+        
+        The process is killed if the timeout expires or the calling task is
+        cancelled.
+        
+        Args:
+            cmd (list): Command and arguments
+            timeout (float, optional): Seconds to wait for the command
+            
+        Returns:
+            subprocess.CompletedProcess: The result, with text output
+        """
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        except asyncio.CancelledError:
+            proc.kill()
+            await proc.wait()
+            raise
+        
+        return subprocess.CompletedProcess(
+            cmd, proc.returncode,
+            stdout.decode(errors="replace"), stderr.decode(errors="replace")
+        )
+
+def split_terse(line):
+    """
+    Split a line of nmcli terse output into fields
+    
+    nmcli escapes ':' and '\\' inside values with a backslash.
+    
+    Args:
+        line (str): One line of `nmcli -t` output
+        
+    Returns:
+        list: The unescaped field values
+    """
+    fields = []
+    current = []
+    escaped = False
+    for char in line:
+        if escaped:
+            current.append(char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == ":":
+            fields.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    fields.append("".join(current))
+    return fields
+
+# Lists the active connections for NetworkManager.parse_active_wifi()
+ACTIVE_CONNECTIONS_CMD = ["nmcli", "-t", "-f", "UUID,NAME,TYPE,DEVICE,STATE", "connection", "show", "--active"]
+
+# Labels shown for each token of nmcli's SECURITY column
+SECURITY_TOKENS = (("WPA3", "WPA3"), ("WPA2", "WPA2"), ("WPA1", "WPA"), ("WEP", "WEP"))
+
+def security_labels(security):
+    """
+    Work out the security labels of a network from nmcli's SECURITY column
+    
+    Args:
+        security (str): e.g. "WPA1 WPA2" or "" for an open network
+        
+    Returns:
+        tuple: Labels such as ("WPA2", "WPA"); empty for an open network
+    """
+    return tuple(label for token, label in SECURITY_TOKENS if token in security)
+
+# nmcli SECURITY value -> labels, precomputed for the values nmcli commonly
+# reports and extended with any other value the first time it is seen
+SECURITY_LABELS = {
+    security: security_labels(security)
+    for security in (
+        "", "--", "WEP", "WPA1", "WPA2", "WPA1 WPA2", "WPA2 802.1X",
+        "WPA1 WPA2 802.1X", "WPA3", "WPA2 WPA3", "OWE",
+    )
+}
+
+def classify_security(security):
+    """
+    Look up the security labels of a network
+    
+    Args:
+        security (str): Value of nmcli's SECURITY column
+        
+    Returns:
+        tuple: Labels, shared between networks with the same value
+    """
+    labels = SECURITY_LABELS.get(security)
+    if labels is None:
+        labels = SECURITY_LABELS[security] = security_labels(security)
+    return labels
+
+class ScanEntry:
+    """
+    One network found by a scan
+    """
+    
+    __slots__ = ("ssid", "signal", "security")
+    
+    def __init__(self, ssid, signal, security):
+        self.ssid = ssid
+        self.signal = signal
+        # Tuple from classify_security(), shared between entries
+        self.security = security
+    
+    def __eq__(self, other):
+        return (
+            isinstance(other, ScanEntry) and self.ssid == other.ssid
+            and self.signal == other.signal and self.security == other.security
+        )
+    
+    def as_dict(self):
+        """
+        Returns:
+            dict: The network as returned by the /scan endpoint
+        """
+        return {"ssid": self.ssid, "signal": self.signal, "security": list(self.security)}
+
+class ProfileIndex:
+    """
+    In-memory index of the saved Wi-Fi connection profiles
+    
+    The index is built with one listing plus one query for the settings of
+    all Wi-Fi profiles, and then answers lookups by SSID, name or UUID without running nmcli. It is
+    rebuilt after the portal changes a profile, or when NetworkManager's
+    profile directory or timestamps file changes on disk, which is checked
+    with a stat() rather than a fork.
+    
+    If NetworkManager is unavailable before the profiles were ever loaded,
+    lookups raise NetworkManagerUnavailable: an empty index would read as
+    "nothing saved" and lead callers to recreate profiles that exist.
+    """
+    
+    # Files whose modification marks a change made outside this process
+    WATCHED_PATHS = [
+        "/etc/NetworkManager/system-connections",
+        "/var/lib/NetworkManager/timestamps",
+    ]
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.valid = False
+        self.signature = None
+        # Whether the profiles have been loaded at least once
+        self.loaded = False
+        
+        # UUID -> profile, name -> profile, SSID -> preferred client profile
+        self.by_uuid = {}
+        self.by_name = {}
+        self.by_ssid = {}
+    
+    def invalidate(self):
+        """
+        Mark the index as stale so the next lookup rebuilds it
+        """
+        self.valid = False
+    
+    def disk_signature(self):
+        """
+        Get the modification times of the watched paths
+        
+        Returns:
+            tuple: One entry per watched path, None for missing paths
+        """
+        signature = []
+        for path in ProfileIndex.WATCHED_PATHS:
+            try:
+                signature.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+    
+    def ensure(self):
+        """
+        Rebuild the index if it is stale
+        
+        Raises:
+            NetworkManagerUnavailable: If the profiles are unknown because
+                NetworkManager is down
+        """
+        signature = self.disk_signature()
+        if self.valid and signature == self.signature:
+            return
+        
+        with self.lock:
+            if self.valid and signature == self.signature:
+                return
+            self.rebuild()
+            self.signature = signature
+    
+    def rebuild(self):
+        """
+        Load every saved Wi-Fi profile from NetworkManager
+        """
+        by_uuid = {}
+        
+        try:
+            cmd = ["nmcli", "-t", "-f", "UUID,TYPE,TIMESTAMP,NAME", "connection", "show"]
+            result = NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+            
+            listed = []
+            for line in result.stdout.splitlines():
+                parts = split_terse(line)
+                if len(parts) >= 4 and parts[1] == "802-11-wireless":
+                    listed.append(parts[:4])
+            
+            # One query for the settings of every Wi-Fi profile rather than one each
+            settings = {}
+            if listed:
+                cmd = [
+                    "nmcli", "-g",
+                    "connection.uuid,802-11-wireless.ssid,802-11-wireless.mode,802-11-wireless-security.key-mgmt",
+                    "connection", "show"
+                ]
+                for uuid, _, _, _ in listed:
+                    cmd += ["uuid", uuid]
+                details = NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+                
+                # Each profile's values start with its UUID, one per line and
+                # escaped like terse output; blank lines may separate profiles
+                uuids = {uuid for uuid, _, _, _ in listed}
+                values = None
+                for line in details.stdout.split("\n"):
+                    if line in uuids and line not in settings:
+                        values = settings[line] = []
+                    elif values is not None and len(values) < 3:
+                        values.append(":".join(split_terse(line)))
+            
+            for uuid, _, timestamp, name in listed:
+                values = settings.get(uuid, [])
+                
+                try:
+                    last_used = int(timestamp)
+                except ValueError:
+                    last_used = 0
+                
+                by_uuid[uuid] = {
+                    "uuid": uuid,
+                    "name": name,
+                    # A profile without an SSID is looked up by its name
+                    "ssid": values[0] if values and values[0] else name,
+                    "mode": values[1] if len(values) > 1 and values[1] else "infrastructure",
+                    "security": values[2] if len(values) > 2 else "",
+                    "last_used": last_used,
+                }
+        
+        except (subprocess.CalledProcessError, OSError) as e:
+            logger.error(f"Error loading saved connections: {e}")
+            # Keep serving the previous contents and try again on the next lookup
+            self.valid = False
+            if not self.loaded and isinstance(e, subprocess.CalledProcessError) \
+                    and NetworkManagerHealth.is_outage(e.returncode):
+                raise NetworkManagerUnavailable(e.returncode, e.cmd, output=e.output, stderr=e.stderr)
+            return
+        
+        by_ssid = {}
+        for profile in by_uuid.values():
+            if profile["mode"] == "ap":
+                continue
+            # With duplicate profiles for one SSID, prefer the most recently used
+            current = by_ssid.get(profile["ssid"])
+            if current is None or profile["last_used"] > current["last_used"]:
+                by_ssid[profile["ssid"]] = profile
+        
+        self.by_uuid = by_uuid
+        self.by_name = {profile["name"]: profile for profile in by_uuid.values()}
+        self.by_ssid = by_ssid
+        self.valid = True
+        self.loaded = True
+        
+        logger.info(f"Indexed {len(by_uuid)} saved Wi-Fi profiles")
+    
+    def get(self, ssid):
+        """
+        Get the preferred client profile for an SSID
+        
+        Args:
+            ssid (str): Network SSID
+            
+        Returns:
+            dict: Profile with uuid, name, ssid, mode, security and last_used, or None
+        """
+        self.ensure()
+        return self.by_ssid.get(ssid)
+    
+    def get_by_uuid(self, uuid):
+        """
+        Get a profile by its connection UUID
+        
+        Args:
+            uuid (str): Connection UUID
+            
+        Returns:
+            dict: The profile, or None
+        """
+        self.ensure()
+        return self.by_uuid.get(uuid)
+    
+    def get_by_name(self, name):
+        """
+        Get a profile by its connection name
+        
+        Args:
+            name (str): Connection name
+            
+        Returns:
+            dict: The profile, or None
+        """
+        self.ensure()
+        return self.by_name.get(name)
+    
+    def client_profiles(self):
+        """
+        Get the saved client (non-AP) profiles, most recently used first
+        
+        Returns:
+            list: Profiles
+        """
+        self.ensure()
+        return sorted(self.by_ssid.values(), key=lambda profile: -profile["last_used"])
+
+class NetworkManager:
+    """
+    Interface to NetworkManager for scanning networks and managing connections
+    """
+    
+    # Saved Wi-Fi profiles, shared by everything in this process
+    profiles = ProfileIndex()
+    
+    # Availability of NetworkManager, shared by everything in this process
+    health = NetworkManagerHealth()
+    
+    # Per-thread time spent in commands, for request timing
+    command_timing = threading.local()
+    
+    # Backend used to execute commands; replaced by the fake backend in tests
+    backend = CommandBackend()
+    
+    # Interfaces chosen for the station and the AP in concurrent mode
+    interface_roles = None
+    
+    @staticmethod
+    def run(cmd, **kwargs):
+        """
+        Run a command through the active backend
+        
+        Accepts the same arguments as subprocess.run. While NetworkManager is
+        unavailable nmcli is not run and a "not running" result is returned
+        at once (or NetworkManagerUnavailable raised, with check=True).
+        
+        Only the "not running" exit status and a failure to start nmcli
+        count as NetworkManager being unavailable. A timeout does not: a
+        long activation can exceed it while NetworkManager is healthy.
+        
+        Returns:
+            subprocess.CompletedProcess: The result of the command
+        """
+        nmcli = bool(cmd) and cmd[0] == "nmcli"
+        if nmcli and not NetworkManager.health.allow():
+            return NetworkManager.health.reject(cmd, kwargs.get("check", False), kwargs.get("text", False))
+        
+        # None when the outcome says nothing about NetworkManager
+        ok = None
+        started = time.perf_counter()
+        try:
+            result = NetworkManager.backend.run(cmd, **kwargs)
+            ok = not NetworkManagerHealth.is_outage(result.returncode)
+            return result
+        except subprocess.CalledProcessError as e:
+            ok = not NetworkManagerHealth.is_outage(e.returncode)
+            raise
+        except OSError:
+            ok = False
+            raise
+        finally:
+            if nmcli and ok is None:
+                NetworkManager.health.release()
+            elif nmcli:
+                NetworkManager.health.record(ok)
+            timing = NetworkManager.command_timing
+            timing.seconds = getattr(timing, "seconds", 0.0) + time.perf_counter() - started
+            timing.count = getattr(timing, "count", 0) + 1
+    
+    @staticmethod
+    def reset_command_timing():
+        """
+        Start counting command time afresh for the calling thread
+        """
+        NetworkManager.command_timing.seconds = 0.0
+        NetworkManager.command_timing.count = 0
+    
+    @staticmethod
+    def get_command_timing():
+        """
+        Get the command time counted for the calling thread
+        
+        Returns:
+            tuple: (seconds spent in commands, number of commands)
+        """
+        timing = NetworkManager.command_timing
+        return getattr(timing, "seconds", 0.0), getattr(timing, "count", 0)
+    
+    @staticmethod
+    async def run_async(cmd, timeout=None, breaker=True):
+        """
+        Run a command through the active backend without blocking the event loop
+        
+        Args:
+            cmd (list): Command and arguments
+            timeout (float, optional): Seconds to wait for the command
+            breaker (bool): Go through the circuit breaker; startup readiness
+                probes pass False, since NetworkManager is expected to be
+                unavailable while it starts
+            
+        Returns:
+            subprocess.CompletedProcess: The result, with text output
+        """
+        nmcli = breaker and bool(cmd) and cmd[0] == "nmcli"
+        if nmcli and not NetworkManager.health.allow():
+            return NetworkManager.health.reject(cmd, text=True)
+        
+        # None when the outcome says nothing about NetworkManager, e.g. a
+        # timeout or cancellation by the caller
+        ok = None
+        try:
+            result = await NetworkManager.backend.run_async(cmd, timeout)
+            ok = not NetworkManagerHealth.is_outage(result.returncode)
+            return result
+        except OSError:
+            ok = False
+            raise
+        finally:
+            if nmcli and ok is None:
+                NetworkManager.health.release()
+            elif nmcli:
+                NetworkManager.health.record(ok)
+    
+    @staticmethod
+    def cached_result(key, error):
+        """
+        Get the last good result of a query that failed because NetworkManager is unavailable
+        
+        Args:
+            key (str): Cache key the query stores its results under
+            error (subprocess.CalledProcessError): The failure
+            
+        Returns:
+            The cached result, or None if the failure was not an outage or
+            nothing recent is cached
+        """
+        if not NetworkManagerHealth.is_outage(error.returncode):
+            return None
+        
+        cached = NetworkManager.health.cached(key)
+        if cached is not None:
+            logger.warning(f"NetworkManager unavailable, using the last known {key.replace('_', ' ')}")
+        return cached
+    
+    @staticmethod
+    def scan():
+        """
+        Scan for available Wi-Fi networks
+        
+        Each SSID appears once, with the signal of its strongest access
+        point, strongest network first.
+        
+        Returns:
+            list: ScanEntry records
+        """
+        try:
+            logger.info("Scanning for Wi-Fi networks...")
+            # Run nmcli to scan for networks
+            cmd = ["nmcli", "-t", "-f", "SSID,SIGNAL,SECURITY", "device", "wifi", "list", "--rescan", "yes"]
+            result = NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+            
+            # Merge and de-duplicate as the lines are read
+            strongest = {}
+            for line in result.stdout.splitlines():
+                # Most lines have no escaped ':' in the SSID and split directly
+                if "\\" in line:
+                    parts = split_terse(line)
+                else:
+                    parts = line.split(':')
+                if len(parts) < 3:
+                    continue
+                
+                ssid = parts[0]
+                # Skip empty SSIDs or the JLBMaritime AP itself
+                if not ssid or ssid == "JLBMaritime":
+                    continue
+                
+                try:
+                    signal = int(parts[1])
+                except ValueError:
+                    signal = 0
+                
+                entry = strongest.get(ssid)
+                if entry is None:
+                    strongest[ssid] = ScanEntry(ssid, signal, classify_security(parts[2]))
+                elif signal > entry.signal:
+                    entry.signal = signal
+                    entry.security = classify_security(parts[2])
+            
+            networks = sorted(strongest.values(), key=lambda entry: -entry.signal)
+            
+            logger.info(f"Found {len(networks)} unique networks")
+            NetworkManager.health.remember("scan", networks)
+            return networks
+            
+        except subprocess.CalledProcessError as e:
+            cached = NetworkManager.cached_result("scan", e)
+            if cached is not None:
+                return cached
+            logger.error(f"Error scanning networks: {e}")
+            logger.error(f"Error output: {e.stderr}")
+            return []
+        except Exception as e:
+            logger.error(f"Unexpected error scanning networks: {e}")
+            return []
+    
+    @staticmethod
+    def scan_networks():
+        """
+        Scan for available Wi-Fi networks
+        
+        Returns:
+            list: List of dictionaries containing network information
+        """
+        return [entry.as_dict() for entry in NetworkManager.scan()]
+    
+    @staticmethod
+    def connect_to_network(ssid, password=None):
+        """
+        Connect to a Wi-Fi network
+        
+        Args:
+            ssid (str): The network SSID
+            password (str, optional): The network password
+            
+        Returns:
+            bool: True if connection was successful, False otherwise
+            str: Status message
+        """
+        try:
+            logger.info(f"Attempting to connect to network: {ssid}")
+            
+            # In concurrent mode the station must not take over the AP interface
+            sta_iface = NetworkManager.get_station_interface()
+            
+            # Check if a profile for this SSID already exists
+            profile = NetworkManager.profiles.get(ssid)
+            
+            if profile:
+                # Modify existing connection
+                logger.info(f"Connection for {ssid} already exists ({profile['name']}), updating...")
+                if password:
+                    # Update the password for the existing connection
+                    cmd = ["nmcli", "connection", "modify", "uuid", profile["uuid"], "wifi-sec.psk", password]
+                    NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+                    NetworkManager.profiles.invalidate()
+                
+                # Activate the connection
+                cmd = ["nmcli", "connection", "up", "uuid", profile["uuid"]]
+                if sta_iface:
+                    cmd += ["ifname", sta_iface]
+                NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+            else:
+                # Create a new connection
+                logger.info(f"Creating new connection for {ssid}")
+                if password:
+                    cmd = ["nmcli", "device", "wifi", "connect", ssid, "password", password]
+                else:
+                    cmd = ["nmcli", "device", "wifi", "connect", ssid]
+                if sta_iface:
+                    cmd += ["ifname", sta_iface]
+                
+                try:
+                    NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+                finally:
+                    NetworkManager.profiles.invalidate()
+                profile = NetworkManager.profiles.get(ssid)
+            
+            # Verify connection
+            time.sleep(5)  # Give some time for connection to establish
+            
+            # Check if we're connected to the expected network
+            cmd = ["nmcli", "-t", "-f", "UUID,DEVICE,STATE,NAME", "connection", "show", "--active"]
+            result = NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+            
+            for line in result.stdout.splitlines():
+                parts = split_terse(line)
+                if len(parts) < 4 or parts[2] != "activated":
+                    continue
+                if (profile and parts[0] == profile["uuid"]) or (not profile and parts[3] == ssid):
+                    logger.info(f"Successfully connected to {ssid}")
+                    
+                    # Get IP address
+                    cmd = ["nmcli", "-t", "-f", "IP4.ADDRESS", "connection", "show", "uuid", parts[0]]
+                    ip_result = NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+                    
+                    ip_address = "Unknown"
+                    for ip_line in ip_result.stdout.splitlines():
+                        if ip_line.startswith("IP4.ADDRESS"):
+                            ip_match = re.search(r'\d+\.\d+\.\d+\.\d+', ip_line)
+                            if ip_match:
+                                ip_address = ip_match.group(0)
+                    
+                    # Get signal strength
+                    cmd = ["nmcli", "-t", "-f", "SIGNAL", "device", "wifi", "list", "ifname", parts[1], "ssid", ssid]
+                    signal_result = NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+                    
+                    signal_strength = 0
+                    for signal_line in signal_result.stdout.splitlines():
+                        try:
+                            signal_strength = int(signal_line.strip())
+                            break
+                        except ValueError:
+                            pass
+                    
+                    return True, {
+                        "message": f"Successfully connected to {ssid}",
+                        "ip_address": ip_address,
+                        "signal_strength": signal_strength
+                    }
+            
+            logger.error(f"Failed to verify connection to {ssid}")
+            return False, {"message": f"Failed to connect to {ssid}. Please try again."}
+            
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Error connecting to network: {e}")
+            logger.error(f"Error output: {e.stderr}")
+            
+            error_message = "Failed to connect to network"
+            if NetworkManagerHealth.is_outage(e.returncode):
+                error_message = "The network service is restarting. Please try again in a moment."
+            elif "Secrets were required" in e.stderr:
+                error_message = "Invalid password. Please try again."
+            
+            return False, {"message": error_message}
+        except Exception as e:
+            logger.error(f"Unexpected error connecting to network: {e}")
+            return False, {"message": f"Unexpected error: {str(e)}"}
+    
+    @staticmethod
+    def parse_active_wifi(output):
+        """
+        Find the activated Wi-Fi connections in a list of active connections
+        
+        Args:
+            output (str): Output of ACTIVE_CONNECTIONS_CMD
+            
+        Returns:
+            list: (profile, device) pairs. Profiles come from the profile
+                  index by UUID; one missing from it (e.g. created a moment
+                  ago) is described by its connection name.
+        
+        Raises:
+            NetworkManagerUnavailable: If NetworkManager is down and the
+                saved profiles are unknown
+        """
+        active = []
+        for line in output.splitlines():
+            parts = split_terse(line)
+            if len(parts) < 5 or parts[2] != "802-11-wireless" or parts[4] != "activated":
+                continue
+            
+            uuid, name, device = parts[0], parts[1], parts[3]
+            profile = NetworkManager.profiles.get_by_uuid(uuid)
+            if profile is None:
+                profile = {
+                    "uuid": uuid,
+                    "name": name,
+                    "ssid": name,
+                    "mode": "ap" if name == "JLBMaritime" else "infrastructure",
+                }
+            active.append((profile, device))
+        return active
+    
+    @staticmethod
+    def get_active_connection():
+        """
+        Get information about the currently active Wi-Fi connection
+        
+        Returns:
+            dict: Connection information or None if not connected
+        """
+        try:
+            # Get active connections
+            result = NetworkManager.run(ACTIVE_CONNECTIONS_CMD, capture_output=True, text=True, check=True)
+            
+            for profile, device in NetworkManager.parse_active_wifi(result.stdout):
+                # Skip our own AP, which is also active in concurrent mode
+                if profile["mode"] == "ap":
+                    continue
+                
+                ssid = profile["ssid"]
+                
+                # Get IP address
+                cmd = ["nmcli", "-t", "-f", "IP4.ADDRESS", "connection", "show", "uuid", profile["uuid"]]
+                ip_result = NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+                
+                ip_address = "Unknown"
+                for ip_line in ip_result.stdout.splitlines():
+                    if ip_line.startswith("IP4.ADDRESS"):
+                        ip_match = re.search(r'\d+\.\d+\.\d+\.\d+', ip_line)
+                        if ip_match:
+                            ip_address = ip_match.group(0)
+                
+                # Get signal strength
+                cmd = ["nmcli", "-t", "-f", "SIGNAL", "device", "wifi", "list", "ifname", device, "ssid", ssid]
+                signal_result = NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+                
+                signal_strength = 0
+                for signal_line in signal_result.stdout.splitlines():
+                    try:
+                        signal_strength = int(signal_line.strip())
+                        break
+                    except ValueError:
+                        pass
+                
+                active = {
+                    "ssid": ssid,
+                    "ip_address": ip_address,
+                    "signal_strength": signal_strength,
+                    "device": device
+                }
+                NetworkManager.health.remember("active_connection", active)
+                return active
+            
+            NetworkManager.health.remember("active_connection", None)
+            return None
+            
+        except subprocess.CalledProcessError as e:
+            if NetworkManagerHealth.is_outage(e.returncode):
+                return NetworkManager.cached_result("active_connection", e)
+            logger.error(f"Error getting active connection: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Unexpected error getting active connection: {e}")
+            return None
+    
+    @staticmethod
+    def get_wireless_interfaces():
+        """
+        Get the physical wireless interfaces of the device
+        
+        Returns:
+            list: Interface names in the order reported by the kernel
+        """
+        cmd = ["ip", "-o", "link", "show"]
+        result = NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+        
+        interfaces = []
+        for line in result.stdout.splitlines():
+            parts = line.split(":")
+            if len(parts) < 2:
+                continue
+            name = parts[1].strip().split(" ")[0].split("@")[0]
+            if name == config.AP_VIRTUAL_INTERFACE:
+                continue
+            if name.startswith("wlan") or name.startswith("wlp") or name.startswith("wls"):
+                interfaces.append(name)
+        
+        return interfaces
+    
+    @staticmethod
+    def get_phy(interface):
+        """
+        Get the wiphy name backing a wireless interface
+        
+        Args:
+            interface (str): Interface name
+            
+        Returns:
+            str: The phy name (e.g. phy0), or None if unknown
+        """
+        try:
+            result = NetworkManager.run(["iw", "dev"], capture_output=True, text=True, check=True)
+        except (subprocess.CalledProcessError, OSError):
+            return None
+        
+        phy = None
+        for line in result.stdout.splitlines():
+            line = line.strip()
+            if line.startswith("phy#"):
+                phy = "phy" + line[4:]
+            elif line == f"Interface {interface}":
+                return phy
+        
+        return None
+    
+    @staticmethod
+    def supports_concurrent_ap(interface):
+        """
+        Check whether the radio behind an interface can run an AP and a station at once
+        
+        Args:
+            interface (str): Interface name
+            
+        Returns:
+            bool: True if a managed + AP interface combination is supported
+        """
+        phy = NetworkManager.get_phy(interface)
+        if not phy:
+            return False
+        
+        try:
+            cmd = ["iw", "phy", phy, "info"]
+            result = NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+        except (subprocess.CalledProcessError, OSError):
+            return False
+        
+        # Interface combinations span several lines; join them before matching
+        combinations = []
+        in_combinations = False
+        for line in result.stdout.splitlines():
+            stripped = line.strip()
+            if stripped.startswith("valid interface combinations"):
+                in_combinations = True
+            elif in_combinations and stripped.startswith("*"):
+                combinations.append(stripped)
+            elif in_combinations and combinations and line.startswith("\t\t "):
+                combinations[-1] += " " + stripped
+            elif in_combinations:
+                in_combinations = False
+        
+        for combination in combinations:
+            # Managed and AP must be separate groups so both can exist together
+            groups = re.findall(r'#\{([^}]*)\}', combination)
+            managed = any("managed" in g and "AP" not in g for g in groups)
+            ap = any("AP" in g.replace("P2P", "") and "managed" not in g for g in groups)
+            total = re.search(r'total <= (\d+)', combination)
+            if managed and ap and (not total or int(total.group(1)) >= 2):
+                return True
+        
+        return False
+    
+    @staticmethod
+    def select_interface_roles():
+        """
+        Choose the station and AP interfaces for concurrent mode
+        
+        A second radio is used for the AP when one is present. Otherwise a
+        virtual AP interface is created on the single radio if its driver
+        supports running an AP alongside a station.
+        
+        Returns:
+            dict: {"sta": interface, "ap": interface}, or None if concurrent
+                  operation is not possible on this hardware
+        """
+        try:
+            interfaces = NetworkManager.get_wireless_interfaces()
+        except (subprocess.CalledProcessError, OSError) as e:
+            logger.error(f"Error listing wireless interfaces: {e}")
+            return None
+        
+        if not interfaces:
+            logger.error("No wireless interface found")
+            return None
+        
+        sta_iface = interfaces[0]
+        
+        if len(interfaces) >= 2:
+            roles = {"sta": sta_iface, "ap": interfaces[1]}
+        elif NetworkManager.supports_concurrent_ap(sta_iface):
+            ap_iface = config.AP_VIRTUAL_INTERFACE
+            
+            cmd = ["ip", "-o", "link", "show", ap_iface]
+            if NetworkManager.run(cmd, capture_output=True, text=True).returncode != 0:
+                logger.info(f"Creating virtual AP interface {ap_iface} on {sta_iface}")
+                try:
+                    cmd = ["iw", "dev", sta_iface, "interface", "add", ap_iface, "type", "__ap"]
+                    NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+                except subprocess.CalledProcessError as e:
+                    logger.error(f"Error creating virtual AP interface: {e}")
+                    if e.stderr:
+                        logger.error(f"Error output: {e.stderr}")
+                    return None
+            
+            roles = {"sta": sta_iface, "ap": ap_iface}
+        else:
+            logger.warning(f"{sta_iface} does not support a concurrent AP and station")
+            return None
+        
+        logger.info(f"Interface roles: station on {roles['sta']}, access point on {roles['ap']}")
+        NetworkManager.interface_roles = roles
+        return roles
+    
+    @staticmethod
+    def get_station_interface():
+        """
+        Get the interface station connections should be bound to
+        
+        Returns:
+            str: Interface name in concurrent mode, None otherwise
+        """
+        if not config.CONCURRENT_MODE:
+            return None
+        
+        if NetworkManager.interface_roles is None:
+            NetworkManager.select_interface_roles()
+        
+        roles = NetworkManager.interface_roles
+        return roles["sta"] if roles else None
+    
+    @staticmethod
+    def setup_concurrent_mode():
+        """
+        Bring up the JLBMaritime AP alongside the station connection
+        
+        Falls back to the single-interface AP mode when the hardware cannot
+        run both at once, but only while the station is disconnected: that
+        AP would take over the station interface and drop the link.
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        logger.info("Setting up concurrent AP + station mode")
+        
+        roles = NetworkManager.select_interface_roles()
+        if not roles:
+            if NetworkManager.check_connection_status():
+                logger.warning("Concurrent mode unavailable, keeping the station connection without the AP")
+                return False
+            logger.warning("Concurrent mode unavailable, falling back to single-interface AP mode")
+            return NetworkManager.setup_ap_mode()
+        
+        return NetworkManager.setup_ap_mode(interface=roles["ap"])
+    
+    @staticmethod
+    def get_ap_interface():
+        """
+        Get the interface the JLBMaritime AP runs on
+        
+        Returns:
+            str: Interface name
+        """
+        roles = NetworkManager.interface_roles
+        if config.CONCURRENT_MODE and roles:
+            return roles["ap"]
+        
+        try:
+            interfaces = NetworkManager.get_wireless_interfaces()
+        except (subprocess.CalledProcessError, OSError):
+            interfaces = []
+        
+        return interfaces[0] if interfaces else "wlan0"
+    
+    @staticmethod
+    def is_ap_active():
+        """
+        Check whether the JLBMaritime AP connection is active
+        
+        Returns:
+            bool: True if the AP is up, False otherwise
+        """
+        try:
+            result = NetworkManager.run(ACTIVE_CONNECTIONS_CMD, capture_output=True, text=True, check=True)
+            
+            for profile, _ in NetworkManager.parse_active_wifi(result.stdout):
+                if profile["mode"] == "ap":
+                    NetworkManager.health.remember("ap_active", True)
+                    return True
+            
+            NetworkManager.health.remember("ap_active", False)
+            return False
+            
+        except subprocess.CalledProcessError as e:
+            return bool(NetworkManager.cached_result("ap_active", e))
+        except Exception as e:
+            logger.error(f"Unexpected error checking AP status: {e}")
+            return False
+    
+    @staticmethod
+    def setup_ap_mode(interface=None):
+        """
+        Set up the device as an access point
+        
+        Args:
+            interface (str, optional): Interface to run the AP on; defaults to
+                the first wireless interface
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            logger.info("Setting up Access Point mode")
+            
+            # Get the wireless interface name
+            wireless_iface = interface
+            if not wireless_iface:
+                interfaces = NetworkManager.get_wireless_interfaces()
+                if interfaces:
+                    wireless_iface = interfaces[0]
+                    logger.info(f"Found wireless interface: {wireless_iface}")
+                    
+            if not wireless_iface:
+                logger.error("No wireless interface found")
+                return False
+                
+            # Check if JLBMaritime connection already exists; this raises
+            # rather than answering "no" while NetworkManager is unavailable
+            ap_exists = NetworkManager.profiles.get_by_name("JLBMaritime") is not None
+            
+            # If connection exists but activation fails, delete and recreate it
+            if ap_exists:
+                logger.info("JLBMaritime AP connection already exists, activating it")
+                try:
+                    # Make sure the profile is bound to the chosen interface
+                    cmd = ["nmcli", "connection", "modify", "JLBMaritime", "connection.interface-name", wireless_iface]
+                    NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+                    
+                    cmd = ["nmcli", "connection", "up", "JLBMaritime"]
+                    NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+                    logger.info("Successfully activated JLBMaritime AP")
+                except subprocess.CalledProcessError as e:
+                    if NetworkManagerHealth.is_outage(e.returncode):
+                        # The profile is not at fault; NetworkManager is not answering
+                        raise
+                    logger.warning(f"Failed to activate existing AP connection: {e}")
+                    logger.warning("Deleting and recreating the connection")
+                    
+                    # Delete the existing connection
+                    cmd = ["nmcli", "connection", "delete", "JLBMaritime"]
+                    NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+                    NetworkManager.profiles.invalidate()
+                    ap_exists = False
+            
+            if not ap_exists:
+                logger.info("Creating JLBMaritime AP connection")
+                
+                # Create a new AP connection with the detected interface
+                cmd = [
+                    "nmcli", "connection", "add",
+                    "type", "wifi",
+                    "ifname", wireless_iface,
+                    "con-name", "JLBMaritime",
+                    "autoconnect", "yes",
+                    "ssid", "JLBMaritime",
+                    "mode", "ap",
+                    "ipv4.method", "shared",
+                    "ipv4.addresses", "10.42.0.1/24",
+                    "wifi-sec.key-mgmt", "wpa-psk",
+                    "wifi-sec.psk", "Admin"
+                ]
+                NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+                NetworkManager.profiles.invalidate()
+                
+                # Activate the connection
+                cmd = ["nmcli", "connection", "up", "JLBMaritime"]
+                NetworkManager.run(cmd, capture_output=True, text=True, check=True)
+            
+            logger.info("Access Point mode setup completed")
+            return True
+            
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Error setting up AP mode: {e}")
+            if e.stderr:
+                logger.error(f"Error output: {e.stderr}")
+            else:
+                logger.error(f"No error output available")
+                
+            # Additional diagnostics, which are slow and repeat themselves
+            # while NetworkManager stays down
+            if not NetworkManager.health.diagnostics_due():
+                logger.info("Skipping diagnostics, they ran recently")
+                return False
+            
+            try:
+                logger.info("Checking NetworkManager status...")
+                cmd = ["systemctl", "status", "NetworkManager"]
+                result = NetworkManager.run(cmd, capture_output=True, text=True)
+                logger.info(f"NetworkManager status: {result.stdout}")
+                
+                logger.info("Checking available connections...")
+                cmd = ["nmcli", "connection", "show"]
+                result = NetworkManager.run(cmd, capture_output=True, text=True)
+                logger.info(f"Available connections: {result.stdout}")
+            except Exception as diag_e:
+                logger.error(f"Error during diagnostics: {diag_e}")
+                
+            return False
+        except Exception as e:
+            logger.error(f"Unexpected error setting up AP mode: {e}")
+            return False
+    
+    @staticmethod
+    def check_connection_status():
+        """
+        Check if there's an active Wi-Fi connection to a network (not AP mode)
+        
+        Returns:
+            bool: True if connected to a Wi-Fi network, False otherwise
+        """
+        try:
+            # Get active connections
+            result = NetworkManager.run(ACTIVE_CONNECTIONS_CMD, capture_output=True, text=True, check=True)
+            
+            for profile, _ in NetworkManager.parse_active_wifi(result.stdout):
+                # If we're connected to something other than our AP
+                if profile["mode"] != "ap":
+                    NetworkManager.health.remember("connected", True)
+                    return True
+            
+            NetworkManager.health.remember("connected", False)
+            return False
+            
+        except subprocess.CalledProcessError as e:
+            return bool(NetworkManager.cached_result("connected", e))
+        except Exception as e:
+            logger.error(f"Unexpected error checking connection status: {e}")
+            return False
+
+# Use the simulated system when no real hardware is available
+if config.FAKE_BACKEND:
+    from fake_backend import FakeBackend
+    logger.warning("Using the fake NetworkManager backend")
+    NetworkManager.backend = FakeBackend()
+
+# For testing
+if __name__ == "__main__":
+    networks = NetworkManager.scan_networks()
+    print(json.dumps(networks, indent=2))
+    
+    active = NetworkManager.get_active_connection()
+    if active:
+        print(f"Connected to: {active['ssid']}")
+        print(f"IP Address: {active['ip_address']}")
+        print(f"Signal Strength: {active['signal_strength']}%")
+    else:
+        print("Not connected to any network")
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# nm_health.py - Track NetworkManager availability and stop hammering it while it is down
+#
+# Every nmcli command reports to a circuit breaker:
+#
+#   closed     -> commands run normally
+#   open       -> NetworkManager is down; nmcli is not run at all and callers
+#                 get an immediate "not running" result, or cached data
+#   half_open  -> the recovery delay has passed; one command is let through
+#                 as a probe, closing the circuit if it succeeds and reopening
+#                 it with a longer delay if it fails
+
+import logging
+import subprocess
+import threading
+import time
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("/var/log/captive-portal.log"),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger("nm_health")
+
+# Circuit states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# nmcli exit code for "NetworkManager is not running"
+NMCLI_NOT_RUNNING = 8
+
+# Consecutive failed nmcli commands that open the circuit
+FAILURE_THRESHOLD = 3
+
+# Seconds before the first recovery probe, doubled after each failed probe up to the cap
+RECOVERY_DELAY = 5
+MAX_RECOVERY_DELAY = 60
+
+# Results older than this many seconds are not served from the cache
+CACHE_MAX_AGE = 600
+
+# Minimum seconds between two runs of the failure diagnostics
+DIAGNOSTICS_INTERVAL = 300
+
+class NetworkManagerUnavailable(subprocess.CalledProcessError):
+    """
+    Raised in place of running nmcli while the circuit is open
+    
+    It is a CalledProcessError with nmcli's "not running" exit code, so
+    existing error handling treats it like the real failure.
+    """
+
+class NetworkManagerHealth:
+    """
+    Circuit breaker and result cache shared by all NetworkManager commands in a process
+    """
+    
+    def __init__(self, threshold=FAILURE_THRESHOLD, recovery_delay=RECOVERY_DELAY,
+                 max_recovery_delay=MAX_RECOVERY_DELAY):
+        """
+        Args:
+            threshold (int): Consecutive failures that open the circuit
+            recovery_delay (float): Seconds before the first recovery probe
+            max_recovery_delay (float): Cap on the delay between probes
+        """
+        self.threshold = threshold
+        self.initial_delay = recovery_delay
+        self.max_delay = max_recovery_delay
+        self.lock = threading.Lock()
+        
+        self.state = CLOSED
+        self.failures = 0
+        self.delay = recovery_delay
+        self.opened_at = None
+        self.retry_at = 0.0
+        self.probing = False
+        self.last_diagnostics = None
+        
+        # Key -> (monotonic time stored, value)
+        self.cache = {}
+        
+        # Counter for metrics
+        self.rejected = 0
+    
+    @staticmethod
+    def is_outage(returncode):
+        """
+        Check whether an nmcli exit code means NetworkManager itself is unavailable
+        """
+        return returncode == NMCLI_NOT_RUNNING
+    
+    def allow(self):
+        """
+        Decide whether an nmcli command may run
+        
+        Returns:
+            bool: True if the command should run, False to fail it fast
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            
+            if self.state == OPEN and not self.probing and time.monotonic() >= self.retry_at:
+                self.state = HALF_OPEN
+                self.probing = True
+                logger.info("Probing whether NetworkManager has recovered")
+                return True
+            
+            self.rejected += 1
+            return False
+    
+    def record(self, ok):
+        """
+        Record the outcome of an nmcli command that was allowed to run
+        
+        Args:
+            ok (bool): False if NetworkManager was unavailable or did not answer
+        """
+        with self.lock:
+            if ok:
+                if self.state != CLOSED:
+                    logger.info(f"NetworkManager is available again after {time.monotonic() - self.opened_at:.0f}s")
+                self.state = CLOSED
+                self.failures = 0
+                self.delay = self.initial_delay
+                self.opened_at = None
+                self.probing = False
+                return
+            
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self.delay = min(self.delay * 2, self.max_delay)
+                self.open()
+            elif self.state == CLOSED and self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self.open()
+                logger.warning(f"NetworkManager unavailable after {self.failures} failed commands, "
+                               f"failing nmcli commands fast")
+    
+    def release(self):
+        """
+        Give up on a command that was allowed to run without learning anything,
+        e.g. because it was cancelled, so another command can probe instead
+        """
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+                self.probing = False
+    
+    def open(self):
+        """
+        Open the circuit until the next recovery probe; called with the lock held
+        """
+        self.state = OPEN
+        self.probing = False
+        self.retry_at = time.monotonic() + self.delay
+    
+    def reject(self, cmd, check=False, text=False):
+        """
+        Build the result of an nmcli command that was not run
+        
+        Args:
+            cmd (list): The command
+            check (bool): Raise like subprocess.run(check=True) would
+            text (bool): Return text rather than bytes
+        
+        Returns:
+            subprocess.CompletedProcess: A "not running" result
+        
+        Raises:
+            NetworkManagerUnavailable: If check is set
+        """
+        stdout = "" if text else b""
+        stderr = "Error: NetworkManager is unavailable (circuit open).\n"
+        if not text:
+            stderr = stderr.encode()
+        
+        if check:
+            raise NetworkManagerUnavailable(NMCLI_NOT_RUNNING, cmd, output=stdout, stderr=stderr)
+        return subprocess.CompletedProcess(cmd, NMCLI_NOT_RUNNING, stdout, stderr)
+    
+    def remember(self, key, value):
+        """
+        Cache the latest good result of a query
+        """
+        self.cache[key] = (time.monotonic(), value)
+    
+    def cached(self, key, max_age=CACHE_MAX_AGE):
+        """
+        Get a cached result to serve while NetworkManager is unavailable
+        
+        Returns:
+            The cached value, or None if there is none recent enough
+        """
+        entry = self.cache.get(key)
+        if entry is None or time.monotonic() - entry[0] > max_age:
+            return None
+        return entry[1]
+    
+    def diagnostics_due(self):
+        """
+        Check whether the failure diagnostics may run, and note that they do
+        
+        Returns:
+            bool: True if they last ran more than DIAGNOSTICS_INTERVAL ago
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.last_diagnostics is not None and now - self.last_diagnostics < DIAGNOSTICS_INTERVAL:
+                return False
+            self.last_diagnostics = now
+            return True
+    
+    def status(self):
+        """
+        Describe the circuit
+        
+        Returns:
+            dict: State, consecutive failures, seconds until the next probe
+            and the number of commands failed fast
+        """
+        with self.lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "retry_in": max(0.0, round(self.retry_at - time.monotonic(), 1)) if self.state == OPEN else None,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# profiling.py - On-demand profiling for the portal and the connection monitor
+#
+# Two capture modes are available:
+#
+#   cprofile  - deterministic profile, written as a pstats file
+#               (python3 -m pstats <file>, or snakeviz)
+#   sampling  - stacks of every thread sampled at a fixed interval, written
+#               in the collapsed format read by flamegraph.pl and speedscope
+#
+# The portal is controlled through its admin endpoints. The monitor runs in
+# a separate process, so the portal asks it to start and stop by writing and
+# removing a request file in the profile directory, which the monitor polls.
+
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("/var/log/captive-portal.log"),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger("profiling")
+
+# Where dumps and monitor requests are kept; shared by both services
+PROFILE_DIR = "/var/lib/captive-portal/profiles"
+
+# Capture modes
+CPROFILE = "cprofile"
+SAMPLING = "sampling"
+MODES = (CPROFILE, SAMPLING)
+
+# Time between stack samples in sampling mode
+SAMPLE_INTERVAL = 0.005
+
+# Number of dumps kept; older ones are deleted
+MAX_DUMPS = 20
+
+# File extension of the dumps written by each mode
+DUMP_EXTENSIONS = {CPROFILE: ".prof", SAMPLING: ".collapsed"}
+
+class SamplingProfiler:
+    """
+    Periodically records the stack of every thread
+    
+    Stacks are counted in collapsed form, one "frame;frame;frame" key per
+    distinct stack, root first.
+    """
+    
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.thread = None
+        self.stop_event = threading.Event()
+    
+    def start(self):
+        self.stacks = {}
+        self.samples = 0
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="profiler-sampler", daemon=True)
+        self.thread.start()
+    
+    def run(self):
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+    
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+    
+    def write(self, path):
+        """
+        Write the collapsed stacks, one "stack count" line each
+        """
+        with open(path, "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+class Profiler:
+    """
+    Captures a profile of one process and writes it to the profile directory
+    """
+    
+    def __init__(self, name, directory=PROFILE_DIR):
+        """
+        Args:
+            name (str): Process name used in dump file names, e.g. "portal"
+            directory (str): Where dumps are written
+        """
+        self.name = name
+        self.directory = directory
+        
+        # Active capture mode, or None
+        self.mode = None
+        self.started = None
+        self.cprofile = None
+        self.sampler = None
+        
+        # cProfile cannot follow several threads at once, so one request at
+        # a time is profiled; held while that request runs
+        self.request_lock = threading.Lock()
+    
+    def start(self, mode, enable=False):
+        """
+        Start a capture
+        
+        Args:
+            mode (str): CPROFILE or SAMPLING
+            enable (bool): For CPROFILE, profile the calling thread from now
+                on instead of only the sections wrapped by begin()/end()
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if mode not in MODES:
+            logger.warning(f"Unknown profiling mode {mode}")
+            return False
+        if self.mode is not None:
+            logger.warning(f"Profiling of {self.name} already running ({self.mode})")
+            return False
+        
+        if mode == CPROFILE:
+            self.cprofile = cProfile.Profile()
+            if enable:
+                self.cprofile.enable()
+        else:
+            self.sampler = SamplingProfiler()
+            self.sampler.start()
+        
+        self.mode = mode
+        self.started = time.time()
+        logger.info(f"Started {mode} profiling of {self.name}")
+        return True
+    
+    def stop(self):
+        """
+        Stop the capture and write its dump
+        
+        Returns:
+            str: Path of the dump, or None if nothing was running or it could not be written
+        """
+        if self.mode is None:
+            return None
+        
+        mode = self.mode
+        with self.request_lock:
+            self.mode = None
+            if mode == CPROFILE:
+                self.cprofile.disable()
+            else:
+                self.sampler.stop()
+        
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        path = os.path.join(self.directory, f"{self.name}-{mode}-{stamp}{DUMP_EXTENSIONS[mode]}")
+        
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if mode == CPROFILE:
+                self.cprofile.dump_stats(path)
+            else:
+                self.sampler.write(path)
+        except OSError as e:
+            logger.error(f"Could not write profile {path}: {e}")
+            return None
+        finally:
+            self.cprofile = None
+            self.sampler = None
+        
+        logger.info(f"Stopped {mode} profiling of {self.name} after {time.time() - self.started:.0f}s, wrote {path}")
+        Profiler.prune(self.directory)
+        return path
+    
+    def begin(self):
+        """
+        Start profiling a section of work, e.g. one request
+        
+        A section that starts while another is being profiled runs without
+        profiling rather than waiting for it, so a slow request under the
+        profiler does not hold up the others.
+        
+        Returns:
+            bool: True if the section is being profiled and end() must be called
+        """
+        if self.mode != CPROFILE:
+            return False
+        
+        if not self.request_lock.acquire(blocking=False):
+            return False
+        if self.mode != CPROFILE:
+            # Stopped meanwhile
+            self.request_lock.release()
+            return False
+        
+        self.cprofile.enable()
+        return True
+    
+    def end(self):
+        """
+        Finish a section started with begin()
+        """
+        self.cprofile.disable()
+        self.request_lock.release()
+    
+    def status(self):
+        """
+        Describe the running capture
+        
+        Returns:
+            dict: Mode and start time, or an empty mode if idle
+        """
+        return {"mode": self.mode, "started": self.started if self.mode else None}
+    
+    # ------------------------------------------------------------------
+    # Requests to profile the monitor process
+    # ------------------------------------------------------------------
+    
+    @staticmethod
+    def request_path(name, directory=PROFILE_DIR):
+        return os.path.join(directory, f"{name}.request")
+    
+    @staticmethod
+    def request_capture(name, mode, directory=PROFILE_DIR):
+        """
+        Ask another process to start profiling
+        
+        Args:
+            name (str): Name of the process, e.g. "monitor"
+            mode (str): CPROFILE or SAMPLING; None asks it to stop
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        path = Profiler.request_path(name, directory)
+        try:
+            if mode is None:
+                if os.path.exists(path):
+                    os.remove(path)
+            else:
+                os.makedirs(directory, exist_ok=True)
+                with open(path, "w") as f:
+                    f.write(mode)
+            return True
+        except OSError as e:
+            logger.error(f"Could not update profiling request {path}: {e}")
+            return False
+    
+    def poll_request(self):
+        """
+        Start or stop profiling this process as requested by request_capture()
+        """
+        try:
+            with open(Profiler.request_path(self.name, self.directory)) as f:
+                requested = f.read().strip()
+        except OSError:
+            requested = None
+        
+        if requested and self.mode is None:
+            self.start(requested, enable=True)
+        elif not requested and self.mode is not None:
+            self.stop()
+    
+    # ------------------------------------------------------------------
+    # Dumps
+    # ------------------------------------------------------------------
+    
+    @staticmethod
+    def list_dumps(directory=PROFILE_DIR):
+        """
+        List the dumps in the profile directory
+        
+        Returns:
+            list: Dicts with name, size and modified time, newest first
+        """
+        dumps = []
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return []
+        
+        for name in names:
+            if not name.endswith(tuple(DUMP_EXTENSIONS.values())):
+                continue
+            try:
+                st = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue
+            dumps.append({"name": name, "size": st.st_size, "modified": st.st_mtime})
+        
+        return sorted(dumps, key=lambda dump: -dump["modified"])
+    
+    @staticmethod
+    def prune(directory=PROFILE_DIR):
+        """
+        Delete all but the newest MAX_DUMPS dumps
+        """
+        for dump in Profiler.list_dumps(directory)[MAX_DUMPS:]:
+            try:
+                os.remove(os.path.join(directory, dump["name"]))
+            except OSError:
+                pass
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+# radio_queue.py - Serialize the operations that change the Wi-Fi radio
+#
+# Connecting to a network and switching to AP mode reconfigure the same
+# radio, and they are requested from two places: the portal, when a user
+# connects through the web page, and the connection monitor, when it retries
+# saved networks or falls back to AP mode. All of them go through one queue,
+# which runs a single operation at a time:
+#
+#   - operations requested by a user run before background ones
+#   - a user operation cancels the pending background ones, and background
+#     operations are refused while a user operation is pending and for a
+#     short time after it, because they were decided on a link state the
+#     user is changing
+#   - an operation identical to one already pending joins it instead of
+#     running twice
+#
+# The queue lives in the connection monitor. The portal reaches it through a
+# Unix socket (RadioServer and RadioClient), or directly when it hosts the
+# monitor in single-process mode.
+
+import asyncio
+import concurrent.futures
+import grp
+import heapq
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import config
+from network_manager import NetworkManager
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("/var/log/captive-portal.log"),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger("radio_queue")
+
+# Operation priorities; lower runs first
+USER = 0
+BACKGROUND = 1
+
+# Seconds after a user operation during which background operations are refused
+USER_GRACE = 15
+
+# Seconds the portal waits for a connect sent to the monitor, including time
+# spent queued behind a background operation
+CLIENT_TIMEOUT = 180
+
+# Largest request or response accepted over the socket
+MAX_MESSAGE_SIZE = 65536
+
+class OperationSuperseded(Exception):
+    """
+    Raised for a background operation dropped in favour of a user operation
+    """
+
+class Operation:
+    """
+    One queued radio operation
+    """
+    
+    def __init__(self, name, func, args, key, priority):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.key = key
+        self.priority = priority
+        self.future = concurrent.futures.Future()
+        self.started = None
+
+class RadioQueue:
+    """
+    Runs radio-changing operations one at a time on a worker thread
+    """
+    
+    def __init__(self, user_grace=USER_GRACE):
+        """
+        Args:
+            user_grace (float): Seconds after a user operation during which
+                background operations are refused
+        """
+        self.user_grace = user_grace
+        self.cond = threading.Condition()
+        self.thread = None
+        self.stopping = False
+        
+        # Heap of (priority, sequence, Operation) and the pending operations by key
+        self.pending = []
+        self.by_key = {}
+        self.sequence = 0
+        
+        # Operation being run, or None
+        self.current = None
+        
+        # User operations pending or running, and when the last one finished
+        self.user_active = 0
+        self.user_finished = None
+        
+        # Counters for metrics
+        self.completed = 0
+        self.coalesced = 0
+        self.superseded = 0
+    
+    def start(self):
+        """
+        Start the worker thread
+        """
+        if self.thread is not None:
+            return
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run, name="radio-queue", daemon=True)
+        self.thread.start()
+    
+    def stop(self, timeout=5):
+        """
+        Cancel the pending operations and stop the worker thread
+        
+        Args:
+            timeout (float): Seconds to wait for a running operation to finish
+        """
+        if self.thread is None:
+            return
+        
+        with self.cond:
+            self.stopping = True
+            for _, _, op in self.pending:
+                op.future.cancel()
+            self.pending = []
+            self.by_key = {}
+            self.cond.notify()
+        
+        self.thread.join(timeout)
+        self.thread = None
+    
+    def user_busy(self):
+        """
+        Check whether a user operation is pending, running or just finished;
+        called with the lock held
+        """
+        if self.user_active:
+            return True
+        return self.user_finished is not None and time.monotonic() - self.user_finished < self.user_grace
+    
+    def submit(self, name, func, *args, key=None, priority=BACKGROUND):
+        """
+        Queue an operation
+        
+        Args:
+            name (str): Description for log messages
+            func (callable): Blocking function that performs the operation
+            *args: Arguments for func
+            key (hashable, optional): Identity of the operation; a pending
+                operation with the same key is joined instead of queueing another
+            priority (int): USER or BACKGROUND
+        
+        Returns:
+            concurrent.futures.Future: Resolves to func's return value, or
+            fails with OperationSuperseded if a user operation displaced it
+        """
+        with self.cond:
+            if key is not None and key in self.by_key:
+                self.coalesced += 1
+                logger.info(f"{name} is already queued, joining it")
+                return self.by_key[key].future
+            
+            if priority == BACKGROUND and self.user_busy():
+                self.superseded += 1
+                future = concurrent.futures.Future()
+                future.set_exception(OperationSuperseded(f"{name} deferred to a user request"))
+                return future
+            
+            if priority == USER:
+                self.cancel_background()
+                self.user_active += 1
+            
+            op = Operation(name, func, args, key, priority)
+            heapq.heappush(self.pending, (priority, self.sequence, op))
+            self.sequence += 1
+            if key is not None:
+                self.by_key[key] = op
+            self.cond.notify()
+        
+        return op.future
+    
+    def cancel_background(self):
+        """
+        Drop the pending background operations; called with the lock held
+        """
+        kept = []
+        for entry in self.pending:
+            op = entry[2]
+            if op.priority != BACKGROUND:
+                kept.append(entry)
+                continue
+            
+            logger.info(f"Dropping queued {op.name} for a user request")
+            if not op.future.cancelled():
+                op.future.set_exception(OperationSuperseded(f"{op.name} superseded by a user request"))
+            self.by_key.pop(op.key, None)
+            self.superseded += 1
+        
+        heapq.heapify(kept)
+        self.pending = kept
+    
+    def run(self):
+        """
+        Worker thread: run queued operations in priority order
+        """
+        while True:
+            with self.cond:
+                while not self.pending and not self.stopping:
+                    self.cond.wait()
+                if self.stopping:
+                    return
+                
+                _, _, op = heapq.heappop(self.pending)
+                if op.key is not None and self.by_key.get(op.key) is op:
+                    del self.by_key[op.key]
+                op.started = time.monotonic()
+                self.current = op
+            
+            try:
+                if op.future.set_running_or_notify_cancel():
+                    try:
+                        result = op.func(*op.args)
+                    except Exception as e:
+                        op.future.set_exception(e)
+                    else:
+                        op.future.set_result(result)
+                    logger.info(f"Finished {op.name} in {time.monotonic() - op.started:.1f}s")
+            finally:
+                with self.cond:
+                    self.current = None
+                    self.completed += 1
+                    if op.priority == USER:
+                        self.user_active -= 1
+                        self.user_finished = time.monotonic()
+    
+    def running(self):
+        """
+        Describe the operation being run
+        
+        Returns:
+            tuple: (name, seconds running), or None if idle
+        """
+        op = self.current
+        if op is None:
+            return None
+        return op.name, time.monotonic() - op.started
+    
+    def connect(self, ssid, password=None):
+        """
+        Queue a user's request to connect to a network
+        
+        Returns:
+            concurrent.futures.Future: Resolves to the (success, result)
+            pair of NetworkManager.connect_to_network()
+        """
+        return self.submit(
+            f"connect to {ssid}", NetworkManager.connect_to_network, ssid, password,
+            key=("connect", ssid, password), priority=USER
+        )
+
+class RadioServer:
+    """
+    Accepts radio operations from the portal over a Unix socket
+    
+    Each request is one line of JSON, answered with one line of JSON:
+    
+        {"op": "connect", "ssid": ..., "password": ...}
+        -> {"success": ..., "result": {...}}
+    """
+    
+    def __init__(self, queue, path=None, on_user_done=None, group=None):
+        """
+        Args:
+            queue (RadioQueue): Queue the operations are submitted to
+            path (str, optional): Socket path; defaults to config.RADIO_SOCKET
+            on_user_done (callable, optional): Called after each user operation
+            group (str, optional): Group allowed to connect besides root;
+                defaults to config.RADIO_GROUP
+        """
+        self.queue = queue
+        self.path = path or config.RADIO_SOCKET
+        self.group = group or config.RADIO_GROUP
+        self.on_user_done = on_user_done
+        self.server = None
+    
+    async def start(self):
+        """
+        Start listening
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.server = await asyncio.start_unix_server(self.handle, self.path, limit=MAX_MESSAGE_SIZE)
+            # The portal runs as a different user, with the radio group
+            os.chmod(self.path, 0o660)
+            try:
+                os.chown(self.path, -1, grp.getgrnam(self.group).gr_gid)
+            except KeyError:
+                logger.warning(f"Group {self.group} does not exist, only root can use {self.path}")
+        except OSError as e:
+            logger.error(f"Could not listen on {self.path}: {e}")
+            return False
+        
+        logger.info(f"Accepting radio operations on {self.path}")
+        return True
+    
+    async def handle(self, reader, writer):
+        """
+        Serve one request
+        """
+        try:
+            request = json.loads(await reader.readline())
+            
+            if request.get("op") == "connect" and request.get("ssid"):
+                future = self.queue.connect(request["ssid"], request.get("password") or None)
+                try:
+                    success, result = await asyncio.wrap_future(future)
+                finally:
+                    if self.on_user_done:
+                        self.on_user_done()
+                response = {"success": success, "result": result}
+            else:
+                response = {"success": False, "result": {"message": "Unknown radio operation"}}
+        
+        except (ValueError, AttributeError) as e:
+            response = {"success": False, "result": {"message": f"Invalid request: {e}"}}
+        except asyncio.CancelledError:
+            writer.close()
+            raise
+        except Exception as e:
+            logger.error(f"Error running radio operation: {e}")
+            response = {"success": False, "result": {"message": f"Unexpected error: {str(e)}"}}
+        
+        try:
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+        except OSError:
+            # The portal gave up waiting
+            pass
+        finally:
+            writer.close()
+    
+    def stop(self):
+        """
+        Stop listening and remove the socket
+        """
+        if self.server is None:
+            return
+        self.server.close()
+        self.server = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+class RadioClient:
+    """
+    Sends radio operations from the portal to the connection monitor
+    """
+    
+    @staticmethod
+    def request(message, path=None, timeout=CLIENT_TIMEOUT):
+        """
+        Send one request to the monitor and wait for the answer
+        
+        Args:
+            message (dict): Request
+            path (str, optional): Socket path; defaults to config.RADIO_SOCKET
+            timeout (float): Seconds to wait for the answer
+        
+        Returns:
+            dict: The response, or None if the monitor could not be reached
+        
+        Raises:
+            OSError: If the monitor took the request but did not answer in time
+        """
+        path = path or config.RADIO_SOCKET
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            try:
+                sock.connect(path)
+            except OSError as e:
+                logger.warning(f"Could not reach the connection monitor at {path}: {e}")
+                return None
+            
+            sock.sendall(json.dumps(message).encode() + b"\n")
+            
+            data = b""
+            while not data.endswith(b"\n") and len(data) < MAX_MESSAGE_SIZE:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+        finally:
+            sock.close()
+        
+        try:
+            return json.loads(data)
+        except ValueError:
+            raise OSError("connection monitor sent an invalid response")
+    
+    @staticmethod
+    def connect(ssid, password=None):
+        """
+        Ask the monitor to connect to a network
+        
+        Returns:
+            tuple: (success, result) as from NetworkManager.connect_to_network(),
+            or None if the monitor could not be reached
+        """
+        try:
+            response = RadioClient.request({"op": "connect", "ssid": ssid, "password": password})
+        except OSError as e:
+            # The monitor may still be connecting, so connecting here as well would race it
+            logger.error(f"No answer from the connection monitor: {e}")
+            return False, {"message": "Timed out waiting for the connection. Please try again."}
+        
+        if response is None:
+            return None
+        return bool(response.get("success")), response.get("result") or {}
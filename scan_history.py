@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# scan_history.py - Versioned scan results for incremental /scan responses
+
+import json
+import os
+import threading
+
+# Number of past scan versions kept for computing deltas
+HISTORY_SIZE = 16
+
+def encode(value):
+    """
+    Serialize a response body as compact JSON
+    
+    Returns:
+        bytes: UTF-8 JSON
+    """
+    return json.dumps(value, separators=(",", ":")).encode()
+
+class ScanHistory:
+    """
+    Numbers each distinct scan result and computes what changed between them
+    
+    A new version is only created when a scan differs from the previous one,
+    so clients that already have the current version can be answered with
+    304 Not Modified. Clients with an older version that is still in the
+    history get only the networks that were added, changed or removed.
+    
+    Response bodies are serialized once per version and then reused byte for
+    byte for every client asking for the same thing.
+    
+    Versions are numbered from 1 in each process, so clients see them as
+    "<epoch>-<number>" with a random epoch per process. A version from before
+    a restart is then unknown, rather than mistaken for an unrelated scan.
+    Version 0, the empty list, is "0" in every process.
+    """
+    
+    def __init__(self, size=HISTORY_SIZE):
+        """
+        Args:
+            size (int): Number of past versions kept
+        """
+        self.size = size
+        self.epoch = os.urandom(4).hex()
+        self.lock = threading.Lock()
+        self.version = 0
+        # Version -> (networks strongest first, {ssid: network})
+        self.snapshots = {0: ([], {})}
+        # Serialized bodies of the current version, by kind
+        self.bodies = {}
+    
+    def update(self, networks):
+        """
+        Record the result of a scan
+        
+        Args:
+            networks (list): ScanEntry records from NetworkManager.scan()
+        
+        Returns:
+            int: The version describing this result
+        """
+        with self.lock:
+            if networks == self.snapshots[self.version][0]:
+                return self.version
+            
+            self.version += 1
+            self.snapshots[self.version] = (networks, {network.ssid: network for network in networks})
+            self.snapshots.pop(self.version - self.size, None)
+            self.bodies = {}
+            return self.version
+    
+    def tag(self, version):
+        """
+        Get the name clients know a version by
+        
+        Args:
+            version (int): Version
+        
+        Returns:
+            str: "<epoch>-<version>", or "0" for version 0
+        """
+        return f"{self.epoch}-{version}" if version else "0"
+    
+    def parse_tag(self, value):
+        """
+        Get the version a client names, e.g. in ?since=
+        
+        Returns:
+            int: The version; -1 if it is from another process or malformed,
+            so it matches no known version; None if no version was given
+        """
+        if not value:
+            return None
+        if value == "0":
+            return 0
+        epoch, _, number = value.partition("-")
+        if epoch != self.epoch or not number.isdigit():
+            return -1
+        return int(number)
+    
+    def etag(self, version=None):
+        """
+        Get the ETag of a version
+        
+        Args:
+            version (int, optional): Version; defaults to the current one
+        
+        Returns:
+            str: Quoted ETag value
+        """
+        return f'"scan-{self.tag(self.version if version is None else version)}"'
+    
+    def parse_etag(self, value):
+        """
+        Get the version named by an If-None-Match header
+        
+        Returns:
+            int: The version as from parse_tag(), or None if the header is
+            not one of our ETags
+        """
+        value = (value or "").strip()
+        if value.startswith("W/"):
+            value = value[2:]
+        value = value.strip('"')
+        if not value.startswith("scan-"):
+            return None
+        return self.parse_tag(value[5:])
+    
+    def cached_body(self, kind, build):
+        """
+        Get a serialized body of the current version, building it only once
+        
+        Args:
+            kind (hashable): What the body describes
+            build (callable): Given the version, its networks and its
+                networks by SSID, returns the value to serialize
+        
+        Returns:
+            tuple: (version, body bytes)
+        """
+        with self.lock:
+            version = self.version
+            networks, by_ssid = self.snapshots[version]
+            body = self.bodies.get(kind)
+        if body is not None:
+            return version, body
+        
+        body = encode(build(version, networks, by_ssid))
+        with self.lock:
+            # Only keep it if no newer scan arrived meanwhile
+            if self.version == version:
+                self.bodies[kind] = body
+        return version, body
+    
+    def list_body(self):
+        """
+        Get the plain list of networks, strongest first
+        
+        Returns:
+            tuple: (version, body bytes)
+        """
+        return self.cached_body("list", lambda version, networks, by_ssid: [
+            network.as_dict() for network in networks
+        ])
+    
+    def full_body(self):
+        """
+        Get the versioned list of networks, for a client whose version is unknown
+        
+        Returns:
+            tuple: (version, body bytes)
+        """
+        return self.cached_body("full", lambda version, networks, by_ssid: {
+            "version": self.tag(version),
+            "full": True,
+            "networks": [network.as_dict() for network in networks],
+        })
+    
+    def delta_body(self, since):
+        """
+        Describe how the current result differs from an earlier version
+        
+        The body holds "version" (as from tag()), network dicts in "added"
+        and "changed" (strongest first) and SSIDs in "removed".
+        
+        Args:
+            since (int): Version the client has, as from parse_tag()
+        
+        Returns:
+            tuple: (version, body bytes), or None if the version is no
+            longer known and the full list must be sent
+        """
+        with self.lock:
+            old = self.snapshots.get(since)
+        if old is None:
+            return None
+        old = old[1]
+        
+        def build(version, networks, by_ssid):
+            return {
+                "version": self.tag(version),
+                "added": [network.as_dict() for network in networks if network.ssid not in old],
+                "changed": [
+                    network.as_dict() for network in networks
+                    if network.ssid in old and old[network.ssid] != network
+                ],
+                "removed": [ssid for ssid in old if ssid not in by_ssid],
+            }
+        
+        return self.cached_body(("delta", since), build)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# sd_notify.py - systemd readiness and watchdog notifications
+#
+# Implements the sd_notify protocol directly so no extra package is needed:
+# each notification is a datagram sent to the socket named by $NOTIFY_SOCKET.
+# When the service is not started by systemd every call does nothing.
+
+import logging
+import os
+import socket
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("/var/log/captive-portal.log"),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger("sd_notify")
+
+class SystemdNotifier:
+    """
+    Sends service state notifications to systemd
+    """
+    
+    @staticmethod
+    def notify(state):
+        """
+        Send a notification to systemd
+        
+        Args:
+            state (str): Newline-separated assignments, e.g. "READY=1"
+        
+        Returns:
+            bool: True if the notification was sent, False otherwise
+        """
+        address = os.environ.get("NOTIFY_SOCKET")
+        if not address:
+            return False
+        
+        # A leading '@' names a socket in the abstract namespace
+        if address.startswith("@"):
+            address = "\0" + address[1:]
+        
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+                sock.connect(address)
+                sock.sendall(state.encode())
+            return True
+        except OSError as e:
+            logger.warning(f"Could not notify systemd: {e}")
+            return False
+    
+    @staticmethod
+    def ready(status=None):
+        """
+        Tell systemd the service has finished starting up
+        
+        Args:
+            status (str, optional): Status text shown by systemctl status
+        """
+        state = "READY=1"
+        if status:
+            state += f"\nSTATUS={status}"
+        SystemdNotifier.notify(state)
+    
+    @staticmethod
+    def status(status):
+        """
+        Update the status text shown by systemctl status
+        
+        Args:
+            status (str): Status text
+        """
+        SystemdNotifier.notify(f"STATUS={status}")
+    
+    @staticmethod
+    def watchdog():
+        """
+        Send a watchdog keepalive
+        """
+        SystemdNotifier.notify("WATCHDOG=1")
+    
+    @staticmethod
+    def stopping():
+        """
+        Tell systemd the service is shutting down
+        """
+        SystemdNotifier.notify("STOPPING=1")
+    
+    @staticmethod
+    def watchdog_interval():
+        """
+        Get how often watchdog keepalives should be sent
+        
+        Returns:
+            float: Half the service's WatchdogSec in seconds, or None if the
+            watchdog is not enabled for this process
+        """
+        usec = os.environ.get("WATCHDOG_USEC")
+        pid = os.environ.get("WATCHDOG_PID")
+        if not usec or (pid and pid != str(os.getpid())):
+            return None
+        
+        try:
+            return int(usec) / 1e6 / 2
+        except ValueError:
+            return None
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# tls_abort.py - Abort HTTPS connections redirected to the captive portal
+#
+# The portal only speaks plain HTTP, so an HTTPS connection redirected to it
+# can never complete. With the "abort" HTTPS policy, port 443 on the access
+# point is redirected here instead of to Flask: every connection is accepted
+# and closed at once with a TCP reset, so the client gives up on the TLS
+# handshake immediately and no portal worker is tied up.
+
+import logging
+import socket
+import struct
+import threading
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("/var/log/captive-portal.log"),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger("tls_abort")
+
+# SO_LINGER with a zero timeout: close() sends RST instead of FIN
+LINGER_RESET = struct.pack("ii", 1, 0)
+
+# Pending connections the kernel queues while the listener catches up
+LISTEN_BACKLOG = 128
+
+class TLSAbortListener:
+    """
+    Listener that resets every connection as soon as it is accepted
+    """
+    
+    def __init__(self, host="0.0.0.0", port=5443):
+        """
+        Args:
+            host (str): Address to listen on
+            port (int): Port to listen on
+        """
+        self.host = host
+        self.port = port
+        self.sock = None
+        self.thread = None
+        
+        # Counter for metrics
+        self.aborted = 0
+    
+    def start(self):
+        """
+        Start accepting connections on a background thread
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if self.thread is not None:
+            return True
+        
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((self.host, self.port))
+            sock.listen(LISTEN_BACKLOG)
+        except OSError as e:
+            logger.error(f"Could not start HTTPS abort listener on {self.host}:{self.port}: {e}")
+            return False
+        
+        self.sock = sock
+        # With port 0 the system picks one
+        self.port = sock.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve, name="tls-abort", daemon=True)
+        self.thread.start()
+        
+        logger.info(f"Aborting HTTPS connections on {self.host}:{self.port}")
+        return True
+    
+    def serve(self):
+        """
+        Accept and reset connections until the listener is stopped
+        """
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                # The listening socket was closed by stop()
+                return
+            
+            try:
+                conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_RESET)
+            except OSError:
+                pass
+            conn.close()
+            self.aborted += 1
+    
+    def stop(self):
+        """
+        Stop accepting connections
+        """
+        if self.thread is None:
+            return
+        
+        # shutdown() wakes the thread blocked in accept()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.thread.join()
+        self.thread = None
+        logger.info("HTTPS abort listener stopped")